@@ -99,6 +99,7 @@ LOCAL_APPS = [
     "uzum.sku",
     "uzum.payment",
     "uzum.referral",
+    "uzum.crawler",
 ]
 # https://docs.djangoproject.com/en/dev/ref/settings/#installed-apps
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
@@ -267,6 +268,17 @@ LOGGING = {
     "root": {"level": "INFO", "handlers": ["console"]},
 }
 
+# Crawler
+# ------------------------------------------------------------------------------
+# Redis shared by all crawler processes for the global rate limiter, limits are per process without it.
+# Kept apart from REDIS_URL so the global limiter is only on where it is configured
+CRAWLER_REDIS_URL = env("CRAWLER_REDIS_URL", default=None)
+# port on which crawling processes serve Prometheus metrics at /metrics, disabled if not set.
+# Every process of a prefork celery worker serves on this port plus its pool index (0 to concurrency - 1)
+CRAWLER_METRICS_PORT = env.int("CRAWLER_METRICS_PORT", default=None)
+# send the daily reports to all users once the nightly analytics are done
+CRAWLER_SEND_REPORTS = env.bool("CRAWLER_SEND_REPORTS", default=False)
+
 # Celery
 # ------------------------------------------------------------------------------
 if USE_TZ:
@@ -368,6 +380,16 @@ CELERY_BEAT_SCHEDULE = {
         "schedule": crontab(minute=0, hour=5, day_of_week="*"),
         "args": (),
     },
+    "update_product_reviews": {
+        "task": "update_product_reviews",
+        "schedule": crontab(minute=0, hour=8, day_of_week="*"),
+        "args": (),
+    },
+    "replay_dead_letters": {
+        "task": "replay_dead_letters",
+        "schedule": crontab(minute=30, hour=10, day_of_week="*"),
+        "args": (),
+    },
     # "update_trials": {
     #     "task": "update_user_trials",
     #     "schedule": crontab(minute=0, hour=6, day_of_week="*"),
@@ -6,7 +6,6 @@ import traceback
 import httpx
 import requests
 from asgiref.sync import async_to_sync
-from django.db import transaction
 
 from uzum.category.models import CategoryAnalytics
 from uzum.jobs.category.MultiEntry import \
@@ -19,6 +18,7 @@ from uzum.jobs.product.fetch_details import (
     concurrent_requests_product_details, get_product_details_via_ids)
 from uzum.jobs.product.fetch_ids import get_all_product_ids_from_uzum
 from uzum.jobs.product.MultiEntry import create_products_from_api
+from uzum.jobs.product.pipeline import ingest_products
 from uzum.product.models import ProductAnalytics
 from uzum.shop.models import ShopAnalytics
 from uzum.utils.general import get_today_pretty
@@ -109,8 +109,6 @@ def fetch_product_ids(date_pretty: str = get_today_pretty(), product_ids: list[i
     print(f"Unfetched products: {len(unfetched_product_ids)}")
     shop_analytics_done = {}
 
-    BATCH_SIZE = 10_000
-
     category_sales_map = {
         analytics.category.categoryId: {
             "products_with_sales": set(),
@@ -119,19 +117,7 @@ def fetch_product_ids(date_pretty: str = get_today_pretty(), product_ids: list[i
         for analytics in CategoryAnalytics.objects.filter(date_pretty=date_pretty).prefetch_related("category")
     }
 
-    for i in range(0, len(unfetched_product_ids), BATCH_SIZE):
-        products_api: list[dict] = []
-        print(
-            f"Processing batch {i // BATCH_SIZE + 1}/{(len(unfetched_product_ids) + BATCH_SIZE - 1) // BATCH_SIZE}..."
-        )
-        async_to_sync(get_product_details_via_ids)(unfetched_product_ids[i : i + BATCH_SIZE], products_api)
-
-        # Wrap database interaction in a transaction
-        with transaction.atomic():
-            create_products_from_api(products_api, {}, shop_analytics_done, category_sales_map)
-
-        # time.sleep(0)
-        del products_api
+    ingest_products(unfetched_product_ids, shop_analytics_done, category_sales_map)
 
 def fetch_single_product(product_id):
     try:
@@ -1,3 +1,4 @@
+import time
 import uuid
 from collections import defaultdict
 from datetime import datetime
@@ -83,17 +84,91 @@ class Category(models.Model):
         update ancestors for all categories
         """
         try:
-            categories = Category.objects.all()
-            print("Total categories: ", len(categories))
-            for category in categories:
-                ancestors = category.generate_ancestors_string()
-                ancestors_ru = category.generate_ancestors_string("ru")  # generate Russian ancestors
-                category.ancestors = ancestors
-                category.ancestors_ru = ancestors_ru  # update Russian ancestors
-                category.save()
+            Category.rebuild_tree()
         except Exception as e:
             print("Error in update_ancestors_bulk: ", e)
 
+    @staticmethod
+    def rebuild_tree(parent_ids: dict = None) -> int:
+        """
+        Set parent, ancestors, ancestors_ru and descendants of all categories in one pass over the tree
+        held in memory, and write the changed ones with a single bulk_update.
+        `parent_ids` maps categoryIds to their parent's id (None for a root), e.g. from the category tree
+        of the marketplace; categories missing from it keep their current parent.
+        Returns the number of categories updated.
+        """
+        start = time.time()
+        categories = {
+            category.categoryId: category
+            for category in Category.objects.only(
+                "categoryId", "title", "title_ru", "parent_id", "descendants", "ancestors", "ancestors_ru"
+            )
+        }
+        parents = {category_id: category.parent_id for category_id, category in categories.items()}
+        for category_id, parent_id in (parent_ids or {}).items():
+            if category_id not in categories or category_id == parent_id:
+                continue
+            parents[category_id] = parent_id if parent_id in categories else None
+
+        children = defaultdict(list)
+        for category_id, parent_id in parents.items():
+            if parent_id is not None:
+                children[parent_id].append(category_id)
+
+        # ancestors are passed down from the roots, descendants are collected on the way back up
+        paths = {}
+        descendants = {}
+        visited = set()
+        roots = [category_id for category_id, parent_id in parents.items() if parent_id is None]
+        for root in roots:
+            stack = [(root, False)]
+            while stack:
+                category_id, leaving = stack.pop()
+                if leaving:
+                    collected = []
+                    for child in children[category_id]:
+                        collected.append(str(child))
+                        collected.extend(descendants.get(child, []))
+                    descendants[category_id] = collected
+                    continue
+                visited.add(category_id)
+                parent_id = parents[category_id]
+                if parent_id is None:
+                    paths[category_id] = ([], [])
+                else:
+                    parent = categories[parent_id]
+                    ancestors, ancestors_ru = paths[parent_id]
+                    paths[category_id] = (
+                        ancestors + [f"{parent.title}:{parent_id}"],
+                        ancestors_ru + [f"{parent.title_ru or parent.title}:{parent_id}"],
+                    )
+                stack.append((category_id, True))
+                for child in reversed(children[category_id]):
+                    if child not in visited:
+                        stack.append((child, False))
+
+        if len(visited) < len(categories):
+            # only categories on a cycle are never reached from a root
+            print(f"rebuild_tree: {len(categories) - len(visited)} categories are on a parent cycle, left as they are")
+
+        changed = []
+        for category_id in visited:
+            category = categories[category_id]
+            ancestors, ancestors_ru = paths[category_id]
+            values = (
+                parents[category_id],
+                "/".join(ancestors),
+                "/".join(ancestors_ru),
+                ",".join(descendants.get(category_id, [])),
+            )
+            if values != (category.parent_id, category.ancestors, category.ancestors_ru, category.descendants):
+                category.parent_id, category.ancestors, category.ancestors_ru, category.descendants = values
+                changed.append(category)
+
+        Category.objects.bulk_update(changed, ["parent", "ancestors", "ancestors_ru", "descendants"], batch_size=1000)
+        print(f"rebuild_tree: {len(changed)}/{len(categories)} categories updated in {time.time() - start:.2f} secs")
+        return len(changed)
+
     def __str__(self):
         return self.title + " " + str(self.categoryId)
 
@@ -127,17 +202,7 @@ class Category(models.Model):
         """
         Updates descendants field of all categories.
         """
-        # select categories only if it has analytics at today
-        categories = Category.objects.filter(categoryanalytics__date_pretty=get_today_pretty()).prefetch_related(
-            "child_categories"
-        )
-        print("Total categories: ", len(categories))
-        i = 0
-        for category in categories:
-            # print(i)
-            i += 1
-            Category.update_descendants_rec(category)
-
+        Category.rebuild_tree()
         return None
 
     def update_descendants_bulk():
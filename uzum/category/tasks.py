@@ -6,6 +6,7 @@ from datetime import datetime
 
 import pytz
 from asgiref.sync import async_to_sync
+from django.conf import settings
 
 from config import celery_app
 from uzum.category.analytics import update_analytics
@@ -22,8 +23,18 @@ from uzum.category.tree import (update_category_tree,
                                 update_category_tree_with_data,
                                 update_category_tree_with_monthly_data,
                                 update_category_tree_with_weekly_data)
-from uzum.category.utils import (update_all_category_parents,
+from uzum.category.utils import (get_category_sales_map,
+                                 update_all_category_parents,
                                  update_category_with_sales, vacuum_table)
+from uzum.crawler.deadletter import drop_dead_products
+from uzum.crawler.frontier import (claim_pending_product_ids,
+                                   count_unfinished, dump_checkpoint,
+                                   finish_run, load_checkpoint,
+                                   save_checkpoint, seed_frontier,
+                                   start_or_resume_run)
+from uzum.crawler.models import CrawlRun
+from uzum.crawler.schedule import fill_skipped_products, load_refresh_plan
+from uzum.crawler.tasks import dispatch_product_chunks
 from uzum.jobs.campaign.main import update_or_create_campaigns
 from uzum.jobs.category.main import create_and_update_categories
 from uzum.jobs.category.MultiEntry import \
@@ -33,6 +44,7 @@ from uzum.jobs.constants import MAX_ID_COUNT, PAGE_SIZE
 from uzum.jobs.product.fetch_details import get_product_details_via_ids
 from uzum.jobs.product.fetch_ids import get_all_product_ids_from_uzum
 from uzum.jobs.product.MultiEntry import create_products_from_api
+from uzum.jobs.product.russian import enrich_russian_titles
 from uzum.product.models import create_product_latestanalytics
 from uzum.review.models import PopularSeaches
 from uzum.users.tasks import send_reports_to_all
@@ -43,6 +55,11 @@ from uzum.utils.general import get_day_before_pretty, get_today_pretty
     name="update_uzum_data",
 )
 def update_uzum_data(args=None, **kwargs):
+    """
+    Nightly crawl of the marketplace run by the update_data beat entry: categories, product ids and campaigns,
+    then the product ingest sharded into chunk tasks. update_uzum_analytics runs once every chunk is merged.
+    A restarted task resumes today's unfinished run and only dispatches the products no chunk has claimed yet.
+    """
     # before starting data creation, vacuum all tables
     # vacuum_table("category_categoryanalytics")
     # vacuum_table("product_productanalytics")
@@ -55,90 +72,114 @@ def update_uzum_data(args=None, **kwargs):
     print(get_today_pretty())
     print(datetime.now(tz=pytz.timezone("Asia/Tashkent")).strftime("%H:%M:%S" + " - " + "%d/%m/%Y"))
 
-    # create_and_update_categories()
-    # start = time.time()
-    # update_all_category_parents()
-    # Category.update_descendants()
-    # Category.update_ancestors_bulk()
-    # print("Category parents updated: ", time.time() - start)
-
-    # root = CategoryAnalytics.objects.filter(category__categoryId=1, date_pretty=get_today_pretty())
-    # print("total_products: ", root[0].total_products)
-
-    # # 1. Get all categories which have less than N products
-    # categories_filtered = get_categories_with_less_than_n_products(MAX_ID_COUNT)
-
-    # product_ids: list[int] = []
-    # async_to_sync(get_all_product_ids_from_uzum)(
-    #     categories_filtered,
-    #     product_ids,
-    #     page_size=PAGE_SIZE,
-    # )
-
-    # print(f"Total product ids: {len(product_ids)}")
-
-    # product_ids = list(set(product_ids))
-
-    # product_campaigns, product_associations, shop_association = update_or_create_campaigns()
-
-    # shop_analytics_done = {}
-
-    # BATCH_SIZE = 10_000
-
-    # # Create Latest Analytics of products ->  used for calculating orders_money for product analytics
-    # start = time.time()
-    # create_product_latestanalytics(get_day_before_pretty(date_pretty))
-    # print(f"Latest Analytics created in {time.time() - start} seconds")
-
-    # category_sales_map = {
-    #     analytics.category.categoryId: {
-    #         "products_with_sales": set(),
-    #         "shops_with_sales": set(),
-    #     }
-    #     for analytics in CategoryAnalytics.objects.filter(date_pretty=date_pretty).prefetch_related("category")
-    # }
-
-    # for i in range(0, len(product_ids), BATCH_SIZE):
-    #     products_api: list[dict] = []
-    #     print(f"{i}/{len(product_ids)}")
-    #     async_to_sync(get_product_details_via_ids)(product_ids[i : i + BATCH_SIZE], products_api)
-    #     create_products_from_api(products_api, product_campaigns, shop_analytics_done, category_sales_map)
-    #     time.sleep(10)
-    #     del products_api
-    # Category.update_descendants()
-
-    # time.sleep(10)
-    # try:
-    #     fetch_product_ids(date_pretty, product_ids)
-    # except Exception as e:
-    #     print("Error in remaining fetch_product_ids:", e)
-    # # add russian titles to all products
-    # add_russian_titles()
-
-    # # create popular searches
-    # create_todays_searches()
-
-    # # remove duplicate analytics
-    # bulk_remove_duplicate_category_analytics(date_pretty)
-    # bulk_remove_duplicate_product_analytics(date_pretty)
-    # bulk_remove_duplicate_shop_analytics(date_pretty)
-    # bulk_remove_duplicate_sku_analytics(date_pretty)
-
-    # # ANALYTICS STARTS HERE
-    # update_category_with_sales(category_sales_map, date_pretty)
-
-    # start = time.time()
-    # update_analytics(date_pretty)
-    # print(f"All Analytics updated in {time.time() - start} seconds")
-
-    # start = time.time()
-    # send_reports_to_all()
-    # print(f"Reports sent in {time.time() - start} seconds")
-
-    # update_category_tree_with_monthly_data(date_pretty)
-    # update_category_tree_with_weekly_data(date_pretty)
-    # update_category_tree_with_data(date_pretty)
-    # update_category_tree(date_pretty)
+    # a restarted task picks up today's unfinished run instead of crawling from scratch
+    run, resumed = start_or_resume_run(date_pretty)
+
+    if not resumed:
+        # also syncs parents, ancestors and descendants of the whole tree
+        create_and_update_categories()
+
+        # root = CategoryAnalytics.objects.filter(category__categoryId=1, date_pretty=get_today_pretty())
+        # print("total_products: ", root[0].total_products)
+
+        # 1. Get all categories which have less than N products
+        categories_filtered = get_categories_with_less_than_n_products(MAX_ID_COUNT)
+
+        # cold products are not fetched every night, discovery records their catalog cards instead
+        plan = load_refresh_plan(date_pretty)
+        product_ids: list[int] = []
+        async_to_sync(get_all_product_ids_from_uzum)(
+            categories_filtered,
+            product_ids,
+            page_size=PAGE_SIZE,
+            plan=plan,
+        )
+
+        product_ids = list(set(product_ids))
+        product_ids, skipped_ids = plan.split(product_ids)
+        # products that kept answering 404 are not worth a request, see replay_dead_letters
+        product_ids = drop_dead_products(product_ids)
+        seed_frontier(run, product_ids)
+
+        update_or_create_campaigns()
+
+        # Create Latest Analytics of products ->  used for calculating orders_money for product analytics
+        start = time.time()
+        create_product_latestanalytics(get_day_before_pretty(date_pretty))
+        print(f"Latest Analytics created in {time.time() - start} seconds")
+
+        # sales of the skipped products go into the run's checkpoint, merge_product_chunks adds the chunks' to it
+        category_sales_map = get_category_sales_map(date_pretty)
+        # skipped products whose card shows a new price are fetched after all
+        repriced_ids = fill_skipped_products(plan, skipped_ids, category_sales_map)
+        if repriced_ids:
+            seed_frontier(run, repriced_ids)
+        save_checkpoint(run, dump_checkpoint({}, category_sales_map), [])
+
+    # ids already queued by the task before a restart are left to their chunks
+    product_ids = claim_pending_product_ids(run)
+    print(f"Total product ids: {len(product_ids)}")
+
+    if not product_ids:
+        if count_unfinished(run):
+            print(f"Products of run {run.id} are still being ingested, analytics start once they are merged")
+        else:
+            celery_app.signature("update_uzum_analytics", args=(run.id,)).delay()
+        return True
+
+    # shard the ingest across all workers, update_uzum_analytics runs once every chunk is merged
+    dispatch_product_chunks(run, product_ids)
+    return True
+
+
+@celery_app.task(
+    name="update_uzum_analytics",
+)
+def update_uzum_analytics(run_id: int):
+    """
+    Analytics stage of a distributed run, started by merge_product_chunks.
+    Reports only go out to users with CRAWLER_SEND_REPORTS set.
+    """
+    run = CrawlRun.objects.get(pk=run_id)
+    date_pretty = run.date_pretty
+
+    category_sales_map = get_category_sales_map(date_pretty)
+    load_checkpoint(run, {}, category_sales_map)
+
+    # add russian titles to all categories, and to new or changed products
+    add_russian_titles()
+    enrich_russian_titles()
+
+    # create popular searches
+    create_todays_searches()
+
+    # remove duplicate analytics
+    bulk_remove_duplicate_category_analytics(date_pretty)
+    bulk_remove_duplicate_product_analytics(date_pretty)
+    bulk_remove_duplicate_shop_analytics(date_pretty)
+    bulk_remove_duplicate_sku_analytics(date_pretty)
+
+    # categories first created by the product ingest have no ancestors or descendants yet
+    start = time.time()
+    Category.rebuild_tree()
+    print(f"Category tree updated in {time.time() - start:.2f} seconds")
+
+    update_category_with_sales(category_sales_map, date_pretty)
+    finish_run(run)
+
+    start = time.time()
+    update_analytics(date_pretty)
+    print(f"All Analytics updated in {time.time() - start} seconds")
+
+    if settings.CRAWLER_SEND_REPORTS:
+        start = time.time()
+        send_reports_to_all()
+        print(f"Reports sent in {time.time() - start} seconds")
+
+    update_category_tree_with_monthly_data(date_pretty)
+    update_category_tree_with_weekly_data(date_pretty)
+    update_category_tree_with_data(date_pretty)
+    update_category_tree(date_pretty)
     return True
 
 
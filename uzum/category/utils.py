@@ -2,7 +2,6 @@ import datetime
 import json
 import time
 import traceback
-from itertools import chain
 
 import pytz
 from asgiref.sync import async_to_sync
@@ -16,15 +15,30 @@ from uzum.category.models import Category, CategoryAnalytics
 from uzum.jobs.campaign.utils import associate_with_shop_or_product
 from uzum.jobs.category.MultiEntry import \
     get_categories_with_less_than_n_products_for_russian_title
-from uzum.jobs.category.utils import get_categories_tree
+from uzum.jobs.category.utils import get_categories_tree, sync_category_tree
 from uzum.jobs.constants import MAX_ID_COUNT, PAGE_SIZE
 from uzum.jobs.product.fetch_ids import get_all_product_ids_from_uzum
+from uzum.jobs.product.russian import enrich_russian_titles
 from uzum.product.models import ProductAnalytics
 from uzum.shop.models import Shop, ShopAnalytics
 from uzum.sku.models import SkuAnalytics
 from uzum.utils.general import get_today_pretty
 
 
+def get_category_sales_map(date_pretty=get_today_pretty()) -> dict:
+    """
+    Empty category_sales_map with an entry for every category that has analytics for the date,
+    so categories without any sales end up with zero totals.
+    """
+    return {
+        analytics.category.categoryId: {
+            "products_with_sales": set(),
+            "shops_with_sales": set(),
+        }
+        for analytics in CategoryAnalytics.objects.filter(date_pretty=date_pretty).prefetch_related("category")
+    }
+
+
 def update_category_with_sales(category_sales_map: dict, date_pretty=get_today_pretty()):
     try:
         start = time.time()
@@ -333,64 +347,10 @@ def HHI(category: Category, date_pretty: str):
     return sum(shop_market_shares)
 
 def add_product_russian_titles():
-    try:
-        tree = get_categories_tree()
-        cat_totals = {}  # mapping from id to total products given in api response
-
-        for i, category in enumerate(tree):
-            cat_totals[category["category"]["id"]] = category["total"]
-
-        print("MAX_ID_COUNT: ", MAX_ID_COUNT)
-        categories_filtered = get_categories_with_less_than_n_products_for_russian_title(MAX_ID_COUNT, cat_totals)
-        product_ids: list[dict] = []  # it is [{productId: int, title: str}]
-
-        async_to_sync(get_all_product_ids_from_uzum)(
-            categories_filtered,
-            product_ids,
-            page_size=PAGE_SIZE,
-            is_ru=True,
-        )
-
-        # remove duplicate product ids
-        product_ids_dict = {d["productId"]: d["title"] for d in product_ids}
-        product_ids = [{"productId": k, "title": v} for k, v in product_ids_dict.items()]
-        print(f"Total product ids: {len(product_ids)}")
-
-        with transaction.atomic():
-            with connection.cursor() as cursor:
-                # Create mapping table
-                cursor.execute(
-                    """
-                    DROP TABLE IF EXISTS product_id_title_mapping;
-                    CREATE TABLE product_id_title_mapping (
-                        product_id INT PRIMARY KEY,
-                        new_title TEXT
-                    );
-                """
-                )
-
-                # Insert product id and new title mapping into the table using batch insert
-                values = ", ".join(["(%s, %s)"] * len(product_ids))
-                query = f"""
-                    INSERT INTO product_id_title_mapping (product_id, new_title)
-                    VALUES {values}
-                """
-                cursor.execute(query, sum([list(item.values()) for item in product_ids], []))
-
-                # Update product titles based on the mapping table only if title_ru is null
-                cursor.execute(
-                    """
-                    UPDATE product_product
-                    SET title_ru = product_id_title_mapping.new_title
-                    FROM product_id_title_mapping
-                    WHERE product_product.product_id = product_id_title_mapping.product_id
-                    """
-                )
-
-    except Exception as e:
-        print("Error in add_russian_titles: ", e)
-        traceback.print_exc()
-        return None
+    """
+    Russian titles of new and changed products, see enrich_russian_titles.
+    """
+    return enrich_russian_titles()
 
 
 def add_product_russian_characteristics():
@@ -501,38 +461,7 @@ def set_banners_for_product_analytics(date_pretty=get_today_pretty()):
 
 def update_all_category_parents():
     try:
-        tree = get_categories_tree()
-        cat_parents = {}  # mapping from id to parent id
-        all_categories = {}
-        Category.objects.all().update(parent=None)
-
-        for i, category in enumerate(tree):
-            if category["category"]["id"] != 1:
-                cat_parents[category["category"]["id"]] = category["category"]["parent"]["id"]
-
-        categories_qs = Category.objects.filter(categoryId__in=cat_parents.keys())
-        parent_qs = Category.objects.filter(categoryId__in=cat_parents.values())
-
-        # Build dictionary for quick access
-        for category in chain(categories_qs, parent_qs):
-            try:
-                if category.categoryId not in all_categories:
-                    all_categories[category.categoryId] = category
-            except Exception as e:
-                print("Keyerror:", e)
-                traceback.print_exc()
-
-        # Update parent of each category
-        for cat_id, parent_id in cat_parents.items():
-            try:
-                cat = all_categories[cat_id]
-                parent = all_categories[parent_id]
-                cat.parent = parent
-                cat.save()
-            except Exception as e:
-                print("Error in update_all_category_parents:", e)
-                traceback.print_exc()
-            # print(f"Category {cat.title} parent set to {parent.title}")
+        sync_category_tree(get_categories_tree())
     except Exception as e:
         print("Error in update_all_category_parents:", e)
         traceback.print_exc()
@@ -0,0 +1,27 @@
+from django.contrib import admin
+
+from uzum.crawler.models import CrawlRun, CrawlSummary, DeadLetter
+
+
+@admin.register(CrawlRun)
+class CrawlRunAdmin(admin.ModelAdmin):
+    list_display = ("id", "date_pretty", "status", "total_products", "started_at", "finished_at")
+    list_filter = ("status",)
+    search_fields = ("date_pretty",)
+    list_per_page = 25
+
+
+@admin.register(CrawlSummary)
+class CrawlSummaryAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "date_pretty", "duration", "requests", "errors", "retries", "failed")
+    list_filter = ("name",)
+    search_fields = ("date_pretty",)
+    list_per_page = 25
+
+
+@admin.register(DeadLetter)
+class DeadLetterAdmin(admin.ModelAdmin):
+    list_display = ("product_id", "endpoint", "state", "status_code", "error_class", "failures", "last_failed_at")
+    list_filter = ("state", "endpoint", "status_code")
+    search_fields = ("product_id",)
+    list_per_page = 25
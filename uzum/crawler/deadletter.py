@@ -0,0 +1,143 @@
+import json
+import traceback
+from datetime import timedelta
+from typing import Any
+
+from django.db import transaction
+from django.utils import timezone
+
+from uzum.crawler.models import DeadLetter
+from uzum.jobs.constants import (DEADLETTER_HISTORY,
+                                 DEADLETTER_NOT_FOUND_LIMIT,
+                                 DEADLETTER_REPLAY_LIMIT,
+                                 DEADLETTER_RETENTION_DAYS)
+
+DEADLETTER_CHUNK_SIZE = 5_000
+
+
+def record_failures(failures: list[tuple[int, Any, int]], endpoint: str = "product_detail"):
+    """
+    Upsert a dead letter per (product_id, reason, attempts). `reason` is the last status code or exception.
+    A product whose last DEADLETTER_NOT_FOUND_LIMIT failures all were 404s is marked dead.
+    """
+    try:
+        now = timezone.now()
+        recorded = dead = 0
+        for i in range(0, len(failures), DEADLETTER_CHUNK_SIZE):
+            chunk = {
+                product_id: (reason, attempts)
+                for product_id, reason, attempts in failures[i : i + DEADLETTER_CHUNK_SIZE]
+            }
+            with transaction.atomic():
+                existing = {
+                    letter.product_id: letter
+                    for letter in DeadLetter.objects.select_for_update().filter(
+                        endpoint=endpoint, product_id__in=list(chunk)
+                    )
+                }
+                new_letters = []
+                for product_id, (reason, attempts) in chunk.items():
+                    letter = existing.get(product_id) or DeadLetter(product_id=product_id, endpoint=endpoint)
+                    status_code = reason if isinstance(reason, int) else None
+                    letter.status_code = status_code
+                    letter.error_class = None if status_code else type(reason).__name__
+                    letter.attempts += attempts
+                    letter.failures += 1
+                    letter.not_found_streak = letter.not_found_streak + 1 if status_code == 404 else 0
+                    letter.last_failed_at = now
+                    history = json.loads(letter.history) if letter.history else []
+                    history.append(
+                        {
+                            "at": now.isoformat(),
+                            "status_code": status_code,
+                            "error_class": letter.error_class,
+                            "attempts": attempts,
+                        }
+                    )
+                    letter.history = json.dumps(history[-DEADLETTER_HISTORY:])
+                    if letter.not_found_streak >= DEADLETTER_NOT_FOUND_LIMIT and letter.state != DeadLetter.DEAD:
+                        letter.state = DeadLetter.DEAD
+                        dead += 1
+                    if product_id not in existing:
+                        new_letters.append(letter)
+
+                DeadLetter.objects.bulk_create(new_letters, ignore_conflicts=True)
+                DeadLetter.objects.bulk_update(
+                    existing.values(),
+                    [
+                        "state",
+                        "status_code",
+                        "error_class",
+                        "attempts",
+                        "failures",
+                        "not_found_streak",
+                        "history",
+                        "last_failed_at",
+                    ],
+                )
+            recorded += len(chunk)
+        if recorded:
+            print(f"record_failures: {recorded} {endpoint} dead letters recorded, {dead} marked dead")
+    except Exception as e:
+        print(f"Error in record_failures: {e}")
+        traceback.print_exc()
+
+
+def resolve_dead_letters(product_ids: list[int], endpoint: str = "product_detail"):
+    """
+    Drop the dead letters of products that were fetched.
+    """
+    try:
+        # the store is small compared to a crawl, so only ids that have a letter are deleted
+        letters = set(DeadLetter.objects.filter(endpoint=endpoint).values_list("product_id", flat=True))
+        recovered = [product_id for product_id in product_ids if product_id in letters]
+        resolved = 0
+        for i in range(0, len(recovered), DEADLETTER_CHUNK_SIZE):
+            resolved += DeadLetter.objects.filter(
+                endpoint=endpoint, product_id__in=recovered[i : i + DEADLETTER_CHUNK_SIZE]
+            ).delete()[0]
+        if resolved:
+            print(f"resolve_dead_letters: {resolved} {endpoint} dead letters recovered")
+    except Exception as e:
+        print(f"Error in resolve_dead_letters: {e}")
+        traceback.print_exc()
+
+
+def pending_dead_letters(endpoint: str = "product_detail", limit: int = DEADLETTER_REPLAY_LIMIT) -> list[int]:
+    """
+    Product ids to replay, least failed first.
+    """
+    return list(
+        DeadLetter.objects.filter(endpoint=endpoint, state=DeadLetter.PENDING)
+        .order_by("failures", "last_failed_at")
+        .values_list("product_id", flat=True)[:limit]
+    )
+
+
+def drop_dead_products(product_ids: list[int], endpoint: str = "product_detail") -> list[int]:
+    """
+    `product_ids` without the products marked dead, which are not worth a request.
+    """
+    dead = set(
+        DeadLetter.objects.filter(endpoint=endpoint, state=DeadLetter.DEAD).values_list("product_id", flat=True)
+    )
+    if not dead:
+        return product_ids
+    kept = [product_id for product_id in product_ids if product_id not in dead]
+    print(f"drop_dead_products: skipping {len(product_ids) - len(kept)} dead products")
+    return kept
+
+
+def expire_dead_letters(retention_days: int = DEADLETTER_RETENTION_DAYS):
+    """
+    Forget products marked dead more than `retention_days` ago, so they get fetched once more.
+    """
+    try:
+        expired, _ = DeadLetter.objects.filter(
+            state=DeadLetter.DEAD, last_failed_at__lt=timezone.now() - timedelta(days=retention_days)
+        ).delete()
+        if expired:
+            print(f"expire_dead_letters: {expired} dead products expired")
+    except Exception as e:
+        print(f"Error in expire_dead_letters: {e}")
+        traceback.print_exc()
@@ -0,0 +1,168 @@
+import json
+import traceback
+
+from django.db import transaction
+from django.utils import timezone
+
+from uzum.crawler.models import CrawlFrontier, CrawlRun
+
+FRONTIER_CHUNK_SIZE = 10_000
+
+
+def start_or_resume_run(date_pretty: str) -> tuple[CrawlRun, bool]:
+    """
+    Return today's unfinished run if there is one, otherwise start a new run.
+    The second value is True when an existing run is resumed.
+    """
+    run = CrawlRun.objects.filter(date_pretty=date_pretty, status=CrawlRun.RUNNING).order_by("-started_at").first()
+    if run:
+        print(f"Resuming crawl run {run.id} of {date_pretty} started at {run.started_at}")
+        return run, True
+    return CrawlRun.objects.create(date_pretty=date_pretty), False
+
+
+def seed_frontier(run: CrawlRun, product_ids: list[int]):
+    """
+    Store the product ids discovered for the run as pending.
+    """
+    try:
+        CrawlFrontier.objects.bulk_create(
+            [CrawlFrontier(run=run, product_id=product_id) for product_id in product_ids],
+            batch_size=FRONTIER_CHUNK_SIZE,
+            ignore_conflicts=True,
+        )
+        run.total_products = CrawlFrontier.objects.filter(run=run).count()
+        run.save(update_fields=["total_products", "updated_at"])
+    except Exception as e:
+        print(f"Error in seed_frontier: {e}")
+        traceback.print_exc()
+
+
+def claim_pending_product_ids(run: CrawlRun) -> list[int]:
+    """
+    Ids that still have to be ingested, moved to queued so they are dispatched only once. Queued and in-flight
+    ids belong to chunk tasks that are still in the broker, a restarted run leaves them to those.
+    Rows locked by a concurrent claim are skipped.
+    """
+    with transaction.atomic():
+        product_ids = list(
+            CrawlFrontier.objects.select_for_update(skip_locked=True)
+            .filter(run=run, state=CrawlFrontier.PENDING)
+            .values_list("product_id", flat=True)
+        )
+        mark_state(run, product_ids, CrawlFrontier.QUEUED)
+    return product_ids
+
+
+def _unfinished(run: CrawlRun):
+    return CrawlFrontier.objects.filter(run=run).exclude(state__in=[CrawlFrontier.DONE, CrawlFrontier.FAILED])
+
+
+def unfinished_product_ids(run: CrawlRun, product_ids: list[int]) -> list[int]:
+    """
+    The ids of `product_ids` that are neither done nor failed in the run.
+    """
+    unfinished = []
+    for i in range(0, len(product_ids), FRONTIER_CHUNK_SIZE):
+        unfinished.extend(
+            _unfinished(run)
+            .filter(product_id__in=product_ids[i : i + FRONTIER_CHUNK_SIZE])
+            .values_list("product_id", flat=True)
+        )
+    return unfinished
+
+
+def count_unfinished(run: CrawlRun) -> int:
+    return _unfinished(run).count()
+
+
+def mark_state(run: CrawlRun, product_ids: list[int], state: str):
+    now = timezone.now()
+    for i in range(0, len(product_ids), FRONTIER_CHUNK_SIZE):
+        CrawlFrontier.objects.filter(run=run, product_id__in=product_ids[i : i + FRONTIER_CHUNK_SIZE]).update(
+            state=state, updated_at=now
+        )
+
+
+def dump_checkpoint(shop_analytics_done: dict, category_sales_map: dict) -> str:
+    """
+    Serialize the aggregation maps of a run. Sets are stored as lists.
+    """
+    return json.dumps(
+        {
+            "shop_analytics_done": list(shop_analytics_done.keys()),
+            "category_sales_map": {
+                category_id: {
+                    "products_with_sales": list(sales["products_with_sales"]),
+                    "shops_with_sales": list(sales["shops_with_sales"]),
+                }
+                for category_id, sales in category_sales_map.items()
+            },
+        }
+    )
+
+
+def save_checkpoint(run: CrawlRun, checkpoint: str, done_ids: list[int]):
+    """
+    Merge the checkpoint into the run's and store it together with the ids it covers, so both are either saved
+    or lost together. The run is locked meanwhile, so the chunks of a run can checkpoint concurrently.
+    """
+    with transaction.atomic():
+        stored = CrawlRun.objects.select_for_update().values_list("checkpoint", flat=True).get(pk=run.pk)
+        if stored:
+            shop_analytics_done = {}
+            category_sales_map = {}
+            merge_checkpoint(stored, shop_analytics_done, category_sales_map)
+            merge_checkpoint(checkpoint, shop_analytics_done, category_sales_map)
+            checkpoint = dump_checkpoint(shop_analytics_done, category_sales_map)
+        CrawlRun.objects.filter(pk=run.pk).update(checkpoint=checkpoint, updated_at=timezone.now())
+        mark_state(run, done_ids, CrawlFrontier.DONE)
+
+
+def load_checkpoint(run: CrawlRun, shop_analytics_done: dict, category_sales_map: dict):
+    """
+    Merge the last checkpoint of the run into the given maps in place.
+    """
+    run.refresh_from_db(fields=["checkpoint"])
+    if not run.checkpoint:
+        return
+    merge_checkpoint(run.checkpoint, shop_analytics_done, category_sales_map)
+    print(
+        f"Loaded checkpoint of run {run.id} - shops: {len(shop_analytics_done)}, "
+        f"categories: {len(category_sales_map)}"
+    )
+
+
+def merge_checkpoint(checkpoint: str, shop_analytics_done: dict, category_sales_map: dict):
+    """
+    Merge a serialized checkpoint (see dump_checkpoint) into the given maps in place.
+    """
+    checkpoint = json.loads(checkpoint)
+    for shop_id in checkpoint["shop_analytics_done"]:
+        shop_analytics_done[shop_id] = True
+    for category_id, sales in checkpoint["category_sales_map"].items():
+        # json turns int keys into strings
+        category_sales = category_sales_map.setdefault(
+            int(category_id), {"products_with_sales": set(), "shops_with_sales": set()}
+        )
+        category_sales["products_with_sales"].update(sales["products_with_sales"])
+        category_sales["shops_with_sales"].update(sales["shops_with_sales"])
+
+
+def finish_run(run: CrawlRun, status: str = CrawlRun.FINISHED):
+    """
+    Close the run. Done ids are dropped, failed ones are kept for inspection.
+    A run with ids that were never ingested is closed as partial, they are kept as well.
+    """
+    try:
+        CrawlFrontier.objects.filter(run=run, state=CrawlFrontier.DONE).delete()
+        unfinished = count_unfinished(run)
+        if unfinished and status == CrawlRun.FINISHED:
+            print(f"Crawl run {run.id} finished with {unfinished} products not ingested")
+            status = CrawlRun.PARTIAL
+        run.status = status
+        run.finished_at = timezone.now()
+        run.save(update_fields=["status", "finished_at", "updated_at"])
+    except Exception as e:
+        print(f"Error in finish_run: {e}")
+        traceback.print_exc()
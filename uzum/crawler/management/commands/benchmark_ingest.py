@@ -0,0 +1,193 @@
+import gc
+import json
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+
+from uzum.category.analytics import update_analytics
+from uzum.category.utils import get_category_sales_map, update_category_with_sales
+from uzum.jobs.category.main import create_and_update_categories
+from uzum.jobs.category.MultiEntry import get_categories_with_less_than_n_products
+from uzum.jobs.constants import MAX_ID_COUNT, PAGE_SIZE, UZUM_API_STANDIN
+from uzum.jobs.product.fetch_details import get_product_details_via_ids
+from uzum.jobs.product.fetch_ids import get_all_product_ids_from_uzum
+from uzum.jobs.product.MultiEntry import create_products_from_api
+from uzum.jobs.product.pipeline import ingest_products
+from uzum.jobs.standin.app import StandinApp
+from uzum.jobs.standin.catalog import SyntheticCatalog
+from uzum.product.models import create_product_latestanalytics
+from uzum.utils.general import get_day_before_pretty, get_today_pretty
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the nightly ingest end to end against the local Uzum API stand-in and print time and peak memory "
+        "per stage as JSON. Run with UZUM_API_STANDIN=http://127.0.0.1:8765 against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=10_000)
+        parser.add_argument("--skus", type=int, default=3, help="skus per product")
+        parser.add_argument("--shops", type=int, default=500)
+        parser.add_argument("--categories", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--day", type=int, default=0, help="synthetic day, run 0 then 1 to measure a repeat night")
+        parser.add_argument("--latency", type=float, default=0.0, help="mean stand-in response delay in seconds")
+        parser.add_argument("--error-rate", type=float, default=0.0)
+        parser.add_argument("--throttle-rate", type=float, default=0.0)
+        parser.add_argument("--pipeline", action="store_true", help="fetch and write through ingest_products")
+        parser.add_argument("--skip-analytics", action="store_true")
+        parser.add_argument("--trace-memory", action="store_true", help="also report peak Python allocations")
+        parser.add_argument("--output", default=None, help="write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        if not UZUM_API_STANDIN:
+            raise CommandError("UZUM_API_STANDIN is not set, refusing to benchmark against the live marketplace")
+
+        self.trace_memory = options["trace_memory"]
+        self.stages = {}
+        catalog = SyntheticCatalog(
+            products=options["products"],
+            skus_per_product=options["skus"],
+            shops=options["shops"],
+            categories=options["categories"],
+            seed=options["seed"],
+            day=options["day"],
+        )
+        app = StandinApp(
+            catalog,
+            latency=options["latency"],
+            error_rate=options["error_rate"],
+            throttle_rate=options["throttle_rate"],
+        )
+        server, thread = self.start_standin(app)
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.time()
+        try:
+            self.run_stages(options)
+        finally:
+            server.should_exit = True
+            thread.join()
+
+        report = {
+            "commit": self.git_commit(),
+            "python": sys.version.split()[0],
+            "params": {
+                key: options[key]
+                for key in (
+                    "products",
+                    "skus",
+                    "shops",
+                    "categories",
+                    "seed",
+                    "day",
+                    "latency",
+                    "error_rate",
+                    "throttle_rate",
+                    "pipeline",
+                )
+            },
+            "standin_requests": app.requests,
+            "total_secs": round(time.time() - start, 3),
+            "stages": self.stages,
+        }
+        output = json.dumps(report, indent=4)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def run_stages(self, options):
+        date_pretty = get_today_pretty()
+
+        self.stage("categories", create_and_update_categories)
+
+        product_ids: list[int] = []
+
+        def discover():
+            categories_filtered = get_categories_with_less_than_n_products(MAX_ID_COUNT)
+            async_to_sync(get_all_product_ids_from_uzum)(categories_filtered, product_ids, page_size=PAGE_SIZE)
+            product_ids[:] = list(set(product_ids))
+            return len(product_ids)
+
+        self.stage("discovery", discover)
+        self.stage("latest_analytics", create_product_latestanalytics, get_day_before_pretty(date_pretty))
+
+        shop_analytics_done = {}
+        category_sales_map = get_category_sales_map(date_pretty)
+        if options["pipeline"]:
+            self.stage("ingest", ingest_products, product_ids, shop_analytics_done, category_sales_map)
+        else:
+            products_api: list[dict] = []
+
+            def fetch():
+                async_to_sync(get_product_details_via_ids)(product_ids, products_api)
+                return len(products_api)
+
+            self.stage("fetch", fetch)
+            self.stage(
+                "create_products",
+                create_products_from_api,
+                products_api,
+                {},
+                shop_analytics_done,
+                category_sales_map,
+            )
+            del products_api
+
+        if not options["skip_analytics"]:
+            self.stage("category_sales", update_category_with_sales, category_sales_map, date_pretty)
+            self.stage("analytics", update_analytics, date_pretty)
+
+    def stage(self, name: str, func, *args):
+        gc.collect()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        print(f"Benchmark stage {name}...")
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        stats = {
+            "secs": round(elapsed, 3),
+            # high-water mark of the whole process so far, in MB
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+        if isinstance(result, int) and not isinstance(result, bool):
+            stats["items"] = result
+            stats["items_per_sec"] = round(result / elapsed, 1) if elapsed else None
+        elif isinstance(result, list):
+            stats["failed"] = len(result)
+        if self.trace_memory:
+            stats["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        self.stages[name] = stats
+        return result
+
+    def start_standin(self, app: StandinApp):
+        import uvicorn
+
+        url = urlsplit(UZUM_API_STANDIN)
+        server = uvicorn.Server(
+            uvicorn.Config(app, host=url.hostname, port=url.port or 80, log_level="warning", lifespan="off")
+        )
+        thread = threading.Thread(target=server.run, name="uzum-standin", daemon=True)
+        thread.start()
+        while not server.started:
+            if not thread.is_alive():
+                raise CommandError(f"Could not start the Uzum API stand-in on {UZUM_API_STANDIN}")
+            time.sleep(0.05)
+        return server, thread
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+        except Exception:
+            return None
@@ -0,0 +1,70 @@
+# Generated by Django 4.1.9 on 2026-10-17 11:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uzum.utils.general
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="CrawlRun",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "date_pretty",
+                    models.CharField(db_index=True, default=uzum.utils.general.get_today_pretty, max_length=255),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("running", "Running"), ("finished", "Finished"), ("failed", "Failed")],
+                        db_index=True,
+                        default="running",
+                        max_length=32,
+                    ),
+                ),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("total_products", models.IntegerField(default=0)),
+                ("checkpoint", models.TextField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="CrawlFrontier",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("product_id", models.IntegerField()),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("in_flight", "In flight"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=32,
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "run",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="frontier", to="crawler.crawlrun"
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("run", "product_id")},
+                "indexes": [models.Index(fields=["run", "state"], name="crawler_frontier_run_state_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.1.9 on 2026-10-17 13:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uzum.utils.general
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crawler", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CrawlSummary",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=255)),
+                (
+                    "date_pretty",
+                    models.CharField(db_index=True, default=uzum.utils.general.get_today_pretty, max_length=255),
+                ),
+                ("started_at", models.DateTimeField()),
+                ("duration", models.FloatField()),
+                ("requests", models.IntegerField(default=0)),
+                ("errors", models.IntegerField(default=0)),
+                ("retries", models.IntegerField(default=0)),
+                ("failed", models.IntegerField(default=0)),
+                ("bytes_received", models.BigIntegerField(default=0)),
+                ("metrics", models.TextField(blank=True, null=True)),
+                (
+                    "run",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="summaries",
+                        to="crawler.crawlrun",
+                    ),
+                ),
+            ],
+        ),
+    ]
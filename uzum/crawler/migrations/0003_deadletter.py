@@ -0,0 +1,41 @@
+# Generated by Django 4.1.9 on 2026-10-17 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crawler", "0002_crawlsummary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeadLetter",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("product_id", models.IntegerField()),
+                ("endpoint", models.CharField(default="product_detail", max_length=64)),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[("pending", "Pending"), ("dead", "Dead")],
+                        db_index=True,
+                        default="pending",
+                        max_length=32,
+                    ),
+                ),
+                ("status_code", models.IntegerField(blank=True, null=True)),
+                ("error_class", models.CharField(blank=True, max_length=255, null=True)),
+                ("attempts", models.IntegerField(default=0)),
+                ("failures", models.IntegerField(default=0)),
+                ("not_found_streak", models.IntegerField(default=0)),
+                ("history", models.TextField(blank=True, null=True)),
+                ("first_failed_at", models.DateTimeField(auto_now_add=True)),
+                ("last_failed_at", models.DateTimeField()),
+            ],
+            options={
+                "unique_together": {("endpoint", "product_id")},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.1.9 on 2026-10-17 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crawler", "0003_deadletter"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="crawlrun",
+            name="status",
+            field=models.CharField(
+                choices=[("running", "Running"), ("finished", "Finished"), ("partial", "Partial"), ("failed", "Failed")],
+                db_index=True,
+                default="running",
+                max_length=32,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="crawlfrontier",
+            name="state",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("queued", "Queued"),
+                    ("in_flight", "In flight"),
+                    ("done", "Done"),
+                    ("failed", "Failed"),
+                ],
+                default="pending",
+                max_length=32,
+            ),
+        ),
+    ]
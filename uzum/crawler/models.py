@@ -0,0 +1,120 @@
+from django.db import models
+
+from uzum.utils.general import get_today_pretty
+
+
+class CrawlRun(models.Model):
+    """
+    CrawlRun - one nightly ingest run.
+    Keeps the aggregation maps of the run as a checkpoint so a restarted run can resume.
+    """
+
+    RUNNING = "running"
+    FINISHED = "finished"
+    PARTIAL = "partial"  # finished with products that were never ingested, they stay in the frontier
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (RUNNING, "Running"),
+        (FINISHED, "Finished"),
+        (PARTIAL, "Partial"),
+        (FAILED, "Failed"),
+    )
+
+    date_pretty = models.CharField(max_length=255, default=get_today_pretty, db_index=True)
+    status = models.CharField(max_length=32, choices=STATUS_CHOICES, default=RUNNING, db_index=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    total_products = models.IntegerField(default=0)
+    # json.dumps({"shop_analytics_done": [...], "category_sales_map": {...}})
+    checkpoint = models.TextField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.date_pretty} - {self.status}"
+
+
+class CrawlFrontier(models.Model):
+    """
+    CrawlFrontier - product ids of a run and how far each of them got.
+    """
+
+    PENDING = "pending"
+    QUEUED = "queued"  # claimed by a dispatched chunk task
+    IN_FLIGHT = "in_flight"
+    DONE = "done"
+    FAILED = "failed"
+    STATE_CHOICES = (
+        (PENDING, "Pending"),
+        (QUEUED, "Queued"),
+        (IN_FLIGHT, "In flight"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    run = models.ForeignKey(CrawlRun, on_delete=models.CASCADE, related_name="frontier")
+    product_id = models.IntegerField()
+    state = models.CharField(max_length=32, choices=STATE_CHOICES, default=PENDING)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("run", "product_id")
+        indexes = [models.Index(fields=["run", "state"], name="crawler_frontier_run_state_idx")]
+
+    def __str__(self) -> str:
+        return f"{self.product_id} - {self.state}"
+
+
+class CrawlSummary(models.Model):
+    """
+    CrawlSummary - metrics of one crawl stage (ingest, discovery...) once it has finished:
+    throughput, latency percentiles, status codes, errors and retries per endpoint.
+    """
+
+    run = models.ForeignKey(CrawlRun, on_delete=models.SET_NULL, null=True, blank=True, related_name="summaries")
+    name = models.CharField(max_length=255)
+    date_pretty = models.CharField(max_length=255, default=get_today_pretty, db_index=True)
+    started_at = models.DateTimeField()
+    duration = models.FloatField()  # seconds
+    requests = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0)  # network errors and non-2xx answers
+    retries = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    bytes_received = models.BigIntegerField(default=0)
+    # json.dumps({"endpoints": {...}, "stages": {...}})
+    metrics = models.TextField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.name} - {self.date_pretty}"
+
+
+class DeadLetter(models.Model):
+    """
+    DeadLetter - a product whose fetch failed for good, with why and how often.
+    Replayed by replay_dead_letters until it is fetched again or keeps answering 404 and is marked dead.
+    """
+
+    PENDING = "pending"
+    DEAD = "dead"
+    STATE_CHOICES = (
+        (PENDING, "Pending"),
+        (DEAD, "Dead"),
+    )
+
+    product_id = models.IntegerField()
+    endpoint = models.CharField(max_length=64, default="product_detail")
+    state = models.CharField(max_length=32, choices=STATE_CHOICES, default=PENDING, db_index=True)
+    status_code = models.IntegerField(null=True, blank=True)  # of the last failure, none for network errors
+    error_class = models.CharField(max_length=255, null=True, blank=True)
+    attempts = models.IntegerField(default=0)  # requests made over all failures
+    failures = models.IntegerField(default=0)
+    not_found_streak = models.IntegerField(default=0)  # consecutive failures that ended with a 404
+    # json.dumps([{"at": ..., "status_code": ..., "error_class": ..., "attempts": ...}, ...]), latest last
+    history = models.TextField(null=True, blank=True)
+    first_failed_at = models.DateTimeField(auto_now_add=True)
+    last_failed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("endpoint", "product_id")
+
+    def __str__(self) -> str:
+        return f"{self.product_id} - {self.state} ({self.status_code or self.error_class})"
@@ -0,0 +1,243 @@
+import traceback
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import pytz
+from django.db import connection
+
+from uzum.jobs.constants import (CRAWL_PRIORITY_WINDOW, CRAWL_REFRESH_TIERS,
+                                 CRAWL_REVIEW_WEIGHT, CRAWL_STOCK_WEIGHT)
+from uzum.jobs.product.MultiEntry import create_product_analytics_bulk
+from uzum.jobs.sku.MultiEntry import create_sku_analytics_bulk
+from uzum.product.models import LatestProductAnalyticsView, Product
+
+SCHEDULE_CHUNK_SIZE = 10_000
+
+
+class RefreshPlan:
+    """
+    Which products skip the detail fetch tonight.
+
+    Every product gets a priority from its last CRAWL_PRIORITY_WINDOW days: real orders, stock
+    movement and new reviews. CRAWL_REFRESH_TIERS map the priority to a refresh interval, and a product
+    with interval N is due on every N-th day (offset by its id, so the cold ones are spread evenly over
+    the days). Products without recent analytics are always due, and every shop keeps its hottest
+    product due so its shop analytics are still written daily.
+
+    Products that are not due get today's analytics from their catalog card instead, recorded during
+    id discovery (see fill_skipped_products), unless the card shows a new price.
+    """
+
+    def __init__(self, date_pretty: str, skip_ids: set[int]):
+        self.date_pretty = date_pretty
+        self.skip_ids = skip_ids
+        self.cards: dict[int, tuple] = {}  # product_id -> (orders, reviews, rating, min sell price)
+
+    def is_due(self, product_id: int) -> bool:
+        return product_id not in self.skip_ids
+
+    def record_card(self, card: dict):
+        if card["productId"] in self.skip_ids:
+            self.cards[card["productId"]] = (
+                card["ordersQuantity"],
+                card["feedbackQuantity"],
+                card["rating"],
+                card.get("minSellPrice"),
+            )
+
+    def split(self, product_ids: list[int]) -> tuple[list[int], list[int]]:
+        """
+        (ids to fetch, ids to fill from their cards). A skipped product whose card was not seen is fetched.
+        """
+        fetch_ids, skipped_ids = [], []
+        for product_id in product_ids:
+            (skipped_ids if product_id in self.cards else fetch_ids).append(product_id)
+        print(f"RefreshPlan {self.date_pretty}: {len(fetch_ids)} products to fetch, {len(skipped_ids)} from cards")
+        return fetch_ids, skipped_ids
+
+
+def load_refresh_plan(date_pretty: str) -> RefreshPlan:
+    """
+    Compute tonight's RefreshPlan from the analytics of the last CRAWL_PRIORITY_WINDOW days.
+    On failure every product is due.
+    """
+    try:
+        day = date.fromisoformat(date_pretty)
+        tiers = " ".join(f"WHEN score >= {score} THEN {interval}" for score, interval in CRAWL_REFRESH_TIERS[:-1])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH scores AS (
+                    SELECT
+                        pa.product_id,
+                        COALESCE(SUM(pa.real_orders_amount), 0)
+                            + %s * (MAX(pa.available_amount) - MIN(pa.available_amount))
+                            + %s * (MAX(pa.reviews_amount) - MIN(pa.reviews_amount)) AS score
+                    FROM product_productanalytics pa
+                    WHERE pa.date_pretty >= %s AND pa.date_pretty < %s
+                    GROUP BY pa.product_id
+                ),
+                plan AS (
+                    SELECT
+                        s.product_id,
+                        p.shop_id,
+                        s.score,
+                        (s.product_id + %s) %% (
+                            CASE {tiers} ELSE {CRAWL_REFRESH_TIERS[-1][1]} END
+                        ) = 0 AS due
+                    FROM scores s
+                    JOIN product_product p ON p.product_id = s.product_id
+                ),
+                promoted AS (
+                    -- hottest product of every shop that has nothing due
+                    SELECT DISTINCT ON (shop_id) product_id
+                    FROM plan
+                    WHERE shop_id NOT IN (SELECT shop_id FROM plan WHERE due)
+                    ORDER BY shop_id, score DESC
+                )
+                SELECT product_id FROM plan
+                WHERE NOT due AND product_id NOT IN (SELECT product_id FROM promoted)
+                """,
+                [
+                    CRAWL_STOCK_WEIGHT,
+                    CRAWL_REVIEW_WEIGHT,
+                    (day - timedelta(days=CRAWL_PRIORITY_WINDOW)).isoformat(),
+                    date_pretty,
+                    day.toordinal(),
+                ],
+            )
+            skip_ids = {row[0] for row in cursor.fetchall()}
+        print(f"load_refresh_plan: {len(skip_ids)} products are not due on {date_pretty}")
+        return RefreshPlan(date_pretty, skip_ids)
+    except Exception as e:
+        print(f"Error in load_refresh_plan: {e}")
+        traceback.print_exc()
+        return RefreshPlan(date_pretty, set())
+
+
+def fill_skipped_products(plan: RefreshPlan, skipped_ids: list[int], category_sales_map: dict = None) -> list[int]:
+    """
+    Write today's analytics of products that were not fetched: orders, reviews and rating from the
+    catalog card, stock and prices carried over from the latest analytics (product_latest_analytics must
+    be up to date, as for create_products_from_api), and their skus' latest rows carried over as well.
+    Real orders, sku orders and revenue are then derived by update_analytics as for fetched products.
+
+    A card whose min sell price differs from the lowest latest price of the product's skus means the prices
+    changed, which the carried rows would miss. Nothing is written for those products, their ids are returned
+    so they are fetched instead.
+    """
+    repriced = []
+    try:
+        now = datetime.now(tz=pytz.timezone("Asia/Tashkent"))
+        filled = 0
+        for i in range(0, len(skipped_ids), SCHEDULE_CHUNK_SIZE):
+            chunk = skipped_ids[i : i + SCHEDULE_CHUNK_SIZE]
+            latest = {
+                item["product_id"]: item
+                for item in LatestProductAnalyticsView.objects.filter(product_id__in=chunk).values(
+                    "product_id",
+                    "latest_orders_money",
+                    "latest_average_purchase_price",
+                    "latest_orders_amount",
+                    "latest_available_amount",
+                )
+            }
+            latest_skus = defaultdict(list)
+            for sku in latest_sku_analytics(chunk, plan.date_pretty):
+                latest_skus[sku["product_id"]].append(sku)
+
+            analytics = []
+            sku_analytics = []
+            with_sales = []
+            for product_id in chunk:
+                current = latest.get(product_id)
+                if not current:
+                    continue
+                orders, reviews, rating, min_sell_price = plan.cards[product_id]
+                if is_repriced(min_sell_price, latest_skus[product_id]):
+                    repriced.append(product_id)
+                    continue
+                orders_amount = max(orders, current["latest_orders_amount"])
+                average_purchase_price = float(current["latest_average_purchase_price"] or 0)
+                new_orders = orders_amount - current["latest_orders_amount"]
+                if new_orders > 0:
+                    with_sales.append(product_id)
+                analytics.append(
+                    {
+                        "created_at": now,
+                        "date_pretty": plan.date_pretty,
+                        "product_id": product_id,
+                        "reviews_amount": reviews,
+                        "rating": rating,
+                        "available_amount": current["latest_available_amount"],
+                        "orders_amount": orders_amount,
+                        "average_purchase_price": average_purchase_price,
+                        "orders_money": float(current["latest_orders_money"] or 0)
+                        + new_orders * average_purchase_price / 1000.0,
+                    }
+                )
+                # carried with no stock change, ids come from the model default
+                sku_analytics.extend(
+                    {
+                        "created_at": now,
+                        "date_pretty": plan.date_pretty,
+                        "sku_id": sku["sku_id"],
+                        "available_amount": sku["available_amount"],
+                        "purchase_price": sku["purchase_price"],
+                        "full_price": sku["full_price"],
+                    }
+                    for sku in latest_skus[product_id]
+                )
+            filled += create_product_analytics_bulk(analytics) or 0
+            create_sku_analytics_bulk(sku_analytics)
+
+            if category_sales_map is not None and with_sales:
+                for category_id, shop_id, product_id in Product.objects.filter(product_id__in=with_sales).values_list(
+                    "category_id", "shop_id", "product_id"
+                ):
+                    sales = category_sales_map.setdefault(
+                        category_id, {"products_with_sales": set(), "shops_with_sales": set()}
+                    )
+                    sales["products_with_sales"].add(product_id)
+                    sales["shops_with_sales"].add(shop_id)
+        print(
+            f"fill_skipped_products: {filled} product analytics filled from catalog cards, "
+            f"{len(repriced)} repriced products left to fetch"
+        )
+    except Exception as e:
+        print(f"Error in fill_skipped_products: {e}")
+        traceback.print_exc()
+    return repriced
+
+
+def is_repriced(min_sell_price, latest_skus: list[dict]) -> bool:
+    """
+    Whether the min sell price of a catalog card differs from the lowest latest price of the product's skus
+    in stock (of all of them when none is). Unknown prices count as unchanged.
+    """
+    prices = [sku["purchase_price"] for sku in latest_skus if sku["available_amount"]] or [
+        sku["purchase_price"] for sku in latest_skus
+    ]
+    if min_sell_price is None or not prices:
+        return False
+    return abs(float(min_sell_price) - min(prices)) >= 1
+
+
+def latest_sku_analytics(product_ids: list[int], date_pretty: str) -> list[dict]:
+    """
+    The latest analytics row before `date_pretty` of every sku of the products.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT DISTINCT ON (sa.sku_id) s.product_id, sa.sku_id, sa.available_amount, sa.purchase_price,
+                sa.full_price
+            FROM sku_skuanalytics sa
+            JOIN sku_sku s ON s.sku = sa.sku_id
+            WHERE s.product_id = ANY(%s) AND sa.date_pretty < %s
+            ORDER BY sa.sku_id, sa.created_at DESC
+            """,
+            [list(product_ids), date_pretty],
+        )
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
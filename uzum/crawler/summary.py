@@ -0,0 +1,47 @@
+import json
+import traceback
+from datetime import datetime
+
+from uzum.crawler.models import CrawlRun, CrawlSummary
+from uzum.jobs.telemetry import METRICS, EndpointMetrics
+
+
+def save_crawl_summary(
+    name: str,
+    started_at: datetime,
+    duration: float,
+    since: dict[str, EndpointMetrics],
+    run: CrawlRun = None,
+    stages: dict = None,
+):
+    """
+    Store the crawler metrics observed after the `since` snapshot as a CrawlSummary.
+    """
+    try:
+        endpoints = METRICS.summary(since, duration)
+        summary = CrawlSummary.objects.create(
+            run=run,
+            name=name,
+            date_pretty=run.date_pretty if run else CrawlSummary._meta.get_field("date_pretty").get_default(),
+            started_at=started_at,
+            duration=duration,
+            requests=sum(endpoint["requests"] for endpoint in endpoints.values()),
+            errors=sum(
+                sum(endpoint["errors"].values())
+                + sum(count for code, count in endpoint["status_codes"].items() if not code.startswith("2"))
+                for endpoint in endpoints.values()
+            ),
+            retries=sum(sum(endpoint["retries"].values()) for endpoint in endpoints.values()),
+            failed=sum(endpoint["failed"] for endpoint in endpoints.values()),
+            bytes_received=sum(endpoint["bytes"] for endpoint in endpoints.values()),
+            metrics=json.dumps({"endpoints": endpoints, "stages": stages or {}}),
+        )
+        print(
+            f"Crawl summary {name}: {summary.requests} requests in {duration:.2f} secs, errors: {summary.errors}, "
+            f"retries: {summary.retries}, failed: {summary.failed}"
+        )
+        return summary
+    except Exception as e:
+        print(f"Error in save_crawl_summary: {e}")
+        traceback.print_exc()
+        return None
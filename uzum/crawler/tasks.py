@@ -0,0 +1,153 @@
+import time
+import traceback
+
+from celery import chord
+from celery.signals import worker_process_init
+from django.conf import settings
+
+from config import celery_app
+from uzum.crawler.deadletter import expire_dead_letters, pending_dead_letters
+from uzum.crawler.frontier import (dump_checkpoint, load_checkpoint,
+                                   mark_state, merge_checkpoint,
+                                   save_checkpoint, unfinished_product_ids)
+from uzum.crawler.models import CrawlFrontier, CrawlRun
+from uzum.jobs.constants import DEADLETTER_REPLAY_LIMIT, INGEST_CHUNK_SIZE
+from uzum.jobs.product.pipeline import ingest_products
+from uzum.jobs.telemetry import start_metrics_server, worker_metrics_port
+from uzum.shop.models import ShopAnalytics
+from uzum.utils.general import get_today_pretty
+
+
+@worker_process_init.connect
+def start_worker_metrics_server(**kwargs):
+    """
+    Every prefork worker process serves the metrics of the crawls it runs (discovery, campaigns, reviews,
+    ingest chunks) on CRAWLER_METRICS_PORT plus its pool index, see worker_metrics_port.
+    """
+    if settings.CRAWLER_METRICS_PORT:
+        start_metrics_server(worker_metrics_port(settings.CRAWLER_METRICS_PORT))
+
+
+@celery_app.task(
+    name="ingest_product_chunk",
+    bind=True,
+    acks_late=True,
+    max_retries=2,
+)
+def ingest_product_chunk(self, run_id: int, product_ids: list[int]):
+    """
+    Fetch, prepare and write one shard of the run's product ids on whichever worker picks it up.
+    Progress is checkpointed into the run (see IngestPipeline), a retried or redelivered chunk skips the ids
+    written before. Returns the chunk's aggregation maps (see dump_checkpoint) for merge_product_chunks.
+    """
+    start = time.time()
+    run = CrawlRun.objects.get(pk=run_id)
+    product_ids = unfinished_product_ids(run, product_ids)
+    # shops analysed by chunks that already ran must not get a second row
+    shop_analytics_done = {
+        shop_id: True
+        for shop_id in ShopAnalytics.objects.filter(date_pretty=run.date_pretty).values_list("shop_id", flat=True)
+    }
+    # every category of the day is in the run's checkpoint, so sales are never counted against a missing entry
+    category_sales_map = {}
+    load_checkpoint(run, shop_analytics_done, category_sales_map)
+
+    try:
+        failed_ids = ingest_products(product_ids, shop_analytics_done, category_sales_map, run=run)
+    except Exception:
+        # the pipeline broke, writes are idempotent so the rest of the chunk can simply run again
+        if self.request.retries < self.max_retries:
+            raise self.retry(countdown=60)
+        # back to pending, finish_run closes the run as partial while they are left
+        mark_state(run, unfinished_product_ids(run, product_ids), CrawlFrontier.PENDING)
+        print(f"Giving up on chunk of {len(product_ids)} products, the unwritten ones are pending in run {run_id}")
+        return {"checkpoint": dump_checkpoint(shop_analytics_done, category_sales_map), "failed": 0, "complete": False}
+
+    print(
+        f"Chunk of {len(product_ids)} products ingested in {time.time() - start:.2f} secs, failed: {len(failed_ids)}"
+    )
+    return {
+        "checkpoint": dump_checkpoint(shop_analytics_done, category_sales_map),
+        "failed": len(failed_ids),
+        "complete": True,
+    }
+
+
+@celery_app.task(
+    name="merge_product_chunks",
+)
+def merge_product_chunks(results: list[dict], run_id: int):
+    """
+    Chord callback: merge shop_analytics_done and category_sales_map of every chunk into the run's
+    checkpoint and start the analytics stage.
+    """
+    try:
+        run = CrawlRun.objects.get(pk=run_id)
+        shop_analytics_done = {}
+        category_sales_map = {}
+        for result in results:
+            merge_checkpoint(result["checkpoint"], shop_analytics_done, category_sales_map)
+        # merged into what the chunks and the run before a restart checkpointed already
+        save_checkpoint(run, dump_checkpoint(shop_analytics_done, category_sales_map), [])
+
+        incomplete = sum(1 for result in results if not result["complete"])
+        print(
+            f"Merged {len(results)} chunks of run {run_id} - shops: {len(shop_analytics_done)}, "
+            f"categories: {len(category_sales_map)}, failed: {sum(result['failed'] for result in results)}, "
+            f"incomplete chunks: {incomplete}"
+        )
+    except Exception as e:
+        print(f"Error in merge_product_chunks: {e}")
+        traceback.print_exc()
+
+    celery_app.signature("update_uzum_analytics", args=(run_id,)).delay()
+
+
+def dispatch_product_chunks(run: CrawlRun, product_ids: list[int], chunk_size: int = INGEST_CHUNK_SIZE):
+    """
+    Shard the ingest of `product_ids`, claimed with claim_pending_product_ids, into a chord of chunk tasks
+    that any worker can run, followed by merge_product_chunks.
+    """
+    chunks = [product_ids[i : i + chunk_size] for i in range(0, len(product_ids), chunk_size)]
+    print(f"Dispatching {len(product_ids)} products of run {run.id} as {len(chunks)} chunks")
+    try:
+        return chord(ingest_product_chunk.s(run.id, chunk) for chunk in chunks)(merge_product_chunks.s(run.id))
+    except Exception:
+        # the chord did not go out, a restarted run claims them again
+        mark_state(run, product_ids, CrawlFrontier.PENDING)
+        raise
+
+
+@celery_app.task(
+    name="replay_dead_letters",
+)
+def replay_dead_letters(limit: int = DEADLETTER_REPLAY_LIMIT):
+    """
+    Targeted pass over the products whose fetch failed for good in the nightly run.
+    Recovered products get today's analytics and leave the dead-letter store, failures are recorded again
+    and products that keep answering 404 end up marked dead (see record_failures).
+    """
+    try:
+        start = time.time()
+        expire_dead_letters()
+        product_ids = pending_dead_letters(limit=limit)
+        if not product_ids:
+            print("replay_dead_letters: nothing to replay")
+            return 0
+
+        date_pretty = get_today_pretty()
+        # shops already analysed by the nightly run must not get a second row
+        shop_analytics_done = {
+            shop_id: True
+            for shop_id in ShopAnalytics.objects.filter(date_pretty=date_pretty).values_list("shop_id", flat=True)
+        }
+        failed_ids = ingest_products(product_ids, shop_analytics_done)
+        print(
+            f"replay_dead_letters: {len(product_ids) - len(failed_ids)}/{len(product_ids)} products recovered "
+            f"in {time.time() - start:.2f} secs"
+        )
+        return len(product_ids) - len(failed_ids)
+    except Exception as e:
+        print(f"Error in replay_dead_letters: {e}")
+        traceback.print_exc()
+        return None
@@ -0,0 +1,54 @@
+from uzum.crawler.frontier import dump_checkpoint, merge_checkpoint
+
+
+def test_checkpoint_round_trip():
+    checkpoint = dump_checkpoint(
+        {5: True, 6: True},
+        {10: {"products_with_sales": {1, 2}, "shops_with_sales": {5}}},
+    )
+    shop_analytics_done = {}
+    category_sales_map = {}
+
+    merge_checkpoint(checkpoint, shop_analytics_done, category_sales_map)
+
+    assert shop_analytics_done == {5: True, 6: True}
+    # category ids come back as ints, sales as sets
+    assert category_sales_map == {10: {"products_with_sales": {1, 2}, "shops_with_sales": {5}}}
+
+
+def test_merge_checkpoint_adds_to_existing_maps():
+    checkpoint = dump_checkpoint(
+        {6: True},
+        {
+            10: {"products_with_sales": {2, 3}, "shops_with_sales": {6}},
+            11: {"products_with_sales": {4}, "shops_with_sales": {6}},
+        },
+    )
+    shop_analytics_done = {5: True}
+    category_sales_map = {10: {"products_with_sales": {1, 2}, "shops_with_sales": {5}}}
+
+    merge_checkpoint(checkpoint, shop_analytics_done, category_sales_map)
+
+    assert shop_analytics_done == {5: True, 6: True}
+    assert category_sales_map == {
+        10: {"products_with_sales": {1, 2, 3}, "shops_with_sales": {5, 6}},
+        11: {"products_with_sales": {4}, "shops_with_sales": {6}},
+    }
+
+
+def test_merging_chunk_checkpoints_keeps_every_chunk():
+    # what save_checkpoint does with the stored checkpoint of a run and the one of a finished chunk
+    first = dump_checkpoint({5: True}, {10: {"products_with_sales": {1}, "shops_with_sales": {5}}})
+    second = dump_checkpoint({6: True}, {10: {"products_with_sales": {2}, "shops_with_sales": {6}}})
+    shop_analytics_done = {}
+    category_sales_map = {}
+
+    merge_checkpoint(first, shop_analytics_done, category_sales_map)
+    merge_checkpoint(second, shop_analytics_done, category_sales_map)
+    merged = dump_checkpoint(shop_analytics_done, category_sales_map)
+
+    shop_analytics_done = {}
+    category_sales_map = {}
+    merge_checkpoint(merged, shop_analytics_done, category_sales_map)
+    assert shop_analytics_done == {5: True, 6: True}
+    assert category_sales_map == {10: {"products_with_sales": {1, 2}, "shops_with_sales": {5, 6}}}
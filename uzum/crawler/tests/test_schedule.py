@@ -0,0 +1,26 @@
+from uzum.crawler.schedule import is_repriced
+
+
+def test_card_price_is_compared_with_the_cheapest_sku_in_stock():
+    latest_skus = [
+        {"purchase_price": 900, "available_amount": 0},
+        {"purchase_price": 1000, "available_amount": 3},
+        {"purchase_price": 1200, "available_amount": 1},
+    ]
+    assert not is_repriced(1000, latest_skus)
+    assert not is_repriced("1000.4", latest_skus)
+    assert is_repriced(900, latest_skus)
+
+
+def test_out_of_stock_product_is_compared_with_all_skus():
+    latest_skus = [
+        {"purchase_price": 900, "available_amount": 0},
+        {"purchase_price": 1000, "available_amount": 0},
+    ]
+    assert not is_repriced(900, latest_skus)
+    assert is_repriced(1000, latest_skus)
+
+
+def test_unknown_prices_count_as_unchanged():
+    assert not is_repriced(None, [{"purchase_price": 1000, "available_amount": 1}])
+    assert not is_repriced(1000, [])
@@ -1,20 +1,32 @@
+import time
 from collections import defaultdict
 
+from asgiref.sync import async_to_sync
+from django.utils import timezone
+
+from uzum.crawler.summary import save_crawl_summary
 from uzum.jobs.campaign.multiEntry import create_banners
 from uzum.jobs.campaign.singleEntry import create_campaign
-from uzum.jobs.campaign.utils import (get_campaign_products_ids,
+from uzum.jobs.campaign.utils import (get_campaigns_product_ids,
                                       get_main_page_data, prepare_banners_data)
+from uzum.jobs.telemetry import METRICS
 
 
 def update_or_create_campaigns():
     """
     This function will create or update campaigns.
+    The requests made are stored as a CrawlSummary, see save_crawl_summary.
     """
+    start = time.time()
+    started_at = timezone.now()
+    since = METRICS.snapshot()
+    stages = {}
     try:
         main_content = get_main_page_data()
         product_associations = {}
         shop_associations = {}
         product_campaigns = defaultdict(list)
+        campaigns = defaultdict(list)  # offer category id -> Campaigns listing it
 
         if main_content:
             for content in main_content:
@@ -29,13 +41,20 @@ def update_or_create_campaigns():
                     # banners.append(prepare_banners_data([content]))
 
                 if content["__typename"] == "ExtendableOffer" or content["__typename"] == "CarouselOffer":
-                    product_ids: list = get_campaign_products_ids(content["category"]["id"], content["title"])
-                    print(f"product_ids for {content['title']}: {len(product_ids)}")
                     campaign = create_campaign(content)
-                    for product in product_ids:
-                        product_campaigns[product].append(campaign)
+                    if campaign:
+                        campaigns[content["category"]["id"]].append(campaign)
+
+            # products of all offers are collected concurrently
+            if campaigns:
+                failed = async_to_sync(get_campaigns_product_ids)(campaigns, product_campaigns)
+                stages.update(
+                    {"offers": len(campaigns), "products": len(product_campaigns), "failed_pages": len(failed or [])}
+                )
 
         return product_campaigns, product_associations, shop_associations
     except Exception as e:
         print(f"Error in update_or_create_campaigns: {e}")
         return None
+    finally:
+        save_crawl_summary("campaigns", started_at, time.time() - start, since, stages=stages)
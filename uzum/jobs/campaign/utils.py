@@ -1,25 +1,29 @@
 import asyncio
 import logging
-import math
 import re
 import time
 import traceback
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
-from requests.adapters import HTTPAdapter
 
 from uzum.banner.models import Banner
+from uzum.jobs.concurrency import AdaptiveConcurrency
 from uzum.jobs.constants import (CATEGORIES_HEADER, MAIN_PAGE_PAYLOAD,
                                  MAIN_PAGE_URL, MAX_ID_COUNT, PAGE_SIZE,
-                                 PRODUCTIDS_CONCURRENT_REQUESTS, PRODUCTS_URL)
+                                 PRODUCTIDS_CONCURRENT_REQUESTS,
+                                 PRODUCTIDS_CONCURRENT_REQUESTS_MAX,
+                                 PRODUCTS_URL)
 from uzum.jobs.helpers import generateUUID, get_random_user_agent
+from uzum.jobs.pool import CrawlerPool, close_pool, get_pool
+from uzum.jobs.ratelimit import get_bucket
+from uzum.jobs.retry import RetryQueue, run_with_retries
 
 # Set up a basic configuration for logging
 logging.basicConfig(level=logging.INFO)
 
 # Optionally, disable logging for specific libraries
 logging.getLogger("requests").setLevel(logging.ERROR)
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 
 def campaign_products_payload(offset: int, limit: int, offerCategoryId: str) -> dict:
@@ -75,124 +79,109 @@ def prepare_banners_data(banners_api):
         return None
 
 
-def get_campaign_products_ids(offer_category_id: int, title: str, retry: bool = False):
+async def get_campaigns_product_ids(campaigns: dict, product_campaigns: dict) -> list[dict]:
+    """
+    Collect the products of all offers at once: `campaigns` maps offer category ids to the Campaigns
+    listing them (offers may share a category, its listing is fetched once), and every product found is
+    appended to product_campaigns[product_id] for each of them as its page arrives.
+    Returns the pages that failed for good.
+    """
     try:
-        # has to make parallel requests to get all products
-        session = requests.Session()
-        response = make_request_campaign_product_ids(
-            campaign_products_payload(0, 20, offer_category_id), session=session
+        print(f"Starting get_campaigns_product_ids... {len(campaigns)} offers")
+        start_time = time.time()
+        failed = []
+        # the first page of every offer also tells how many pages follow
+        first_pages = [
+            {"offset": 0, "pageSize": PAGE_SIZE, "offerCategoryId": offer_category_id}
+            for offer_category_id in campaigns
+        ]
+        totals = {}
+        await concurrent_requests_for_campaign_product_ids(first_pages, campaigns, product_campaigns, failed, totals)
+
+        pages = [
+            {"offset": offset, "pageSize": PAGE_SIZE, "offerCategoryId": offer_category_id}
+            for offer_category_id, total in totals.items()
+            for offset in range(PAGE_SIZE, min(MAX_ID_COUNT, total), PAGE_SIZE)
+        ]
+        if pages:
+            await concurrent_requests_for_campaign_product_ids(pages, campaigns, product_campaigns, failed)
+
+        for offer_category_id, total in totals.items():
+            print(f"Offer category {offer_category_id}: {total} products")
+        print(
+            f"get_campaigns_product_ids took {time.time() - start_time:.2f} seconds - "
+            f"pages: {len(first_pages) + len(pages)}, failed: {len(failed)}, products: {len(product_campaigns)}"
         )
-
-        if response.status_code == 200:
-            # time.sleep(3)
-            if "errors" in response.json() or "error" in response.json():
-                print(f"Error in get_campaign_products_ids: {response.json()}")
-                return
-            data = response.json()["data"]["makeSearch"]
-
-            total = data["total"]
-
-            product_ids, failed_ids = concurrent_requests_for_campaign_product_ids(offer_category_id, total)
-        else:
-            print(f"Error in get_campaign_products_ids: {response.status_code}")
-            # give server some time to recover
-            time.sleep(2)
-            if not retry:
-                get_campaign_products_ids(offer_category_id, title, True)
-            return []
-
-        return product_ids
-
+        return failed
     except Exception as e:
-        print(f"Error in get_campaign_products_ids: {e}")
+        print(f"Error in get_campaigns_product_ids: {e}")
+        traceback.print_exc()
         return None
+    finally:
+        await close_pool()
 
 
-def concurrent_requests_for_campaign_product_ids(offer_category_id: int, total: int):
+async def concurrent_requests_for_campaign_product_ids(
+    pages: list[dict], campaigns: dict, product_campaigns: dict, failed: list[dict], totals: dict = None
+):
+    """
+    Fetch offer listing pages over the shared crawler pool, with retries and adaptive concurrency as for
+    product ids. With `totals`, the listing size of each offer is recorded too.
+    """
     try:
-        start_time = time.time()
-        promises = []
-        eligable_total = min(MAX_ID_COUNT, total)
-        num_req = math.ceil(eligable_total / PAGE_SIZE)
-
-        for i in range(num_req):
-            promises.append(
-                {
-                    "offset": i * PAGE_SIZE,
-                    "pageSize": PAGE_SIZE,
-                    "offerCategoryId": offer_category_id,
-                }
-            )
-
-        failed_ids = []
-        product_ids = []
-        last_length = 0
-        index = 0
-        max_connections = 50
-        session = requests.Session()
-        adapter = HTTPAdapter(pool_maxsize=max_connections)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        while index < num_req:
-            if len(product_ids) - last_length > 4000:
-                print("Sleeping for 3 seconds")
-                time.sleep(3)
-                last_length = len(product_ids)
-
-            with ThreadPoolExecutor(max_workers=PRODUCTIDS_CONCURRENT_REQUESTS) as executor:
-                futures = {
-                    executor.submit(
-                        make_request_campaign_product_ids,
-                        campaign_products_payload(
-                            promise["offset"],
-                            promise["pageSize"],
-                            promise["offerCategoryId"],
-                        ),
-                        session=session,
-                    ): promise
-                    for promise in promises[index : index + PRODUCTIDS_CONCURRENT_REQUESTS]
-                }
-                for future in as_completed(futures):
-                    promise = futures[future]
-                    try:
-                        res = future.result()
-                        res_data = res.json()
-                        if "errors" not in res_data:
-                            products = res_data["data"]["makeSearch"]["items"]
-                            for product in products:
-                                product_ids.append(product["catalogCard"]["productId"])
-                        else:
-                            failed_ids.append(promise["offerCategoryId"])
-
-                    except Exception as e:
-                        traceback.print_exc()
-                        print(f"Error in concurrentRequestsForIds inner: {e} - {promise}")
-                        time.sleep(2)
-                        failed_ids.append(promise)
-
-            index += PRODUCTIDS_CONCURRENT_REQUESTS
-
-        print(
-            f"Offer category {offer_category_id} took {time.time() - start_time:.2f} seconds - ",
-            f"Total number of products: {len(product_ids)}/{eligable_total}",
+        pool = get_pool()
+        controller = AdaptiveConcurrency(
+            PRODUCTIDS_CONCURRENT_REQUESTS,
+            max_limit=PRODUCTIDS_CONCURRENT_REQUESTS_MAX,
+            name="campaign product ids",
         )
-        return product_ids, failed_ids
-
+        queue = RetryQueue(pages, name="campaign")
+
+        def handle(page, res):
+            if res.status_code != 200:
+                return res.status_code
+            res_data = res.json()
+            if "errors" in res_data or "error" in res_data:
+                print(f"Error in concurrent_requests_for_campaign_product_ids: {res_data} - {page}")
+                return res.status_code
+            data = res_data["data"]["makeSearch"]
+            if totals is not None:
+                totals[page["offerCategoryId"]] = data["total"]
+            for product in data["items"]:
+                product_campaigns[product["catalogCard"]["productId"]].extend(campaigns[page["offerCategoryId"]])
+            return None
+
+        await run_with_retries(
+            queue,
+            lambda page: make_request_campaign_product_ids(
+                campaign_products_payload(page["offset"], page["pageSize"], page["offerCategoryId"]), pool=pool
+            ),
+            handle,
+            controller,
+        )
+        failed.extend(page for page, _ in queue.failed)
+        if queue.retries or queue.failed:
+            print(f"Retries: {queue.retries}, Failed: {len(queue.failed)}, Reasons: {dict(queue.reasons)}")
     except Exception as e:
         print(f"Error in concurrent_requests_for_campaign_product_ids: {e}")
+        traceback.print_exc()
         return None
 
 
-def make_request_campaign_product_ids(
+async def make_request_campaign_product_ids(
     data,
     retries=3,
     backoff_factor=0.3,
-    session=None,
+    pool: CrawlerPool = None,
 ):
+    pool = pool or get_pool()
+    bucket = get_bucket("campaign")
     for i in range(retries):
         try:
-            return session.post(
+            await bucket.acquire()
+            response = await pool.post(
                 PRODUCTS_URL,
+                endpoint="campaign",
                 json=data,
                 headers={
                     **CATEGORIES_HEADER,
@@ -200,12 +189,14 @@ def make_request_campaign_product_ids(
                     "x-iid": generateUUID(),
                 },
             )
+            bucket.observe(response)
+            return response
         except Exception as e:
             if i == retries - 1:  # This is the last retry, raise the exception
                 raise e
             print(f"Error in makeRequestProductIds (attemp:{i}): ", e)
             sleep_time = backoff_factor * (2**i)
-            time.sleep(sleep_time)
+            await asyncio.sleep(sleep_time)
 
 
 def associate_with_shop_or_product(link: str):
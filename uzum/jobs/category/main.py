@@ -2,8 +2,9 @@ import time
 
 from uzum.jobs.category.MultiEntry import (create_categories,
                                            create_category_analytics_bulk)
-from uzum.jobs.category.utils import (assign_parents, get_categories_tree,
-                                      prepare_categories_for_bulk_create)
+from uzum.jobs.category.utils import (get_categories_tree,
+                                      prepare_categories_for_bulk_create,
+                                      sync_category_tree)
 
 
 def create_and_update_categories():
@@ -24,9 +25,8 @@ def create_and_update_categories():
         )
         if len(new_categories) > 0:
             create_categories(new_categories)
-        # sleep for 3 seconds. Just to make sure that all categories are created
-        time.sleep(3)
-        assign_parents(cat_parents)
+        # parents, ancestors and descendants of the whole tree in one pass
+        sync_category_tree(categories_tree)
         create_category_analytics_bulk(cat_analytics)
 
         print(f"createAndUpdateCategories: {len(new_categories)} new categories created")
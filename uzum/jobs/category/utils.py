@@ -190,18 +190,25 @@ def prepare_categories_for_bulk_create(
 
 def assign_parents(new_cat_parents: list[tuple[int, int]]):
     try:
-        # find both new category and parent category
-        for new_cat_id, parent_cat_id in new_cat_parents:
-            new_cat = Category.objects.get(categoryId=new_cat_id)
-            parent_cat = Category.objects.get(categoryId=parent_cat_id)
+        # parents, ancestors and descendants of the whole tree are recomputed in memory and written at once
+        Category.rebuild_tree(dict(new_cat_parents))
 
-            # assign parent category to new category
-            new_cat.parent = parent_cat
-            new_cat.save()
+    except Exception as e:
+        print(f"Error in assign_parents: {e}")
+        return None
 
-            if parent_cat.title == "Pechlar":
-                print(f"{new_cat.title} - {parent_cat.title}")
 
+def sync_category_tree(tree: list[dict]):
+    """
+    Bring parents, ancestors and descendants of all categories in line with the category tree of the
+    marketplace, see Category.rebuild_tree.
+    """
+    try:
+        parent_ids = {
+            category["category"]["id"]: (category["category"]["parent"] or {}).get("id") for category in tree
+        }
+        return Category.rebuild_tree(parent_ids)
     except Exception as e:
-        print(f"Error in assign_parents: {e}")
+        print(f"Error in sync_category_tree: {e}")
+        traceback.print_exc()
         return None
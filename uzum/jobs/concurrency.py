@@ -0,0 +1,130 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Iterable
+
+import httpx
+
+from uzum.jobs.constants import (CONCURRENCY_BACKOFF_FACTOR,
+                                 CONCURRENCY_LATENCY_TARGET)
+from uzum.jobs.pool import is_challenge
+from uzum.jobs.telemetry import METRICS
+
+# responses that mean the server wants us to slow down
+THROTTLE_STATUS_CODES = (403, 429, 500, 502, 503, 504)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD controller for the number of in-flight requests.
+
+    Every `limit` healthy completions (2xx/404 answered under the latency target) raise the limit
+    by one; a 429, 5xx, Cloudflare challenge or network error cuts it by `backoff_factor`.
+    At most one cut is applied per window, so a burst of failures from requests that were
+    already in flight does not collapse the limit to the minimum.
+
+    Usage:
+        async with controller:
+            response = await pool.get(...)
+            controller.record(response, latency)
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        latency_target: float = CONCURRENCY_LATENCY_TARGET,
+        backoff_factor: float = CONCURRENCY_BACKOFF_FACTOR,
+        name: str = "",
+    ):
+        self.name = name
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff_factor = backoff_factor
+        self.in_flight = 0
+        self.successes = 0
+        self.failures = 0
+        self._healthy_in_window = 0
+        self._completed_since_cut = 0
+        self._condition = asyncio.Condition()
+
+    def __str__(self):
+        return (
+            f"{self.name or 'concurrency'}: limit={int(self.limit)}, in_flight={self.in_flight}, "
+            f"ok={self.successes}, throttled={self.failures}"
+        )
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+        return False
+
+    def is_throttled(self, response: httpx.Response | None) -> bool:
+        if response is None:
+            return True
+        return response.status_code in THROTTLE_STATUS_CODES or is_challenge(response)
+
+    def record(self, response: httpx.Response | None, latency: float):
+        """
+        Feed the outcome of one request into the controller. `response` is None on a network error.
+        """
+        self._completed_since_cut += 1
+        if self.is_throttled(response):
+            self.failures += 1
+            self._decrease()
+            return
+
+        self.successes += 1
+        if latency > self.latency_target:
+            # healthy but slow, hold the current limit
+            return
+        self._healthy_in_window += 1
+        if self._healthy_in_window >= int(self.limit):
+            self._healthy_in_window = 0
+            self.limit = min(self.max_limit, self.limit + 1)
+            METRICS.set_gauge("concurrency_limit", self.name, int(self.limit))
+
+    def _decrease(self):
+        if self._completed_since_cut < int(self.limit):
+            return
+        self._completed_since_cut = 0
+        self._healthy_in_window = 0
+        self.limit = max(self.min_limit, self.limit * self.backoff_factor)
+        METRICS.set_gauge("concurrency_limit", self.name, int(self.limit))
+        print(f"Backing off - {self}")
+
+
+async def run_with_concurrency(
+    items: Iterable,
+    request: Callable[[Any], Awaitable[httpx.Response]],
+    handle: Callable[[Any, Any], None],
+    controller: AdaptiveConcurrency,
+):
+    """
+    Call `request(item)` for every item with at most `controller.limit` requests in flight and pass
+    each result (a response or the raised exception) to `handle(item, result)` as soon as it completes.
+    """
+    iterator = iter(items)
+
+    async def worker():
+        for item in iterator:
+            async with controller:
+                start = time.monotonic()
+                try:
+                    result = await request(item)
+                    controller.record(result, time.monotonic() - start)
+                except Exception as e:
+                    controller.record(None, time.monotonic() - start)
+                    result = e
+            handle(item, result)
+
+    await asyncio.gather(*(worker() for _ in range(controller.max_limit)))
@@ -1,20 +1,91 @@
+import os
+
 from uzum.jobs.helpers import get_random_user_agent
 
 MAX_ID_COUNT = 10_000  # max number of product ids to fetch
 MAX_OFFSET = 9_999  # max offset for fetching product ids
 PAGE_SIZE = 100  # page size for fetching product ids
 MAX_PAGE_SIZE = 100  # max page size for fetching product ids
-PRODUCTIDS_CONCURRENT_REQUESTS = 30  # number of concurrent requests for fetching product ids
-PRODUCT_CONCURRENT_REQUESTS_LIMIT = 4  # number of concurrent requests for fetching product details
+PRODUCTIDS_CONCURRENT_REQUESTS = 30  # initial number of concurrent requests for fetching product ids
+PRODUCTIDS_CONCURRENT_REQUESTS_MAX = 100  # upper bound the adaptive controller may raise it to
+PRODUCTIDS_BATCH_PAGES = 10  # makeSearch pages packed into one GraphQL request, 1 disables batching
+# sort orders a listing that cannot be split by price any further is fetched in, each reaches different items
+LISTING_SORTS = ("BY_RELEVANCE_DESC", "BY_PRICE_ASC", "BY_PRICE_DESC", "BY_ORDERS_NUMBER_DESC", "BY_DATE_ADDED_DESC")
+PRODUCT_CONCURRENT_REQUESTS_LIMIT = 4  # initial number of concurrent requests for fetching product details
+PRODUCT_CONCURRENT_REQUESTS_MAX = 64  # upper bound the adaptive controller may raise it to
+CONCURRENCY_LATENCY_TARGET = 5  # seconds; slower responses stop the controller from raising concurrency
+CONCURRENCY_BACKOFF_FACTOR = 0.5  # multiplicative decrease on 429/5xx/Cloudflare challenges
+RETRY_MAX_ATTEMPTS = 7  # attempts per item before it is given up on
+RETRY_BASE_DELAY = 1  # seconds; base of the jittered exponential backoff between attempts
+RETRY_THROTTLED_BASE_DELAY = 10  # seconds; backoff base after a 429
+RETRY_MAX_DELAY = 120  # seconds; cap on a single backoff delay
 PRODUCT_REVIEWS_SIZE = 500  # number of reviews to fetch for each product
+REVIEWS_CONCURRENT_REQUESTS = 20  # initial number of concurrent requests for fetching reviews
+REVIEWS_CONCURRENT_REQUESTS_MAX = 50  # upper bound the adaptive controller may raise it to
+REVIEWS_CHUNK_SIZE = 5_000  # products whose new reviews are fetched and stored together
+RU_ENRICH_BATCH_SIZE = 5_000  # products whose russian titles are fetched and written together
 PRODUCTS_BUFFER_SIZE = 10000  # number of products to buffer before saving to db
 PRODUCTS_REQUEST_BREAK_INDEX = 10000  # number of products to fetch before sleeping for 10 seconds
+INGEST_BATCH_SIZE = 2000  # products per batch handed between fetch, prepare and write stages
+INGEST_QUEUE_SIZE = 2  # max batches waiting between two ingest stages
+INGEST_CHECKPOINT_EVERY = 5  # batches between two checkpoints of a resumable crawl run
+INGEST_CHUNK_SIZE = 20_000  # product ids per distributed ingest task
+# directory static fields of fetched products are spilled to until their batch is prepared, unset keeps them in memory
+INGEST_SPILL_DIR = os.environ.get("INGEST_SPILL_DIR")
+# worker processes fetched products are decoded and transformed into rows in, 0 does it in the ingest threads
+INGEST_PREPARE_PROCESSES = int(os.environ.get("INGEST_PREPARE_PROCESSES", 0))
+INGEST_PREPARE_CHUNK = 200  # product payloads handed to a prepare worker process at a time
+CRAWL_PRIORITY_WINDOW = 7  # days of ProductAnalytics a product's refresh priority is computed from
+CRAWL_STOCK_WEIGHT = 0.5  # priority per unit of stock movement in the window
+CRAWL_REVIEW_WEIGHT = 2  # priority per new review in the window, real orders count 1 each
+CRAWL_REFRESH_TIERS = ((10, 1), (1, 2), (0, 7))  # (min priority, fetch details every N days), hottest first
+DEADLETTER_NOT_FOUND_LIMIT = 3  # failures in a row ending with a 404 before a dead-lettered product is marked dead
+DEADLETTER_HISTORY = 10  # failures kept in a dead letter's history
+DEADLETTER_RETENTION_DAYS = 30  # days a dead product is skipped before it gets another chance
+DEADLETTER_REPLAY_LIMIT = 50_000  # max dead-lettered products re-driven by one replay
+
+HTTP_POOL_MAX_CONNECTIONS = 100  # max open connections in the shared crawler pool
+HTTP_POOL_MAX_KEEPALIVE = 50  # max idle keep-alive connections kept in the pool
+HTTP_POOL_PER_HOST_LIMIT = 50  # max in-flight requests per host
+HTTP_POOL_KEEPALIVE_EXPIRY = 60  # seconds an idle connection is kept alive
+HTTP_POOL_HTTP2 = True  # use HTTP/2 where the host supports it (requires `h2`)
+HTTP_REQUEST_TIMEOUT = 20  # default request timeout in seconds
+
+# (requests per second, burst) of each crawler endpoint, shared by all coroutines of the process,
+# or by all crawler processes when CRAWLER_REDIS_URL is set. Override live with ratelimit.set_rate_limit
+RATE_LIMITS = {
+    "product_ids": (40, 40),
+    "product_detail": (80, 80),
+    "shop": (20, 20),
+    "campaign": (20, 20),
+    "review": (20, 20),
+}
+RATE_LIMIT_PAUSE = 10  # seconds an endpoint is paused after a 429 without Retry-After
+# host each endpoint is served from; with Redis every request also passes its host's global bucket
+RATE_LIMIT_ENDPOINT_HOSTS = {
+    "product_ids": "graphql.uzum.uz",
+    "product_detail": "api.uzum.uz",
+    "shop": "api.uzum.uz",
+    "campaign": "graphql.uzum.uz",
+    "review": "api.uzum.uz",
+}
+# (requests per second, burst) of each host across all crawler processes
+HOST_RATE_LIMITS = {
+    "api.uzum.uz": (150, 150),
+    "graphql.uzum.uz": (80, 80),
+}
 
-CATEGORIES_URL = "https://graphql.uzum.uz/"
-MAIN_PAGE_URL = "https://graphql.uzum.uz/"
-PRODUCT_URL = "https://api.uzum.uz/api/v2/product/"
-PRODUCTS_URL = "https://graphql.uzum.uz/"
-SELLER_URL = "https://api.uzum.uz/api/shop/"
+# base url of the local Uzum API stand-in (python -m uzum.jobs.standin), e.g. http://127.0.0.1:8765.
+# When set, the crawlers talk to it instead of the live marketplace.
+UZUM_API_STANDIN = os.environ.get("UZUM_API_STANDIN")
+GRAPHQL_URL = f"{UZUM_API_STANDIN}/graphql/" if UZUM_API_STANDIN else "https://graphql.uzum.uz/"
+API_URL = UZUM_API_STANDIN or "https://api.uzum.uz"
+
+CATEGORIES_URL = GRAPHQL_URL
+MAIN_PAGE_URL = GRAPHQL_URL
+PRODUCT_URL = f"{API_URL}/api/v2/product/"
+PRODUCTS_URL = GRAPHQL_URL
+SELLER_URL = f"{API_URL}/api/shop/"
 REVIEWS_URL = "https://api.uzum.uz/api/product/253574/reviews"  # ?amount=10&page=0&hasPhoto=false
 
 
@@ -56,6 +127,9 @@ PRODUCT_HEADER = {
     "x-iid": "25dc2cba-2d8e-4192-bac7-8f0df42cbdd5",
 }
 
+# product details with russian titles
+PRODUCT_HEADER_RU = {**PRODUCT_HEADER, "Accept-Language": "ru-RU"}
+
 
 SELLER_HEADERS = {
     "Access-Control-Allow-Credentials": "true",
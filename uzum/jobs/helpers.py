@@ -38,30 +38,107 @@ def generateUUID():
     return uuid
 
 
-def getReviewsUrl(productId: str, pageSize: int, page: int) -> str:
-    return f"https://api.uzum.uz/api/product/{int(productId)}/reviews?amount={pageSize}&page={page}"
+def getReviewsUrl(productId: str, pageSize: int, page: int, base_url: str = "https://api.uzum.uz") -> str:
+    return f"{base_url}/api/product/{int(productId)}/reviews?amount={pageSize}&page={page}"
+
+
+# listing-level numbers of a product, see uzum.crawler.schedule
+CARD_FIELDS = "productId ordersQuantity feedbackQuantity rating minSellPrice"
 
 
 def products_payload(
-    offset: int, limit: int, categoryId: str, showAdultContent: str = "TRUE", is_ru: bool = False
+    offset: int,
+    limit: int,
+    categoryId: str,
+    showAdultContent: str = "TRUE",
+    is_ru: bool = False,
+    filters: list[dict] = None,
+    sort: str = "BY_RELEVANCE_DESC",
+    with_cards: bool = False,
 ) -> dict:
     return {
         "operationName": "getMakeSearch",
-        "query": "query getMakeSearch( $queryInput: MakeSearchQueryInput!) {makeSearch(query: $queryInput) {items { catalogCard { productId } } } }"
+        "query": "query getMakeSearch( $queryInput: MakeSearchQueryInput!) "
+        + "{makeSearch(query: $queryInput) {items { catalogCard { "
+        + (CARD_FIELDS if with_cards else "productId")
+        + " } } } }"
         if not is_ru
         else "query getMakeSearch($queryInput: MakeSearchQueryInput!) { makeSearch(query: $queryInput) { items { catalogCard { ...SkuGroupCardFragment } } } } fragment SkuGroupCardFragment on SkuGroupCard { productId title characteristicValues { id value title characteristic { values { id title value } title id } } }",
         "variables": {
             "queryInput": {
                 "categoryId": categoryId,
-                "filters": [],
+                "filters": filters or [],
                 "pagination": {"offset": offset, "limit": limit},
                 "showAdultContent": showAdultContent,
+                "sort": sort,
+            }
+        },
+    }
+
+
+def batched_products_payload(
+    pages: list[dict], showAdultContent: str = "TRUE", is_ru: bool = False, with_cards: bool = False
+) -> dict:
+    """
+    One GraphQL document with a makeSearch field per page, aliased p0, p1, ... in the order of `pages`.
+    Each page is a dict with categoryId, offset, pageSize and optionally the filters and sort of its slice.
+    """
+    selection = (
+        "items { catalogCard { " + (CARD_FIELDS if with_cards else "productId") + " } }"
+        if not is_ru
+        else "items { catalogCard { ...SkuGroupCardFragment } }"
+    )
+    variables = ", ".join(f"$q{i}: MakeSearchQueryInput!" for i in range(len(pages)))
+    fields = " ".join(f"p{i}: makeSearch(query: $q{i}) {{ {selection} }}" for i in range(len(pages)))
+    fragment = (
+        ""
+        if not is_ru
+        else " fragment SkuGroupCardFragment on SkuGroupCard { productId title characteristicValues "
+        "{ id value title characteristic { values { id title value } title id } } }"
+    )
+    return {
+        "operationName": "getMakeSearchBatch",
+        "query": f"query getMakeSearchBatch({variables}) {{ {fields} }}{fragment}",
+        "variables": {
+            f"q{i}": {
+                "categoryId": page["categoryId"],
+                "filters": page.get("filters") or [],
+                "pagination": {"offset": page["offset"], "limit": page["pageSize"]},
+                "showAdultContent": showAdultContent,
+                "sort": page.get("sort") or "BY_RELEVANCE_DESC",
+            }
+            for i, page in enumerate(pages)
+        },
+    }
+
+
+def listing_count_payload(categoryId: str, filters: list[dict] = None, showAdultContent: str = "TRUE") -> dict:
+    """
+    makeSearch without items, for the size of a (filtered) listing and its facets.
+    """
+    return {
+        "operationName": "getMakeSearchTotal",
+        "query": "query getMakeSearchTotal($queryInput: MakeSearchQueryInput!) { makeSearch(query: $queryInput) "
+        "{ total facets { filter { id type } range { min max } } } }",
+        "variables": {
+            "queryInput": {
+                "categoryId": categoryId,
+                "filters": filters or [],
+                "pagination": {"offset": 0, "limit": 0},
+                "showAdultContent": showAdultContent,
                 "sort": "BY_RELEVANCE_DESC",
             }
         },
     }
 
 
+def price_filter(filter_id, min_price: int, max_price: int) -> dict:
+    """
+    makeSearch filter input for a price range facet, bounds inclusive.
+    """
+    return {"id": filter_id, "range": {"min": min_price, "max": max_price}}
+
+
 def products_title_ru_payload(offset: int, limit: int, categoryId: str, showAdultContent: str = "TRUE") -> dict:
     return {
         "operationName": "getMakeSearch",
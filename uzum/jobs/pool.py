@@ -0,0 +1,182 @@
+import asyncio
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import cloudscraper
+import httpx
+
+from uzum.jobs.constants import (HTTP_POOL_HTTP2, HTTP_POOL_KEEPALIVE_EXPIRY,
+                                 HTTP_POOL_MAX_CONNECTIONS,
+                                 HTTP_POOL_MAX_KEEPALIVE,
+                                 HTTP_POOL_PER_HOST_LIMIT,
+                                 HTTP_REQUEST_TIMEOUT)
+from uzum.jobs.telemetry import METRICS
+
+# Cloudflare answers a challenge with one of these statuses
+CHALLENGE_STATUS_CODES = (403, 503)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def is_challenge(response: httpx.Response) -> bool:
+    """
+    True if the response is a Cloudflare challenge page rather than a real answer.
+    """
+    if response.status_code not in CHALLENGE_STATUS_CODES:
+        return False
+    if response.headers.get("cf-mitigated") == "challenge":
+        return True
+    return "cloudflare" in response.headers.get("server", "").lower() and "challenge" in response.text.lower()
+
+
+class CookieJar:
+    """
+    Cloudflare clearance cookies shared by every pool in the process.
+
+    Cookies are negotiated through cloudscraper once and then only refreshed when a response
+    comes back as a challenge, so they survive across event loops (each async_to_sync call runs
+    in its own loop).
+    """
+
+    def __init__(self):
+        self.cookies = httpx.Cookies()
+        self.user_agent = None
+        self.version = 0
+
+    def refresh(self, url: str):
+        scraper = cloudscraper.create_scraper(browser={"browser": "chrome", "platform": "windows", "mobile": False})
+        scraper.get(url, timeout=HTTP_REQUEST_TIMEOUT)
+        cookies = httpx.Cookies()
+        for cookie in scraper.cookies:
+            cookies.set(cookie.name, cookie.value, domain=cookie.domain, path=cookie.path)
+        self.cookies = cookies
+        self.user_agent = scraper.headers["User-Agent"]
+        self.version += 1
+
+
+COOKIE_JAR = CookieJar()
+
+
+class CrawlerPool:
+    """
+    Long-lived keep-alive connection pool used by all crawler coroutines of one event loop.
+
+    Wraps a single httpx.AsyncClient (HTTP/2 when `h2` is installed and the host negotiates it),
+    caps in-flight requests per host and re-negotiates the Cloudflare cookies only on a challenge.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = HTTP_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections: int = HTTP_POOL_MAX_KEEPALIVE,
+        per_host_limit: int = HTTP_POOL_PER_HOST_LIMIT,
+        keepalive_expiry: float = HTTP_POOL_KEEPALIVE_EXPIRY,
+        http2: bool = HTTP_POOL_HTTP2,
+        cookie_jar: CookieJar = COOKIE_JAR,
+    ):
+        self.per_host_limit = per_host_limit
+        self.cookie_jar = cookie_jar
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            http2=http2 and _http2_available(),
+            timeout=HTTP_REQUEST_TIMEOUT,
+        )
+        self._cookies_version = -1
+        self._host_semaphores: dict[str, asyncio.Semaphore] = {}
+        self._refresh_lock = asyncio.Lock()
+
+    @property
+    def user_agent(self):
+        return self.cookie_jar.user_agent
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(str(url)).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_semaphores[host]
+
+    def _sync_cookies(self):
+        if self._cookies_version != self.cookie_jar.version:
+            self.client.cookies = self.cookie_jar.cookies
+            self._cookies_version = self.cookie_jar.version
+
+    async def refresh_cookies(self, url: str, seen_version: int):
+        async with self._refresh_lock:
+            # another coroutine may have already solved the challenge while we waited
+            if self.cookie_jar.version == seen_version:
+                print(f"Cloudflare challenge on {url}, refreshing cookies...")
+                await asyncio.to_thread(self.cookie_jar.refresh, url)
+            self._sync_cookies()
+
+    async def request(
+        self, method: str, url: str, headers: dict = None, endpoint: str = None, **kwargs
+    ) -> httpx.Response:
+        """
+        `endpoint` names the request in the crawler metrics, the host is used if it is not given.
+        """
+        headers = dict(headers or {})
+        endpoint = endpoint or urlsplit(str(url)).netloc
+        for attempt in range(2):
+            self._sync_cookies()
+            seen_version = self.cookie_jar.version
+            if self.user_agent:
+                headers["User-Agent"] = self.user_agent
+            async with self._host_semaphore(url):
+                start = time.monotonic()
+                try:
+                    response = await self.client.request(method, url, headers=headers, **kwargs)
+                except Exception as e:
+                    METRICS.observe_error(endpoint, e, time.monotonic() - start)
+                    raise
+                METRICS.observe_response(
+                    endpoint, response.status_code, time.monotonic() - start, len(response.content)
+                )
+            if attempt == 0 and is_challenge(response):
+                await self.refresh_cookies(url, seen_version)
+                continue
+            return response
+        return response
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, CrawlerPool]" = weakref.WeakKeyDictionary()
+
+
+def get_pool() -> CrawlerPool:
+    """
+    Return the crawler pool of the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = CrawlerPool()
+        _pools[loop] = pool
+    return pool
+
+
+async def close_pool():
+    """
+    Close the pool of the running event loop. Call once at the end of a top-level crawl.
+    """
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.aclose()
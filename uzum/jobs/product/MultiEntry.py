@@ -1,17 +1,23 @@
 import time
 import traceback
+from collections import defaultdict
 
 from uzum.badge.models import Badge
-from uzum.jobs.product.create_products import prepareProductData
+from uzum.category.models import Category
+from uzum.jobs.product.create_products import (load_batch_lookups,
+                                               prepareProductData)
+from uzum.jobs.product.records import transform_batch
 from uzum.jobs.seller.MultiEntry import create_shop_analytics_bulk
 from uzum.jobs.sku.MultiEntry import (create_sku_analytics_bulk,
                                       create_skus_bulk)
 from uzum.product.models import (LatestProductAnalyticsView, Product,
                                  ProductAnalytics)
 from uzum.shop.models import Shop
+from uzum.sku.models import Sku
+from uzum.utils.bulk_copy import copy_insert
 
 
-def create_products_bulk(products):
+def create_products_bulk(products, raise_errors: bool = False):
     try:
         result = Product.objects.bulk_create(products, ignore_conflicts=True)
         print(f"createProductsBulk: {len(result)} objects inserted, {len(products) - len(result)} objects skipped")
@@ -20,163 +26,237 @@ def create_products_bulk(products):
 
     except Exception as e:
         print(f"Error in createProductsBulk: {e}")
+        if raise_errors:
+            raise
         return None
 
 
-def create_product_analytics_bulk(analytics):
+def create_product_analytics_bulk(analytics: list[dict], raise_errors: bool = False):
     try:
-        result = ProductAnalytics.objects.bulk_create(analytics, ignore_conflicts=True)
-        print(f"createProductAnalyticsBulk: {len(result)} inserted, {len(analytics) - len(result)} skipped")
-        return {analytic.product.product_id: analytic for analytic in result}
+        rows = [row for row in analytics if row]
+        result = copy_insert(ProductAnalytics, rows, unique_on=("product_id", "date_pretty"))
+        print(f"createProductAnalyticsBulk: {result} inserted, {len(analytics) - result} skipped")
+        return result
 
     except Exception as e:
         print(f"Error in createProductAnalyticsBulk: {e}")
+        if raise_errors:
+            raise
         return None
 
 
-def create_products_from_api(
+def update_modified_bulk(model, modified: dict, batch_size: int = 1000, raise_errors: bool = False):
+    """
+    Flush rows collected by record_modified ({pk: (obj, changed_fields)}), one bulk_update
+    per distinct set of changed fields so each UPDATE only rewrites the columns that changed.
+    """
+    try:
+        groups = defaultdict(list)
+        for obj, fields in modified.values():
+            groups[tuple(sorted(fields))].append(obj)
+
+        for fields, objs in groups.items():
+            model.objects.bulk_update(objs, fields, batch_size=batch_size)
+        print(f"updateModifiedBulk: {len(modified)} {model.__name__} rows updated in {len(groups)} groups")
+    except Exception as e:
+        print(f"Error in updateModifiedBulk: {e}")
+        traceback.print_exc()
+        if raise_errors:
+            raise
+        return None
+
+
+def load_prepare_context():
+    """
+    Load the lookups prepareProductData needs. Loaded once per run and shared across batches.
+    """
+    shops = Shop.objects.values_list("seller_id", "link", "title")
+    latest_product_analytics = LatestProductAnalyticsView.objects.values(
+        "product_id", "latest_orders_money", "latest_orders_amount"
+    )
+    badges_ = Badge.objects.all()
+
+    return {
+        "shop_links_and_titles": {seller_id: [link, title] for seller_id, link, title in shops},
+        "shops_dict": {seller_id: seller_id for seller_id, _, _ in shops},
+        "latest_product_analytics_dict": {item["product_id"]: item for item in latest_product_analytics},
+        "badges_dict": {badge.badge_id: badge for badge in badges_},
+    }
+
+
+def prepare_products_batch(
     produts_api: list[dict],
-    product_campaigns: dict = None,
+    context: dict,
     shop_analytics_done: dict = None,
     category_sales_map: dict = None,
+    processes: int = 0,
 ):
-    try:
-        print("Starting createProductsFromApi...")
-        start_1 = time.time()
-        products_data = []
-        products_analytics = []
-        product_skus = []
-        product_skus_analytics = []
-        shops_analytics = []
-        shops_list = []
-
-        shops = Shop.objects.all()
-        shop_links_and_titles = {shop.seller_id: [shop.link, shop.title] for shop in shops}
-        shops_dict = {shop.seller_id: shop for shop in shops}
-        latest_product_analytics = LatestProductAnalyticsView.objects.values(
-            "product_id", "latest_orders_money", "latest_orders_amount"
+    """
+    Turn a batch of product payloads into unsaved model instances ready for write_products_batch.
+
+    The payloads (see records.prepare_payloads) are transformed into rows in `processes` worker processes,
+    or in this thread with 0, then resolved against the database one by one.
+    """
+    start = time.time()
+    prepared = {
+        "products_data": [],
+        "products_analytics": [],
+        "product_skus": [],
+        "product_skus_analytics": [],
+        "shops_analytics": [],
+        "shops_list": [],
+        "badges_to_set": {},
+        "modified": {"products": {}, "skus": {}},
+    }
+    shop_analytics_track = {}
+    # existing rows referenced by the batch, a handful of IN queries instead of several per product
+    product_ids = [product[0] if isinstance(product, tuple) else product["id"] for product in produts_api]
+    lookups = load_batch_lookups(product_ids)
+    latest_product_analytics_dict = context["latest_product_analytics_dict"]
+    lookups["analytics"] = {
+        product_id: latest_product_analytics_dict[product_id]
+        for product_id in product_ids
+        if product_id in latest_product_analytics_dict
+    }
+
+    print("Starting to prepare data...")
+    rows = transform_batch(produts_api, lookups, processes)
+    category_ids = {row["category"]["id"] for row in rows} | {row["category"]["parent_id"] for row in rows}
+    categories = Category.objects.in_bulk(category_ids - {None})
+
+    for row in rows:
+        result = prepareProductData(
+            row=row,
+            shop_analytics_track=shop_analytics_track,
+            shops_dict=context["shops_dict"],
+            badges_dict=context["badges_dict"],
+            shop_analytics_done=shop_analytics_done,
+            category_sales_map=category_sales_map,
+            shop_links_and_titles=context["shop_links_and_titles"],
+            categories=categories,
+            modified=prepared["modified"],
         )
+        if result is None:
+            # the error is printed by prepareProductData, only this product is left out of the batch
+            print(f"Skipping product {row['id']}")
+            continue
+        product_data, product_analytic, sku_list, sku_list_analytics, shop_analytics, shop, badges = result
+
+        prepared["products_analytics"].append(product_analytic)
+        prepared["product_skus_analytics"].extend(sku_list_analytics)
+        if len(badges) > 0:
+            prepared["badges_to_set"][row["id"]] = badges
+
+        if shop_analytics:
+            prepared["shops_analytics"].append(shop_analytics)
+        if shop:
+            prepared["shops_list"].append(shop)
+
+        if product_data:
+            prepared["products_data"].append(product_data)
+
+        if sku_list:
+            prepared["product_skus"].extend(sku_list)
+
+    print(f"Time taken to prepare data: {time.time() - start:.2f} secs")
+    return prepared
 
-        latest_product_analytics_dict = {item["product_id"]: item for item in latest_product_analytics}
-
-        badges_ = Badge.objects.all()
-        badges_dict = {badge.badge_id: badge for badge in badges_}
-
-        badges_to_set = {}
-        total_new_products = 0
-        total_new_skus = [0, 0]
-        shop_analytics_track = {}
-
-        print("Starting to prepare data...")
-        for product in produts_api:
-            (
-                product_data,
-                product_analytic,
-                sku_list,
-                sku_list_analytics,
-                shop_analytics,
-                shop,
-                badges,
-            ) = prepareProductData(
-                product_api=product,
-                shop_analytics_track=shop_analytics_track,
-                shops_dict=shops_dict,
-                badges_dict=badges_dict,
-                shop_analytics_done=shop_analytics_done,
-                current_analytic=latest_product_analytics_dict.get(product["id"], None),
-                category_sales_map=category_sales_map,
-                shop_links_and_titles=shop_links_and_titles,
-            )
-
-            products_analytics.append(product_analytic)
-            product_skus_analytics.extend(sku_list_analytics)
-            if len(badges) > 0:
-                badges_to_set[product["id"]] = badges
-
-            if shop_analytics:
-                shops_analytics.append(shop_analytics)
-            if shop:
-                shops_list.append(shop)
-
-            if product_data:
-                products_data.append(product_data)
-                total_new_products += 1
-
-            if sku_list:
-                product_skus.extend(sku_list)
-                total_new_skus[0] += len(sku_list)
-                total_new_skus[1] += 1
-
-        if len(shops_list) > 0:
-            print(f"Creating shops... - {len(shops_list)}")
-            start = time.time()
-            Shop.objects.bulk_create(shops_list, ignore_conflicts=True)
-            end = time.time()
-            print(f"Time taken to create shops: {end - start:.2f} secs")
-
-        if len(products_data) > 0:
-            print(f"Creating products... - {len(products_data)}")
-            start = time.time()
-            result = create_products_bulk(products_data)
-            end = time.time()
-            print(f"Time taken to create products: {end - start:.2f} secs")
-            time.sleep(1)
-        if len(product_skus) > 0:
-            start = time.time()
-            print(f"Creating skus... - {len(product_skus)}")
-            create_skus_bulk(product_skus)
-            end = time.time()
-            print(f"Time taken to create skus: {end - start:.2f} secs")
-            time.sleep(1)
-
-        print(f"Creating product analytics... - {len(products_analytics)}")
+
+def write_products_batch(prepared: dict, raise_errors: bool = False):
+    """
+    Bulk insert everything prepare_products_batch produced for one batch.
+    With `raise_errors`, a failed insert is raised instead of printed, so a caller writing the batch
+    in a transaction learns it was rolled back.
+    """
+    shops_list = prepared["shops_list"]
+    products_data = prepared["products_data"]
+    product_skus = prepared["product_skus"]
+    products_analytics = prepared["products_analytics"]
+    product_skus_analytics = prepared["product_skus_analytics"]
+    shops_analytics = prepared["shops_analytics"]
+
+    if len(shops_list) > 0:
+        print(f"Creating shops... - {len(shops_list)}")
+        start = time.time()
+        Shop.objects.bulk_create(shops_list, ignore_conflicts=True)
+        end = time.time()
+        print(f"Time taken to create shops: {end - start:.2f} secs")
+
+    if len(products_data) > 0:
+        print(f"Creating products... - {len(products_data)}")
         start = time.time()
-        result = create_product_analytics_bulk(products_analytics)
-        # if product_campaigns:
-        #     print("Setting campaigns...")
-        #     campaign_start = time.time()
-        #     for product_id, campaigns in product_campaigns.items():
-        #         if product_id in product_campaigns and len(campaigns) > 0:
-        #             temp = result.get(product_id)
-        #             if temp:
-        #                 temp.campaigns.set(campaigns)
-        #                 temp.save()
-        #     print(f"Time taken to set campaigns: {time.time() - campaign_start:.2f} secs")
-        # if badges_to_set:
-        #     print("Setting badges...")
-        #     badge_start = time.time()
-        #     for product_id, badges in badges_to_set.items():
-        #         temp = result.get(product_id, None)
-        #         if temp:
-        #             temp.badges.set(badges)
-        #             temp.save()
-        #     print(f"Time taken to set badges: {time.time() - badge_start:.2f} secs")
+        create_products_bulk(products_data, raise_errors)
         end = time.time()
-        print(f"Time taken to create product analytics: {end - start:.2f} secs")
+        print(f"Time taken to create products: {end - start:.2f} secs")
+    if len(product_skus) > 0:
+        start = time.time()
+        print(f"Creating skus... - {len(product_skus)}")
+        create_skus_bulk(product_skus, raise_errors)
+        end = time.time()
+        print(f"Time taken to create skus: {end - start:.2f} secs")
+
+    modified = prepared["modified"]
+    if modified["products"] or modified["skus"]:
+        start = time.time()
+        print(f"Updating changed products... - {len(modified['products'])}, skus... - {len(modified['skus'])}")
+        update_modified_bulk(Product, modified["products"], raise_errors=raise_errors)
+        update_modified_bulk(Sku, modified["skus"], raise_errors=raise_errors)
+        print(f"Time taken to update changed products and skus: {time.time() - start:.2f} secs")
+
+    print(f"Creating product analytics... - {len(products_analytics)}")
+    start = time.time()
+    create_product_analytics_bulk(products_analytics, raise_errors)
+    # if product_campaigns:
+    #     print("Setting campaigns...")
+    #     campaign_start = time.time()
+    #     for product_id, campaigns in product_campaigns.items():
+    #         if product_id in product_campaigns and len(campaigns) > 0:
+    #             temp = result.get(product_id)
+    #             if temp:
+    #                 temp.campaigns.set(campaigns)
+    #                 temp.save()
+    #     print(f"Time taken to set campaigns: {time.time() - campaign_start:.2f} secs")
+    # if badges_to_set:
+    #     print("Setting badges...")
+    #     badge_start = time.time()
+    #     for product_id, badges in badges_to_set.items():
+    #         temp = result.get(product_id, None)
+    #         if temp:
+    #             temp.badges.set(badges)
+    #             temp.save()
+    #     print(f"Time taken to set badges: {time.time() - badge_start:.2f} secs")
+    end = time.time()
+    print(f"Time taken to create product analytics: {end - start:.2f} secs")
+
+    print(f"Creating sku analytics... - {len(product_skus_analytics)}")
+    create_sku_analytics_bulk(product_skus_analytics, raise_errors)
+    end_2 = time.time()
+    print(f"Time taken to create sku analytics: {end_2 - end:.2f} secs")
 
-        print(f"Creating sku analytics... - {len(product_skus_analytics)}")
-        create_sku_analytics_bulk(product_skus_analytics)
-        end_2 = time.time()
-        print(f"Time taken to create sku analytics: {end_2 - end:.2f} secs")
+    print(f"Creating shop analytics... - {len(shops_analytics)}")
+    create_shop_analytics_bulk(shops_analytics, raise_errors)
+    end_3 = time.time()
+    print(f"Time taken to create shop analytics: {end_3 - end_2:.2f} secs")
+
+
+def create_products_from_api(
+    produts_api: list[dict],
+    product_campaigns: dict = None,
+    shop_analytics_done: dict = None,
+    category_sales_map: dict = None,
+):
+    try:
+        print("Starting createProductsFromApi...")
+        start_1 = time.time()
 
-        print(f"Creating shop analytics... - {len(shops_analytics)}")
-        create_shop_analytics_bulk(shops_analytics)
-        end_3 = time.time()
-        print(f"Time taken to create shop analytics: {end_3 - end_2:.2f} secs")
+        context = load_prepare_context()
+        prepared = prepare_products_batch(produts_api, context, shop_analytics_done, category_sales_map)
+        write_products_batch(prepared)
 
         print(f"create_products_from_api completed - {time.time() - start_1:.2f} secs")
 
-        del products_data
-        del products_analytics
-        del product_skus
-        del product_skus_analytics
-        del shops_analytics
-        del shops_list
-        del shops_dict
-        del badges_dict
-        del badges_to_set
-        del total_new_skus
-        del shop_analytics_track
+        del prepared
+        del context
 
     except Exception as e:
         print(f"Error in createProductsFromApi: {e}")
@@ -1,17 +1,26 @@
 import asyncio
+import json
 import logging
 import time
 import cloudscraper
 
-import httpx
 import requests
+from asgiref.sync import sync_to_async
 from requests import Session
 from requests.adapters import HTTPAdapter
 from urllib3.util import Retry
 
-from uzum.jobs.constants import (PRODUCT_CONCURRENT_REQUESTS_LIMIT,
+from uzum.crawler.deadletter import record_failures, resolve_dead_letters
+from uzum.jobs.concurrency import AdaptiveConcurrency
+from uzum.jobs.constants import (HTTP_REQUEST_TIMEOUT,
+                                 PRODUCT_CONCURRENT_REQUESTS_LIMIT,
+                                 PRODUCT_CONCURRENT_REQUESTS_MAX,
                                  PRODUCT_HEADER, PRODUCT_URL)
 from uzum.jobs.helpers import generateUUID, get_random_user_agent
+from uzum.jobs.pool import CrawlerPool, close_pool, get_pool
+from uzum.jobs.product.records import PayloadSpill, ProductRecord
+from uzum.jobs.ratelimit import get_bucket
+from uzum.jobs.retry import RetryQueue, run_with_retries
 
 # Set up a basic configuration for logging
 logging.basicConfig(level=logging.INFO)
@@ -20,150 +29,136 @@ logging.basicConfig(level=logging.INFO)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 
-async def get_product_details_via_ids(product_ids: list[int], products_api: list[dict]):
+async def get_product_details_via_ids(product_ids: list[int], products_api: list[dict], spill: PayloadSpill = None):
     try:
         print("Starting get_product_details_via_ids...")
         start_time = time.time()
         failed_ids = []
+        failures = []
 
-        await concurrent_requests_product_details(product_ids, failed_ids, 0, products_api)
+        # failed ids are retried with backoff inside, only permanent failures come back
+        await concurrent_requests_product_details(product_ids, failed_ids, 0, products_api, spill, failures=failures)
 
-        if len(failed_ids) > 0:
-            failed_again_ids = []
-            print(f"Failed Ids length: {len(failed_ids)}")
-            await concurrent_requests_product_details(failed_ids, failed_again_ids, 0, products_api)
-
-            if len(failed_again_ids) > 0:
-                failed_failed = []
-                print(f"Failed again Ids length: {len(failed_again_ids)}")
-                await concurrent_requests_product_details(failed_again_ids, failed_failed, 0, products_api)
-
-                if len(failed_failed) > 0:
-                    final_failed = []
-                    print(
-                        f"Failed failed Ids length: {len(failed_failed)}",
-                    )
-                    await concurrent_requests_product_details(failed_failed, final_failed, 0, products_api)
-
-                    if len(final_failed) > 0:
-                        ff_failed = []
-                        await concurrent_requests_product_details(final_failed, ff_failed, 0, products_api)
-
-                        print(f"Total number of failed product ids: {len(ff_failed)}")
-                        print(f"Failed failed Ids: {ff_failed}")
-
-                        if len(ff_failed) > 0:
-                            fff_failed = []
-                            await concurrent_requests_product_details(ff_failed, fff_failed, 0, products_api)
-
-                            print(f"Total number of failed product ids: {len(fff_failed)}")
-                            print(f"Failed failed Ids: {fff_failed}")
-
-                            if len(fff_failed) > 0:
-                                ffff_failed = []
-                                await concurrent_requests_product_details(fff_failed, ffff_failed, 0, products_api)
-
-                                print(f"Total number of failed product ids: {len(ffff_failed)}")
-                                print(f"Failed failed Ids: {ffff_failed}")
+        # permanent failures go to the dead-letter store for replay_dead_letters, fetched ones leave it
+        await sync_to_async(record_failures)(failures)
+        failed = set(failed_ids)
+        await sync_to_async(resolve_dead_letters)([_id for _id in product_ids if _id not in failed])
 
+        print(f"Total number of failed product ids: {len(failed_ids)}")
         print(f"Total number of products: {len(products_api)}")
         print(f"Total time taken by get_product_details_via_ids: {time.time() - start_time}")
         print("Ending get_product_details_via_ids...\n\n")
     except Exception as e:
         print("Error in getProductDetailsViaId: ", e)
         return None
+    finally:
+        await close_pool()
 
 
 async def concurrent_requests_product_details(
-    product_ids: list[int], failed_ids: list[int], index: int, products_api: list[dict]
+    product_ids: list[int],
+    failed_ids: list[int],
+    index: int,
+    products_api: list[dict],
+    spill: PayloadSpill = None,
+    raw: bool = False,
+    failures: list = None,
 ):
+    """
+    Fetch product details into `products_api` as ProductRecords, which keep only what the ingest reads.
+    With a `spill`, their static fields are moved to it instead of kept in memory.
+    With `raw`, (id, response body) pairs are kept unparsed for records.transform_batch.
+    Permanently failed ids go to `failed_ids`, and with `failures` also as (id, last reason, attempts).
+    """
     try:
-        errors = {}
-        index = 0
         start_time = time.time()
         last_length = len(products_api)
         print(f"Starting concurrent_requests_product_details... {len(product_ids)}")
-        async with httpx.AsyncClient() as client:
-            while index < len(product_ids):
-                # update the client, cut the session and create a new one
-                # client = httpx.AsyncClient()
-                if len(products_api) - last_length >= 1000:
-                    string_to_show = f"Fetched: {len(products_api) - last_length}, Failed: {len(failed_ids)}"
-                    print(
-                        f"Current: {index}/ {len(product_ids)} - {time.time() - start_time:.2f} secs - {string_to_show}"
-                    )
-                    last_length = len(products_api)
-                    start_time = time.time()
-                    time.sleep(2)
-
-                tasks = [
-                    make_request_product_detail(
-                        PRODUCT_URL + str(id),
-                        client=client,
-                    )
-                    for id in product_ids[index : index + PRODUCT_CONCURRENT_REQUESTS_LIMIT]
-                ]
-
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-
-                for idx, res in enumerate(results):
-                    if isinstance(res, Exception):
-                        failed_ids.append(product_ids[index + idx])
-                    else:
-                        if res.status_code != 200:
-                            _id = product_ids[index + idx]
-                            failed_ids.append(product_ids[index + idx])
-                            # print(f"Failed request for product {_id} - {res.status_code}")
-                            if res.status_code not in errors:
-                                errors[res.status_code] = []
-                            errors[res.status_code].append(_id)
-                            continue
-
-                        res_data = res.json()
-                        if "errors" not in res_data:
-                            products_api.append(res_data["payload"]["data"])
-                        else:
-                            failed_ids.append(product_ids[index + idx])
-
-                del results
-                del tasks
-                index += PRODUCT_CONCURRENT_REQUESTS_LIMIT
-        print(errors)
-        for key, value in errors.items():
-            print(f"Status code: {key}, Count: {len(value)}")
+        pool = get_pool()
+        controller = AdaptiveConcurrency(
+            PRODUCT_CONCURRENT_REQUESTS_LIMIT,
+            max_limit=PRODUCT_CONCURRENT_REQUESTS_MAX,
+            name="product details",
+        )
+        queue = RetryQueue(product_ids, name="product_detail")
+        sellers = {}  # one seller payload per shop
+
+        def handle(_id, res):
+            if res.status_code != 200:
+                return res.status_code
+            if raw:
+                content = res.content
+                # only parsed here when it may be an error answer
+                if b'"errors"' in content and "errors" in json.loads(content):
+                    return res.status_code
+                products_api.append((_id, content))
+                return report()
+            res_data = res.json()
+            if "errors" in res_data:
+                return res.status_code
+            try:
+                products_api.append(ProductRecord(res_data["payload"]["data"], spill, sellers))
+            except Exception as e:
+                # unexpected shape, the raw payload still goes through the ingest
+                print(f"Error in parsing product {_id}: {e}")
+                products_api.append(res_data["payload"]["data"])
+            del res_data
+            return report()
+
+        def report():
+            nonlocal last_length, start_time
+            if len(products_api) - last_length >= 1000:
+                string_to_show = f"Fetched: {len(products_api) - last_length}, Retries: {queue.retries}"
+                print(
+                    f"Remaining: {len(queue)}/ {len(product_ids)} - {time.time() - start_time:.2f} secs - "
+                    f"{string_to_show}"
+                )
+                print(controller)
+                last_length = len(products_api)
+                start_time = time.time()
+            return None
+
+        await run_with_retries(
+            queue,
+            lambda _id: make_request_product_detail(PRODUCT_URL + str(_id), pool=pool),
+            handle,
+            controller,
+        )
+        failed_ids.extend(_id for _id, _ in queue.failed)
+        if failures is not None:
+            failures.extend((_id, reason, queue.failed_attempts.get(_id, 1)) for _id, reason in queue.failed)
+        print(f"Retries: {queue.retries}, Failed: {len(queue.failed)}")
+        for key, value in queue.reasons.items():
+            print(f"Status code: {key}, Count: {value}")
 
     except Exception as e:
         print(f"Error in concurrent_requests_product_details C: {e}")
         return None
 
 
-async def make_request_product_detail(url, retries=3, backoff_factor=0.3):
+async def make_request_product_detail(
+    url, retries=3, backoff_factor=0.3, pool: CrawlerPool = None, base_headers: dict = PRODUCT_HEADER
+):
     """
-    Make a single request to fetch product details, creating a new Cloudscraper instance each time.
+    Make a single request to fetch product details over the shared crawler pool.
+    Connections and Cloudflare cookies are reused; cookies are only renegotiated on a challenge.
     """
+    pool = pool or get_pool()
+    bucket = get_bucket("product_detail")
     for attempt in range(retries):
         try:
-            # Create a new scraper instance for each request
-            scraper = cloudscraper.create_scraper()
-
-            # Simulating a real browser with headers, etc.
             headers = {
-                **PRODUCT_HEADER,
-                "User-Agent": scraper.headers["User-Agent"],
+                **base_headers,
+                "User-Agent": get_random_user_agent(),
                 "x-iid": generateUUID(),
             }
-
-            # Using httpx.AsyncClient to make the asynchronous request with the scraper's cookies and headers
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=headers, cookies=scraper.cookies, timeout=20)
-
-            if response.status_code == 200:
-                return response
-
-            # If the response code isn't what you expect, you might choose to handle it differently.
-            # Here, we're only making another attempt if we haven't reached the max number of retries.
-            if attempt >= retries - 1:
-                return response
+            await bucket.acquire()
+            response = await pool.get(
+                url, headers=headers, timeout=HTTP_REQUEST_TIMEOUT, endpoint="product_detail"
+            )
+            bucket.observe(response)
+            # non-200 answers are returned as is, the caller's retry queue decides what to do with them
+            return response
 
         except Exception as e:
             if attempt >= retries - 1:
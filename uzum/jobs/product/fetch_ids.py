@@ -4,13 +4,25 @@ import math
 import time
 import traceback
 
-import httpx
+from asgiref.sync import sync_to_async
+from django.utils import timezone
 
+from uzum.crawler.schedule import RefreshPlan
+from uzum.crawler.summary import save_crawl_summary
+from uzum.jobs.concurrency import AdaptiveConcurrency
 from uzum.jobs.constants import (CATEGORIES_HEADER, CATEGORIES_HEADER_RU,
-                                 MAX_OFFSET, MAX_PAGE_SIZE,
-                                 PRODUCTIDS_CONCURRENT_REQUESTS, PRODUCTS_URL)
-from uzum.jobs.helpers import (generateUUID, get_random_user_agent,
-                               products_payload)
+                                 LISTING_SORTS, MAX_OFFSET, MAX_PAGE_SIZE,
+                                 PRODUCTIDS_BATCH_PAGES,
+                                 PRODUCTIDS_CONCURRENT_REQUESTS,
+                                 PRODUCTIDS_CONCURRENT_REQUESTS_MAX,
+                                 PRODUCTS_URL)
+from uzum.jobs.helpers import (batched_products_payload, generateUUID,
+                               get_random_user_agent, listing_count_payload,
+                               price_filter, products_payload)
+from uzum.jobs.pool import CrawlerPool, close_pool, get_pool
+from uzum.jobs.ratelimit import get_bucket
+from uzum.jobs.retry import RetryQueue, run_with_retries
+from uzum.jobs.telemetry import METRICS
 
 # Set up a basic configuration for logging
 logging.basicConfig(level=logging.INFO)
@@ -18,62 +30,78 @@ logging.basicConfig(level=logging.INFO)
 # Optionally, disable logging for specific libraries
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
+LISTING_CAP = MAX_OFFSET + 1  # items of one listing reachable through pagination
 
-async def get_all_product_ids_from_uzum(categories_dict: list[dict], product_ids, page_size: int, is_ru: bool = False):
+
+async def get_all_product_ids_from_uzum(
+    categories_dict: list[dict], product_ids, page_size: int, is_ru: bool = False, plan: RefreshPlan = None
+):
+    """
+    Collect the ids of all products listed in the given categories into `product_ids`.
+    With a RefreshPlan, the catalog cards of products it does not refresh today are recorded into it.
+    The requests made are stored as a CrawlSummary, see save_crawl_summary.
+    """
+    start_time = time.time()
+    started_at = timezone.now()
+    since = METRICS.snapshot()
+    stages = {"categories": len(categories_dict)}
     try:
         print("\n\nStarting getAllProductIdsFromUzum...")
-        start_time = time.time()
         promises = []
 
-        current_index = 0
-        while current_index < len(categories_dict):
-            # while current_index < 1:
-            current_id = categories_dict[current_index]["categoryId"]
-            current_category = categories_dict[current_index]
-            # print("current_category: ", current_category)
-            current_total = min(current_category["total_products"], MAX_OFFSET + MAX_PAGE_SIZE)
-            req_count = math.ceil(current_total / page_size)
-
-            current_offset = 0
-            current_req_index = 0
-
-            # for each category, we have to make multiple requests
-            while current_req_index < req_count and current_offset < current_total:
-                promises.append(
-                    {
-                        "categoryId": current_id,
-                        "total": current_total,
-                        "offset": current_offset,
-                        "pageSize": page_size,
-                    }
-                )
+        # listings past the offset cap are split into price slices that each fit under it
+        oversized = [category for category in categories_dict if category["total_products"] > LISTING_CAP]
+        slices = {}
+        if oversized:
+            pool = get_pool()
+            results = await asyncio.gather(
+                *(slice_listing(category["categoryId"], pool, is_ru) for category in oversized)
+            )
+            slices = {category["categoryId"]: result for category, result in zip(oversized, results)}
+            print(
+                f"Split {len(oversized)} listings over {LISTING_CAP} products into "
+                f"{sum(len(result) for result in results)} slices in {time.time() - start_time:.2f} secs"
+            )
+
+        for current_category in categories_dict:
+            current_id = current_category["categoryId"]
+            if current_id in slices:
+                current_slices = slices[current_id]
+            else:
+                current_slices = [{"filters": [], "sort": None, "total": current_category["total_products"]}]
+            for current_slice in current_slices:
+                current_total = min(current_slice["total"], MAX_OFFSET + MAX_PAGE_SIZE)
+                req_count = math.ceil(current_total / page_size)
 
-                current_offset += page_size
-                current_req_index += 1
-            current_index += 1
+                current_offset = 0
+                current_req_index = 0
+
+                # for each category, we have to make multiple requests
+                while current_req_index < req_count and current_offset < current_total:
+                    promises.append(
+                        {
+                            "categoryId": current_id,
+                            "total": current_total,
+                            "offset": current_offset,
+                            "pageSize": page_size,
+                            "filters": current_slice["filters"],
+                            "sort": current_slice["sort"],
+                        }
+                    )
+
+                    current_offset += page_size
+                    current_req_index += 1
         # print(promises)
-        print(f"Total number of requests: {len(promises)}")
+        print(
+            f"Total number of pages: {len(promises)}, "
+            f"requests: {math.ceil(len(promises) / max(1, PRODUCTIDS_BATCH_PAGES))}"
+        )
 
         failed_ids = []
-        await concurrent_requests_for_ids(promises, 0, product_ids, failed_ids, is_ru)
-        if len(failed_ids) > 0:
-            failed_again_ids = []
-            print(f"Failed Ids length: {len(failed_ids)}")
-            await concurrent_requests_for_ids(failed_ids, 0, product_ids, failed_again_ids, is_ru)
-            time.sleep(10)
-            if len(failed_again_ids) > 0:
-                final_failed_ids = []
-                await concurrent_requests_for_ids(failed_again_ids, 0, product_ids, final_failed_ids, is_ru)
-                time.sleep(10)
-                if len(final_failed_ids) > 0:
-                    ff_failed_ids = []
-                    await concurrent_requests_for_ids(final_failed_ids, 0, product_ids, ff_failed_ids, is_ru)
-                    time.sleep(20)
-                    if len(ff_failed_ids) > 0:
-                        fff_failed_ids = []
-                        await concurrent_requests_for_ids(ff_failed_ids, 0, product_ids, fff_failed_ids, is_ru)
-
-                print(f"Total number of failed product ids: { len(fff_failed_ids)}")
+        # failed pages are retried with backoff inside, only permanent failures come back
+        await concurrent_requests_for_ids(promises, 0, product_ids, failed_ids, is_ru, plan)
+        stages.update({"pages": len(promises), "failed_pages": len(failed_ids), "product_ids": len(product_ids)})
+        print(f"Total number of failed requests: {len(failed_ids)}")
         if not is_ru:
             print(f"Total number of product ids: {len(product_ids)}")
             print(f"Total number of unique product ids: {len(set(product_ids))}")
@@ -89,70 +117,133 @@ async def get_all_product_ids_from_uzum(categories_dict: list[dict], product_ids
         print("Error in getAllProductIdsFromUzum: ", e)
         traceback.print_exc()
         return None
+    finally:
+        await close_pool()
+        await sync_to_async(save_crawl_summary)(
+            "discovery_ru" if is_ru else "discovery", started_at, time.time() - start_time, since, stages=stages
+        )
 
 
 async def concurrent_requests_for_ids(
-    data: list[dict], index: int, product_ids: list[int], failed_ids: list[int], is_ru: bool = False
+    data: list[dict],
+    index: int,
+    product_ids: list[int],
+    failed_ids: list[int],
+    is_ru: bool = False,
+    plan: RefreshPlan = None,
 ):
+    """
+    Fetch all pages in `data`, PRODUCTIDS_BATCH_PAGES of them per request. Pages whose part of a
+    batched answer failed, and batches that failed for good, are fetched again one page per request.
+    """
     try:
-        index = 0
         start_time = time.time()
         last_length = 0
-        async with httpx.AsyncClient() as client:
-            while index < len(data):
-                # while index < 1:
-                if len(product_ids) - last_length > 4000:
-                    string_show = f"Fetched: {len(product_ids) - last_length}, Failed: {len(failed_ids)}"
-                    print(f"Current: {index}/ {len(data)} - {time.time() - start_time:.2f} secs - {string_show}")
-                    start_time = time.time()
-                    time.sleep(3)
-                    last_length = len(product_ids)
-
-                tasks = [
-                    make_request_product_ids(
-                        products_payload(
-                            promise["offset"],
-                            promise["pageSize"],
-                            promise["categoryId"],
-                            is_ru=is_ru,
-                        ),
-                        client=client,
+        pool = get_pool()
+        controller = AdaptiveConcurrency(
+            PRODUCTIDS_CONCURRENT_REQUESTS,
+            max_limit=PRODUCTIDS_CONCURRENT_REQUESTS_MAX,
+            name="product ids",
+        )
+        fallback = []  # pages to fetch again one by one
+        queue = None
+
+        with_cards = plan is not None and not is_ru
+
+        def add_items(products: list[dict], found: list):
+            for product in products:
+                found.append(
+                    product["catalogCard"]["productId"]
+                ) if not is_ru else found.append(
+                    {
+                        "productId": product["catalogCard"]["productId"],
+                        "title": product["catalogCard"]["title"],
+                        "characteristicValues": product["catalogCard"]["characteristicValues"],
+                    }
+                )
+
+        def handle(pages, res):
+            nonlocal last_length, start_time
+            # a batch that fails part way is retried whole, so nothing is kept until every page parsed
+            found = []
+            missing = []
+            products = []
+            try:
+                if res.status_code != 200:
+                    return res.status_code
+                res_data = res.json()
+                if len(pages) == 1:
+                    if "errors" in res_data:
+                        print("Error in concurrentRequestsForIds B:", res_data, pages[0])
+                        return res.status_code
+                    products.extend(res_data["data"]["makeSearch"]["items"])
+                else:
+                    results = res_data.get("data") or {}
+                    if "errors" in res_data:
+                        print(f"Error in concurrentRequestsForIds B: {res_data['errors'][:3]}")
+                    for i, page in enumerate(pages):
+                        # a failed field comes back as null, or is missing when the whole document failed
+                        if results.get(f"p{i}") is None:
+                            missing.append(page)
+                        else:
+                            products.extend(results[f"p{i}"]["items"])
+                add_items(products, found)
+                if with_cards:
+                    for product in products:
+                        plan.record_card(product["catalogCard"])
+            except Exception as e:
+                print("Error in concurrentRequestsForIds C:", e, pages)
+                traceback.print_exc()
+                return e
+
+            product_ids.extend(found)
+            fallback.extend(missing)
+
+            if len(product_ids) - last_length > 4000:
+                string_show = f"Fetched: {len(product_ids) - last_length}, Retries: {queue.retries}"
+                print(f"Remaining: {len(queue)}/ {len(data)} - {time.time() - start_time:.2f} secs - {string_show}")
+                print(controller)
+                start_time = time.time()
+                last_length = len(product_ids)
+            return None
+
+        async def fetch(batches: list[list[dict]]):
+            nonlocal queue
+            queue = RetryQueue(batches, name="product_ids")
+            await run_with_retries(
+                queue,
+                lambda pages: make_request_product_ids(
+                    products_payload(
+                        pages[0]["offset"],
+                        pages[0]["pageSize"],
+                        pages[0]["categoryId"],
                         is_ru=is_ru,
+                        filters=pages[0].get("filters"),
+                        sort=pages[0].get("sort") or "BY_RELEVANCE_DESC",
+                        with_cards=with_cards,
                     )
-                    for promise in data[index : index + PRODUCTIDS_CONCURRENT_REQUESTS]
-                ]
-
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-
-                for idx, res in enumerate(results):
-                    if isinstance(res, Exception):
-                        print("Error in concurrentRequestsForIds inner:", res)
-                        failed_ids.append(data[index + idx])
-                    else:
-                        try:
-                            res_data = res.json()
-                            if "errors" not in res_data:
-                                products = res_data["data"]["makeSearch"]["items"]
-                                for product in products:
-                                    product_ids.append(
-                                        product["catalogCard"]["productId"]
-                                    ) if not is_ru else product_ids.append(
-                                        {
-                                            "productId": product["catalogCard"]["productId"],
-                                            "title": product["catalogCard"]["title"],
-                                            "characteristicValues": product["catalogCard"]["characteristicValues"],
-                                        }
-                                    )
-                            else:
-                                print("Error in concurrentRequestsForIds B:", res_data, data[index + idx])
-                                p = data[index + idx]
-                                failed_ids.append(data[index + idx])
-                        except Exception as e:
-                            print("Error in concurrentRequestsForIds C:", e, data[index + idx])
-                            failed_ids.append(data[index + idx])
-                            traceback.print_exc()
-
-                index += PRODUCTIDS_CONCURRENT_REQUESTS
+                    if len(pages) == 1
+                    else batched_products_payload(pages, is_ru=is_ru, with_cards=with_cards),
+                    pool=pool,
+                    is_ru=is_ru,
+                ),
+                handle,
+                controller,
+            )
+            print(f"Retries: {queue.retries}, Failed: {len(queue.failed)}, Reasons: {dict(queue.reasons)}")
+
+        batch_pages = max(1, PRODUCTIDS_BATCH_PAGES)
+        await fetch([data[i : i + batch_pages] for i in range(0, len(data), batch_pages)])
+        for pages, _ in queue.failed:
+            if len(pages) == 1:
+                failed_ids.append(pages[0])
+            else:
+                fallback.extend(pages)
+
+        if fallback:
+            print(f"Fetching {len(fallback)} pages of failed batches one by one...")
+            await fetch([[page] for page in fallback])
+            failed_ids.extend(pages[0] for pages, _ in queue.failed)
 
     except Exception as e:
         print("Error in concurrentRequestsForIds: ", e)
@@ -160,17 +251,105 @@ async def concurrent_requests_for_ids(
         return None
 
 
+async def count_listing(category_id: int, filters: list[dict], pool: CrawlerPool, is_ru: bool = False):
+    """
+    Size of a filtered listing and its price facet as (filter id, min, max), or None if the request failed.
+    """
+    try:
+        res = await make_request_product_ids(
+            listing_count_payload(category_id, filters), pool=pool, is_ru=is_ru
+        )
+        if res.status_code != 200:
+            print(f"Error in count_listing: {res.status_code} {category_id} {filters}")
+            return None
+        res_data = res.json()
+        if "errors" in res_data:
+            print(f"Error in count_listing: {res_data['errors']} {category_id} {filters}")
+            return None
+        listing = res_data["data"]["makeSearch"]
+        price = None
+        for facet in listing.get("facets") or []:
+            if facet.get("range"):
+                price = (
+                    facet["filter"]["id"],
+                    math.floor(facet["range"]["min"]),
+                    math.ceil(facet["range"]["max"]),
+                )
+                break
+        return listing["total"], price
+    except Exception as e:
+        print(f"Error in count_listing: {e} {category_id} {filters}")
+        return None
+
+
+async def slice_listing(category_id: int, pool: CrawlerPool, is_ru: bool = False) -> list[dict]:
+    """
+    Split a listing bigger than LISTING_CAP into disjoint price ranges that each fit under the cap.
+    Returns slices as {"filters", "sort", "total"}. A single price still over the cap is fetched once
+    per LISTING_SORTS order, and a listing that could not be counted is kept whole (truncated).
+    """
+    whole = [{"filters": [], "sort": None, "total": LISTING_CAP}]
+    result = await count_listing(category_id, [], pool, is_ru)
+    if result is None:
+        return whole
+    total, price = result
+    if total <= LISTING_CAP:
+        return [{"filters": [], "sort": None, "total": total}]
+    if price is None:
+        print(f"slice_listing: no price facet in category {category_id}, fetching it in {len(LISTING_SORTS)} orders")
+        return [{"filters": [], "sort": sort, "total": LISTING_CAP} for sort in LISTING_SORTS]
+    filter_id, low, high = price
+    return await bisect_price(category_id, filter_id, low, high, pool, is_ru, total=total)
+
+
+async def bisect_price(
+    category_id: int,
+    filter_id,
+    low: int,
+    high: int,
+    pool: CrawlerPool,
+    is_ru: bool = False,
+    total: int = None,
+) -> list[dict]:
+    filters = [price_filter(filter_id, low, high)]
+    if total is None:
+        result = await count_listing(category_id, filters, pool, is_ru)
+        if result is None:
+            return [{"filters": filters, "sort": None, "total": LISTING_CAP}]
+        total = result[0]
+    if total == 0:
+        return []
+    if total <= LISTING_CAP:
+        return [{"filters": filters, "sort": None, "total": total}]
+    if low >= high:
+        print(f"bisect_price: {total} products of category {category_id} cost {low}, fetching them in every order")
+        return [{"filters": filters, "sort": sort, "total": LISTING_CAP} for sort in LISTING_SORTS]
+
+    # prices are long tailed, the geometric mean splits them more evenly than the middle
+    middle = int(math.sqrt(low * high)) if low > 0 else (low + high) // 2
+    middle = min(max(middle, low), high - 1)
+    lower, upper = await asyncio.gather(
+        bisect_price(category_id, filter_id, low, middle, pool, is_ru),
+        bisect_price(category_id, filter_id, middle + 1, high, pool, is_ru),
+    )
+    return lower + upper
+
+
 async def make_request_product_ids(
     data,
     retries=3,
     backoff_factor=0.3,
-    client=None,
+    pool: CrawlerPool = None,
     is_ru: bool = False,
 ):
+    pool = pool or get_pool()
+    bucket = get_bucket("product_ids")
     for i in range(retries):
         try:
-            return await client.post(
+            await bucket.acquire()
+            response = await pool.post(
                 PRODUCTS_URL,
+                endpoint="product_ids",
                 json=data,
                 headers={
                     **(CATEGORIES_HEADER if not is_ru else CATEGORIES_HEADER_RU),
@@ -178,6 +357,8 @@ async def make_request_product_ids(
                     "x-iid": generateUUID(),
                 },
             )
+            bucket.observe(response)
+            return response
         except Exception as e:
             if i == retries - 1:  # This is the last retry, raise the exception
                 raise e
@@ -0,0 +1,270 @@
+import asyncio
+import queue
+import threading
+import time
+import traceback
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from uzum.crawler.deadletter import record_failures, resolve_dead_letters
+from uzum.crawler.frontier import dump_checkpoint, mark_state, save_checkpoint
+from uzum.crawler.models import CrawlFrontier, CrawlRun
+from uzum.crawler.summary import save_crawl_summary
+from uzum.jobs.constants import (INGEST_BATCH_SIZE, INGEST_CHECKPOINT_EVERY,
+                                 INGEST_PREPARE_PROCESSES, INGEST_QUEUE_SIZE,
+                                 INGEST_SPILL_DIR)
+from uzum.jobs.pool import close_pool
+from uzum.jobs.product.fetch_details import concurrent_requests_product_details
+from uzum.jobs.product.MultiEntry import (load_prepare_context,
+                                          prepare_products_batch,
+                                          write_products_batch)
+from uzum.jobs.product.records import PayloadSpill, close_prepare_pool
+from uzum.jobs.telemetry import (METRICS, start_metrics_server,
+                                 worker_metrics_port)
+
+# marks the end of a stage's output
+DONE = object()
+
+
+class IngestPipeline:
+    """
+    fetch -> prepare -> write pipeline for product details.
+
+    Each stage runs in its own thread and hands batches of at most `batch_size` products to the next
+    stage through a bounded queue. A full queue blocks the stage in front of it, so at most
+    `queue_size` batches wait between any two stages and memory stays flat regardless of how many
+    ids are ingested, while fetching the next batch overlaps with writing the current one.
+
+    With a `run`, progress is tracked in its crawl frontier: ids are marked in flight when their batch
+    is prepared, and every `checkpoint_every` batches the writer stores a snapshot of the aggregation maps
+    and marks the ids written since the previous snapshot as done in the same transaction. A restarted
+    run re-ingests at most the batches written after the last checkpoint, which is safe as loads are idempotent.
+
+    Fetched products are parsed into ProductRecords. With INGEST_SPILL_DIR set, their static fields wait in a
+    temporary file per batch until the batch is prepared. With `prepare_processes`, the fetch stage keeps the raw
+    responses instead and the prepare stage has them decoded and transformed into rows in that many worker
+    processes (see records.transform_batch), leaving only the database lookups to the prepare thread, so the
+    transformation no longer competes with the event loop and the writer for the GIL.
+
+    Ids that fail for good are recorded in the dead-letter store once the pipeline finishes, fetched ones leave it.
+    So are the ids of a batch whose write fails: the batch is rolled back as a whole.
+    """
+
+    def __init__(
+        self,
+        product_ids: list[int],
+        shop_analytics_done: dict = None,
+        category_sales_map: dict = None,
+        batch_size: int = INGEST_BATCH_SIZE,
+        queue_size: int = INGEST_QUEUE_SIZE,
+        run: CrawlRun = None,
+        checkpoint_every: int = INGEST_CHECKPOINT_EVERY,
+        prepare_processes: int = INGEST_PREPARE_PROCESSES,
+    ):
+        self.product_ids = product_ids
+        self.shop_analytics_done = shop_analytics_done if shop_analytics_done is not None else {}
+        self.category_sales_map = category_sales_map if category_sales_map is not None else {}
+        self.batch_size = batch_size
+        self.crawl_run = run
+        self.checkpoint_every = checkpoint_every
+        self.prepare_processes = prepare_processes
+        self.fetched = queue.Queue(maxsize=queue_size)
+        self.prepared = queue.Queue(maxsize=queue_size)
+        self.failed_ids: list[int] = []
+        self.failures: list[tuple] = []  # (product_id, last reason, attempts) for the dead-letter store
+        self.stats = {"fetched": 0, "prepared": 0, "written": 0, "fetch": 0.0, "prepare": 0.0, "write": 0.0}
+        self._errors: list[BaseException] = []
+
+    def run(self):
+        start = time.time()
+        started_at = timezone.now()
+        since = METRICS.snapshot()
+        stages = [
+            threading.Thread(target=self._stage, args=(self._fetch_stage,), name="ingest-fetch"),
+            threading.Thread(target=self._stage, args=(self._prepare_stage,), name="ingest-prepare"),
+            threading.Thread(target=self._stage, args=(self._write_stage,), name="ingest-write"),
+        ]
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.join()
+
+        print(
+            f"Ingest pipeline finished in {time.time() - start:.2f} secs - fetched: {self.stats['fetched']}, "
+            f"written: {self.stats['written']}, failed: {len(self.failed_ids)}, fetch: {self.stats['fetch']:.2f}s, "
+            f"prepare: {self.stats['prepare']:.2f}s, write: {self.stats['write']:.2f}s"
+        )
+        record_failures(self.failures)
+        if not self._errors:
+            failed = set(self.failed_ids)
+            resolve_dead_letters([product_id for product_id in self.product_ids if product_id not in failed])
+        save_crawl_summary("ingest", started_at, time.time() - start, since, run=self.crawl_run, stages=self.stats)
+        if self._errors:
+            raise self._errors[0]
+        return self.failed_ids
+
+    def _stage(self, target):
+        try:
+            target()
+        except Exception as e:
+            print(f"Error in ingest stage {threading.current_thread().name}: {e}")
+            traceback.print_exc()
+            self._errors.append(e)
+            # unblock the other stages so the pipeline can shut down
+            for q in (self.fetched, self.prepared):
+                self._drain(q)
+                try:
+                    q.put_nowait(DONE)
+                except queue.Full:
+                    pass
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def _drain(q: queue.Queue):
+        try:
+            while True:
+                q.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _report_queues(self):
+        METRICS.set_gauge("ingest_queue_depth", "fetched", self.fetched.qsize())
+        METRICS.set_gauge("ingest_queue_depth", "prepared", self.prepared.qsize())
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """
+        Blocking put that gives up once another stage has failed.
+        """
+        while not self._errors:
+            try:
+                q.put(item, timeout=1)
+                self._report_queues()
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fetch_stage(self):
+        async_to_sync(self._fetch)()
+        self._put(self.fetched, DONE)
+
+    async def _fetch(self):
+        try:
+            for i in range(0, len(self.product_ids), self.batch_size):
+                if self._errors:
+                    return
+                start = time.time()
+                batch_ids = self.product_ids[i : i + self.batch_size]
+                products_api: list[dict] = []
+                failed_ids: list[int] = []
+                raw = self.prepare_processes > 0
+                spill = PayloadSpill(INGEST_SPILL_DIR) if INGEST_SPILL_DIR and not raw else None
+                await concurrent_requests_product_details(
+                    batch_ids, failed_ids, 0, products_api, spill, raw, failures=self.failures
+                )
+                self.failed_ids.extend(failed_ids)
+                self.stats["fetch"] += time.time() - start
+                self.stats["fetched"] += len(products_api)
+                print(f"Fetched {min(i + self.batch_size, len(self.product_ids))}/{len(self.product_ids)}")
+                is_last = i + self.batch_size >= len(self.product_ids)
+                # hand the batch over without blocking the event loop
+                fetched = (batch_ids, failed_ids, products_api, spill, is_last)
+                if not await asyncio.to_thread(self._put, self.fetched, fetched):
+                    if spill:
+                        spill.close()
+                    return
+        finally:
+            await close_pool()
+
+    def _prepare_stage(self):
+        try:
+            self._prepare()
+        finally:
+            if self.prepare_processes:
+                close_prepare_pool()
+
+    def _prepare(self):
+        context = load_prepare_context()
+        batches = 0
+        while (fetched := self.fetched.get()) is not DONE:
+            batch_ids, failed_ids, products_api, spill, is_last = fetched
+            start = time.time()
+            if self.crawl_run:
+                mark_state(self.crawl_run, batch_ids, CrawlFrontier.IN_FLIGHT)
+                mark_state(self.crawl_run, failed_ids, CrawlFrontier.FAILED)
+            prepared = prepare_products_batch(
+                products_api, context, self.shop_analytics_done, self.category_sales_map, self.prepare_processes
+            )
+            batches += 1
+            checkpoint = None
+            if self.crawl_run and (is_last or batches % self.checkpoint_every == 0):
+                # the maps now hold exactly the batches prepared so far
+                checkpoint = dump_checkpoint(self.shop_analytics_done, self.category_sales_map)
+            self.stats["prepare"] += time.time() - start
+            self.stats["prepared"] += len(products_api)
+            del products_api, fetched
+            if spill:
+                spill.close()
+            done_ids = list(set(batch_ids) - set(failed_ids))
+            if not self._put(self.prepared, (done_ids, prepared, checkpoint)):
+                return
+        self._put(self.prepared, DONE)
+
+    def _write_stage(self):
+        # ids written since the last checkpoint
+        written_ids: list[int] = []
+        while (item := self.prepared.get()) is not DONE:
+            done_ids, prepared, checkpoint = item
+            start = time.time()
+            try:
+                with transaction.atomic():
+                    write_products_batch(prepared, raise_errors=True)
+                    written_ids.extend(done_ids)
+                    if checkpoint is not None:
+                        save_checkpoint(self.crawl_run, checkpoint, written_ids)
+                        written_ids = []
+                self.stats["written"] += len(prepared["products_analytics"])
+            except Exception as e:
+                # the batch was rolled back as a whole, its ids go to the dead-letter store for replay_dead_letters
+                print(f"Error in writing a batch of {len(done_ids)} products: {e}")
+                traceback.print_exc()
+                self.failed_ids.extend(done_ids)
+                self.failures.extend((product_id, e, 1) for product_id in done_ids)
+                if self.crawl_run:
+                    mark_state(self.crawl_run, done_ids, CrawlFrontier.FAILED)
+                    if checkpoint is not None:
+                        # the ids written before this batch must not wait for the next checkpoint, there may be none
+                        save_checkpoint(self.crawl_run, checkpoint, written_ids)
+                        written_ids = []
+            self.stats["write"] += time.time() - start
+            del prepared, item
+
+
+def ingest_products(
+    product_ids: list[int],
+    shop_analytics_done: dict = None,
+    category_sales_map: dict = None,
+    batch_size: int = INGEST_BATCH_SIZE,
+    run: CrawlRun = None,
+):
+    """
+    Fetch, prepare and store details of all given products. Returns ids that could not be fetched.
+    Pass the CrawlRun of the task to make the ingest resumable, see IngestPipeline.
+    A failed stage is raised to the caller, batches written before it stay written.
+    """
+    try:
+        if settings.CRAWLER_METRICS_PORT:
+            # a no-op in celery worker processes, start_worker_metrics_server already serves them
+            start_metrics_server(worker_metrics_port(settings.CRAWLER_METRICS_PORT))
+        pipeline = IngestPipeline(
+            product_ids, shop_analytics_done, category_sales_map, batch_size=batch_size, run=run
+        )
+        return pipeline.run()
+    except Exception as e:
+        print(f"Error in ingest_products: {e}")
+        traceback.print_exc()
+        raise
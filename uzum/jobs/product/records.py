@@ -0,0 +1,252 @@
+import json
+import os
+import tempfile
+import threading
+import traceback
+
+import billiard
+
+from uzum.jobs.constants import INGEST_PREPARE_CHUNK, INGEST_PREPARE_PROCESSES
+from uzum.jobs.product.transform import (SELLER_FIELDS, extract_product_photos,
+                                         fingerprint, product_fingerprint,
+                                         sku_fingerprint, transform_product)
+
+# stored on Product only when it is new or its fingerprint changed, kept serialized (or spilled) until then
+STATIC_FIELDS = ("description", "attributes", "characteristics", "comments", "photos")
+PRODUCT_FIELDS = (
+    "id",
+    "title",
+    "adultCategory",
+    "bonusProduct",
+    "isEco",
+    "isPerishable",
+    "volumeDiscount",
+    "video",
+    "category",
+    "seller",
+    "badges",
+    "ordersAmount",
+    "reviewsAmount",
+    "rating",
+    "totalAvailableAmount",
+    "skuList",
+)
+SKU_FIELDS = (
+    "id",
+    "availableAmount",
+    "fullPrice",
+    "purchasePrice",
+    "barcode",
+    "charityProfit",
+    "productOptionDtos",
+    "vat",
+    "videoUrl",
+    "characteristics",
+    "discountBadge",
+)
+
+
+class PayloadSpill:
+    """
+    Append-only temporary file the static fields of product records are moved to.
+    Safe to write from the fetching thread while another thread reads.
+    """
+
+    def __init__(self, directory: str = None):
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._fd = self._file.fileno()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes) -> tuple[int, int]:
+        with self._lock:
+            offset = self._size
+            os.pwrite(self._fd, data, offset)
+            self._size += len(data)
+        return offset, len(data)
+
+    def read(self, offset: int, length: int) -> bytes:
+        return os.pread(self._fd, length, offset)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def close(self):
+        self._file.close()
+
+
+class _Record:
+    """
+    Read-only dict-style access to the slots, so records go wherever a payload dict went.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class SkuRecord(_Record):
+    __slots__ = SKU_FIELDS + ("fingerprint",)
+
+    def __init__(self, sku_api: dict, characteristics_fp: str):
+        for field in SKU_FIELDS:
+            setattr(self, field, sku_api[field])
+        # only the first option is read
+        self.productOptionDtos = [
+            {"paymentPerMonth": option["paymentPerMonth"]} for option in sku_api["productOptionDtos"][:1]
+        ]
+        self.fingerprint = sku_fingerprint(sku_api, characteristics_fp)
+
+
+class ProductRecord(_Record):
+    """
+    The part of a product detail payload transform_product and transform_sku read.
+
+    Fingerprints are computed from the full payload, so they match the ones stored by earlier runs.
+    The static fields (STATIC_FIELDS) are only needed when the product is new or changed: they are kept
+    as one serialized string, in memory or in a PayloadSpill, and decoded on access. Photos are reduced to
+    the urls stored on Product.
+    """
+
+    __slots__ = PRODUCT_FIELDS + ("fingerprint", "characteristics_fp", "_static", "_spill")
+
+    def __init__(self, product_api: dict, spill: PayloadSpill = None, sellers: dict = None):
+        for field in PRODUCT_FIELDS:
+            setattr(self, field, product_api[field])
+        category = product_api["category"]
+        self.category = {
+            "id": category["id"],
+            "title": category["title"],
+            "productAmount": category["productAmount"],
+            "parent": {"id": category["parent"]["id"]} if category.get("parent") else None,
+        }
+        seller = product_api["seller"]
+        if sellers is not None and seller["id"] in sellers:
+            # products of one shop share its seller payload
+            self.seller = sellers[seller["id"]]
+        else:
+            self.seller = {field: seller.get(field) for field in SELLER_FIELDS}
+            if sellers is not None:
+                sellers[seller["id"]] = self.seller
+
+        self.fingerprint = product_fingerprint(product_api)
+        self.characteristics_fp = fingerprint(product_api["characteristics"])
+        self.skuList = [SkuRecord(sku_api, self.characteristics_fp) for sku_api in product_api["skuList"]]
+
+        # json escapes newlines, so they can separate the fields
+        static = "\n".join(
+            [
+                json.dumps(product_api["description"], ensure_ascii=False),
+                json.dumps(product_api["attributes"]),
+                json.dumps(product_api["characteristics"]),
+                json.dumps(product_api["comments"]),
+                json.dumps(extract_product_photos(product_api["photos"])),
+            ]
+        )
+        self._spill = spill
+        self._static = spill.write(static.encode()) if spill else static
+
+    def static_json(self, key: str) -> str:
+        """
+        A static field serialized the way it is stored on Product (photos as the list of urls).
+        """
+        static = self._spill.read(*self._static).decode() if self._spill else self._static
+        return static.split("\n")[STATIC_FIELDS.index(key)]
+
+    def __getitem__(self, key):
+        if key in STATIC_FIELDS:
+            return json.loads(self.static_json(key))
+        return super().__getitem__(key)
+
+
+def prepare_payloads(items: list, lookups: dict) -> list[dict]:
+    """
+    transform_product over product payloads: ProductRecords, payload dicts or raw (product_id, response body)
+    pairs, which are decoded here. Runs in the prepare worker processes, so it must not touch the database:
+    `lookups` holds the stored rows of these products as plain dicts (see create_products.load_batch_lookups).
+    """
+    rows = []
+    for item in items:
+        try:
+            if isinstance(item, tuple):
+                product_id, payload = item
+                product_api = json.loads(payload)["payload"]["data"]
+            else:
+                product_id, product_api = item["id"], item
+            rows.append(
+                transform_product(
+                    product_api,
+                    lookups["products"].get(product_id),
+                    lookups["skus"].get(product_id),
+                    lookups["analytics"].get(product_id),
+                )
+            )
+        except Exception as e:
+            print(f"Error in prepare_payloads: {e}")
+            traceback.print_exc()
+    return rows
+
+
+def _prepare_chunk(args: tuple) -> list[dict]:
+    return prepare_payloads(*args)
+
+
+_prepare_pool = None
+_prepare_pool_lock = threading.Lock()
+
+
+def get_prepare_pool(processes: int = INGEST_PREPARE_PROCESSES):
+    """
+    Worker processes shared by the ingests of this process. billiard pools can be started from a daemonic
+    celery worker, unlike multiprocessing ones. They are spawned rather than forked, so they inherit neither
+    the database connections nor the event loop of the crawler.
+    """
+    global _prepare_pool
+    with _prepare_pool_lock:
+        if _prepare_pool is None:
+            _prepare_pool = billiard.get_context("spawn").Pool(processes)
+        return _prepare_pool
+
+
+def close_prepare_pool():
+    global _prepare_pool
+    with _prepare_pool_lock:
+        if _prepare_pool is not None:
+            _prepare_pool.terminate()
+            _prepare_pool.join()
+            _prepare_pool = None
+
+
+def transform_batch(
+    items: list, lookups: dict, processes: int = INGEST_PREPARE_PROCESSES, chunk_size: int = INGEST_PREPARE_CHUNK
+) -> list[dict]:
+    """
+    prepare_payloads over a batch, in chunks of `chunk_size` spread over `processes` worker processes.
+    Each chunk only carries the lookups of its own products. Falls back to this process when the pool fails.
+    """
+    chunks = [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+    if processes > 0 and len(chunks) > 1:
+        try:
+            tasks = []
+            for chunk in chunks:
+                ids = [item[0] if isinstance(item, tuple) else item["id"] for item in chunk]
+                tasks.append(
+                    (chunk, {key: {_id: rows[_id] for _id in ids if _id in rows} for key, rows in lookups.items()})
+                )
+            return [row for rows in get_prepare_pool(processes).map(_prepare_chunk, tasks) for row in rows]
+        except Exception as e:
+            print(f"Error in transform_batch, preparing in process: {e}")
+            traceback.print_exc()
+            close_prepare_pool()
+    return prepare_payloads(items, lookups)
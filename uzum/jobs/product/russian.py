@@ -0,0 +1,142 @@
+import time
+import traceback
+
+from asgiref.sync import async_to_sync
+from django.db import connection, transaction
+
+from uzum.jobs.concurrency import AdaptiveConcurrency
+from uzum.jobs.constants import (PRODUCT_CONCURRENT_REQUESTS_LIMIT,
+                                 PRODUCT_CONCURRENT_REQUESTS_MAX,
+                                 PRODUCT_HEADER_RU, PRODUCT_URL,
+                                 RU_ENRICH_BATCH_SIZE)
+from uzum.jobs.pool import close_pool, get_pool
+from uzum.jobs.product.fetch_details import make_request_product_detail
+from uzum.jobs.retry import RetryQueue, run_with_retries
+
+
+def backfill_russian_fingerprints() -> int:
+    """
+    Take russian titles stored before fingerprint_ru existed as current: they get the fingerprint of their
+    product once the ingest has set it, and are only refetched after a later change.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE product_product
+                SET fingerprint_ru = fingerprint
+                WHERE fingerprint_ru IS NULL AND title_ru IS NOT NULL AND fingerprint IS NOT NULL
+                """
+            )
+            return cursor.rowcount
+
+
+def get_products_to_enrich() -> list[tuple[int, str]]:
+    """
+    (product_id, fingerprint) of products without a russian title, or whose static payload (and with it
+    the uzbek title) changed since their russian title was fetched. Run backfill_russian_fingerprints first,
+    a russian title without fingerprint_ru otherwise counts as outdated.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT product_id, fingerprint
+            FROM product_product
+            WHERE title_ru IS NULL OR fingerprint_ru IS DISTINCT FROM fingerprint
+            """
+        )
+        return cursor.fetchall()
+
+
+async def fetch_russian_titles(product_ids: list[int], titles: dict[int, str]):
+    """
+    Fetch the russian title of every product into titles[product_id].
+    """
+    try:
+        pool = get_pool()
+        controller = AdaptiveConcurrency(
+            PRODUCT_CONCURRENT_REQUESTS_LIMIT,
+            max_limit=PRODUCT_CONCURRENT_REQUESTS_MAX,
+            name="russian titles",
+        )
+        queue = RetryQueue(product_ids, name="product_detail_ru")
+
+        def handle(product_id, res):
+            if res.status_code != 200:
+                return res.status_code
+            res_data = res.json()
+            if "errors" in res_data:
+                return res.status_code
+            title = res_data["payload"]["data"].get("title")
+            if title:
+                titles[product_id] = title
+            return None
+
+        await run_with_retries(
+            queue,
+            lambda product_id: make_request_product_detail(
+                PRODUCT_URL + str(product_id), pool=pool, base_headers=PRODUCT_HEADER_RU
+            ),
+            handle,
+            controller,
+        )
+        if queue.failed:
+            print(f"fetch_russian_titles - Retries: {queue.retries}, Failed: {len(queue.failed)}")
+    except Exception as e:
+        print(f"Error in fetch_russian_titles: {e}")
+        traceback.print_exc()
+    finally:
+        await close_pool()
+
+
+def write_russian_titles(rows: list[tuple[int, str, str]]):
+    """
+    Set title_ru and fingerprint_ru of (product_id, title_ru, fingerprint) rows in one statement.
+    """
+    if not rows:
+        return
+    values = ", ".join(["(%s, %s, %s)"] * len(rows))
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE product_product
+                SET title_ru = v.title_ru, fingerprint_ru = v.fingerprint
+                FROM (VALUES {values}) AS v(product_id, title_ru, fingerprint)
+                WHERE product_product.product_id = v.product_id
+                """,
+                [value for row in rows for value in row],
+            )
+
+
+def enrich_russian_titles(batch_size: int = RU_ENRICH_BATCH_SIZE):
+    """
+    Fill title_ru of new and changed products from their russian product details, instead of crawling all
+    category listings a second time in russian.
+    """
+    try:
+        start = time.time()
+        backfilled = backfill_russian_fingerprints()
+        if backfilled:
+            print(f"enrich_russian_titles: {backfilled} stored russian titles taken as current")
+        products = get_products_to_enrich()
+        print(f"enrich_russian_titles: {len(products)} products without a current russian title")
+        enriched = 0
+        for i in range(0, len(products), batch_size):
+            batch = products[i : i + batch_size]
+            titles: dict[int, str] = {}
+            async_to_sync(fetch_russian_titles)([product_id for product_id, _ in batch], titles)
+            write_russian_titles(
+                [
+                    (product_id, titles[product_id], fingerprint)
+                    for product_id, fingerprint in batch
+                    if product_id in titles
+                ]
+            )
+            enriched += len(titles)
+        print(f"enrich_russian_titles: {enriched} russian titles written in {time.time() - start:.2f} secs")
+        return enriched
+    except Exception as e:
+        print(f"Error in enrich_russian_titles: {e}")
+        traceback.print_exc()
+        return None
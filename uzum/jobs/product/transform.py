@@ -0,0 +1,310 @@
+import hashlib
+import json
+import traceback
+from datetime import datetime
+
+import pytz
+
+# pure payload transformations, free of django so they can run in prepare worker processes
+
+# stored on Product as text, existing rows are loaded and compared as "<field>_md5" (see text_digest)
+PRODUCT_TEXT_FIELDS = ("description", "attributes", "characteristics", "comments", "photos")
+# compared as they are
+PRODUCT_COLUMNS = (
+    "category_id",
+    "shop_id",
+    "title",
+    "adult",
+    "bonus_product",
+    "is_eco",
+    "is_perishable",
+    "volume_discount",
+    "video",
+    "fingerprint",
+)
+SKU_COLUMNS = (
+    "barcode",
+    "charity_profit",
+    "payment_per_month",
+    "vat_amount",
+    "vat_price",
+    "vat_rate",
+    "video_url",
+    "characteristics",
+    "discount_badge_id",
+    "fingerprint",
+)
+SELLER_FIELDS = (
+    "id",
+    "title",
+    "avatar",
+    "banner",
+    "description",
+    "link",
+    "hasCharityProducts",
+    "official",
+    "info",
+    "registrationDate",
+    "sellerAccountId",
+    "totalProducts",
+    "orders",
+    "reviews",
+    "rating",
+)
+
+
+def fingerprint(data) -> str:
+    """
+    Short stable hash of a json-serializable structure.
+    """
+    return hashlib.blake2b(
+        json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode(),
+        digest_size=16,
+    ).hexdigest()
+
+
+def product_fingerprint(product_api: dict) -> str:
+    """
+    Hash of the static part of a product payload: everything stored on Product, nothing that
+    changes with sales (orders, stock, rating). Equal fingerprints mean the row needs no update.
+    """
+    return fingerprint(
+        [
+            product_api["category"]["id"],
+            product_api["seller"]["id"],
+            product_api["title"],
+            product_api["description"],
+            product_api["adultCategory"],
+            product_api["bonusProduct"],
+            product_api["isEco"],
+            product_api["isPerishable"],
+            product_api["volumeDiscount"],
+            product_api["video"],
+            product_api["attributes"],
+            product_api["characteristics"],
+            product_api["comments"],
+            product_api["photos"],
+        ]
+    )
+
+
+def sku_fingerprint(sku_api: dict, characteristics_fp: str) -> str:
+    """
+    Hash of the static part of a sku payload. The fingerprint of the product characteristics is
+    included because sku characteristics are resolved through them.
+    """
+    return fingerprint(
+        [
+            sku_api["barcode"],
+            sku_api["charityProfit"],
+            [option["paymentPerMonth"] for option in sku_api["productOptionDtos"][:1]],
+            sku_api["vat"],
+            sku_api["videoUrl"],
+            sku_api["characteristics"],
+            characteristics_fp,
+            (sku_api["discountBadge"] or {}).get("badgeId"),
+        ]
+    )
+
+
+def extract_product_photos(product_photos: list[dict]):
+    photos = []
+    for photo_obj in product_photos:
+        url = photo_obj["photo"]["800"]["high"]
+        photos.append(url)
+
+    return photos
+
+
+def prepare_sku_characteristics(sku_api_chars: dict, characteristics: list[dict]):
+    char = []
+    for charac in sku_api_chars:
+        target_character = characteristics[charac["charIndex"]]
+        title = target_character["title"]
+        value = target_character["values"][charac["valueIndex"]]["title"]
+        char.append({"title": title, "value": value})
+    return json.dumps(char)
+
+
+def text_digest(value: str) -> str:
+    """
+    md5 of a text column the way PostgreSQL's md5() computes it, None for NULL.
+    """
+    return None if value is None else hashlib.md5(value.encode()).hexdigest()
+
+
+def static_json(product_api, key: str) -> str:
+    """
+    attributes, characteristics, comments or photos of a product payload serialized as stored on Product.
+    Parsed payloads (ProductRecord) keep them serialized already.
+    """
+    if hasattr(product_api, "static_json"):
+        return product_api.static_json(key)
+    if key == "photos":
+        return json.dumps(extract_product_photos(product_api["photos"]))
+    return json.dumps(product_api[key])
+
+
+def transform_sku(sku_api: dict, product_id: int, characteristics: list[dict], current: dict, characteristics_fp: str):
+    """
+    (new Sku row, changed columns of the existing one), either may be None. `current` holds SKU_COLUMNS
+    of the stored sku. A discount badge to resolve comes along as "discount_badge" (its payload).
+    """
+    sku_fp = sku_api.get("fingerprint") or sku_fingerprint(sku_api, characteristics_fp)
+    if current and current["fingerprint"] == sku_fp:
+        # static part of the payload did not change since the last run, nothing to diff
+        return None, None
+
+    discount_badge = sku_api["discountBadge"]
+    values = {
+        "barcode": sku_api["barcode"],
+        "charity_profit": sku_api["charityProfit"],
+        "vat_amount": sku_api["vat"]["vatAmount"],
+        "vat_price": sku_api["vat"]["price"],
+        "vat_rate": sku_api["vat"]["vatRate"],
+        "video_url": sku_api["videoUrl"],
+        "characteristics": prepare_sku_characteristics(sku_api["characteristics"], characteristics),
+        "discount_badge_id": discount_badge["badgeId"] if discount_badge else None,
+        "fingerprint": sku_fp,
+    }
+    if len(sku_api["productOptionDtos"]) > 0:
+        values["payment_per_month"] = sku_api["productOptionDtos"][0]["paymentPerMonth"]
+    elif not current:
+        values["payment_per_month"] = 0
+
+    if current:
+        values = {column: value for column, value in values.items() if value != current[column]}
+    else:
+        values.update({"sku": sku_api["id"], "product_id": product_id})
+    if values.get("discount_badge_id") is not None:
+        values["discount_badge"] = discount_badge
+    return (None, values) if current else (values, None)
+
+
+def transform_product(
+    product_api: dict, current: dict = None, current_skus: dict = None, current_analytic: dict = None
+) -> dict:
+    """
+    Everything stored for a product payload that can be worked out without the database:
+
+    - product: the new Product row, or product_changes: the changed columns of the stored one
+      (`current`, PRODUCT_COLUMNS and the text digests, see load_batch_lookups)
+    - skus / sku_changes: the same for its skus (`current_skus`, by sku id)
+    - analytics, sku_analytics: today's rows, orders_money continued from `current_analytic`
+    - category, seller, badges: for prepareProductData to resolve against the database
+    """
+    now = datetime.now(tz=pytz.timezone("Asia/Tashkent"))
+    category = product_api["category"]
+    seller = product_api["seller"]
+    rows = {
+        "id": product_api["id"],
+        "category": {
+            "id": category["id"],
+            "title": category["title"],
+            "productAmount": category["productAmount"],
+            "parent_id": category["parent"]["id"] if category.get("parent") else None,
+        },
+        "seller": {field: seller.get(field) for field in SELLER_FIELDS},
+        "badges": list(product_api["badges"]),
+        "product": None,
+        "product_changes": None,
+        "skus": [],
+        "sku_changes": {},
+        "sku_analytics": [],
+    }
+
+    product_fp = product_api.get("fingerprint") or product_fingerprint(product_api)
+    if not current or current["fingerprint"] != product_fp:
+        values = {
+            "category_id": category["id"],
+            "shop_id": seller["id"],
+            "title": product_api["title"],
+            "adult": product_api["adultCategory"],
+            "bonus_product": product_api["bonusProduct"],
+            "is_eco": product_api["isEco"],
+            "is_perishable": product_api["isPerishable"],
+            "volume_discount": product_api["volumeDiscount"],
+            "video": product_api["video"],
+            "fingerprint": product_fp,
+            "description": product_api["description"],
+            "attributes": static_json(product_api, "attributes"),
+            "characteristics": static_json(product_api, "characteristics"),
+            "comments": static_json(product_api, "comments"),
+            "photos": static_json(product_api, "photos"),
+        }
+        if current:
+            rows["product_changes"] = {
+                column: value
+                for column, value in values.items()
+                if (
+                    text_digest(value) != current[f"{column}_md5"]
+                    if column in PRODUCT_TEXT_FIELDS
+                    else value != current[column]
+                )
+            }
+        else:
+            values["product_id"] = product_api["id"]
+            rows["product"] = values
+
+    # analytics
+    latest_orders_amount = current_analytic["latest_orders_amount"] if current_analytic else 0
+    try:
+        average_purchase_price = sum([sku["purchasePrice"] for sku in product_api["skuList"]]) / (
+            len(product_api["skuList"] if len(product_api["skuList"]) > 0 else 1)
+        )
+    except Exception as e:
+        print(e, product_api["skuList"], product_api["id"])
+        traceback.print_exc()
+        average_purchase_price = 0
+    latest_orders_money = current_analytic["latest_orders_money"] if current_analytic else 0
+
+    new_orders_money = latest_orders_money + (
+        (
+            (product_api["ordersAmount"] - latest_orders_amount)
+            * (average_purchase_price if average_purchase_price else 0)
+        )
+        / 1000.0
+    )
+    rows["new_orders"] = product_api["ordersAmount"] - latest_orders_amount
+    rows["analytics"] = {
+        "created_at": now,
+        "reviews_amount": product_api["reviewsAmount"],
+        "rating": product_api["rating"],
+        "available_amount": product_api["totalAvailableAmount"],
+        "orders_amount": product_api["ordersAmount"],
+        "product_id": product_api["id"],
+        # get average of purchase_price from skuList
+        "average_purchase_price": average_purchase_price if average_purchase_price else 0,
+        "orders_money": max(new_orders_money, 0),
+    }
+
+    characteristics_fp = product_api.get("characteristics_fp") or fingerprint(product_api["characteristics"])
+    # decoded once per product, parsed payloads keep it serialized
+    characteristics_api = product_api["characteristics"]
+    for sku_api in product_api["skuList"]:
+        try:
+            sku, changes = transform_sku(
+                sku_api,
+                product_api["id"],
+                characteristics_api,
+                (current_skus or {}).get(sku_api["id"]),
+                characteristics_fp,
+            )
+        except Exception as e:
+            print(f"Error in transform_sku: {e}")
+            traceback.print_exc()
+            continue
+        if sku:
+            rows["skus"].append(sku)
+        if changes:
+            rows["sku_changes"][sku_api["id"]] = changes
+        rows["sku_analytics"].append(
+            {
+                "created_at": now,
+                "available_amount": sku_api["availableAmount"],
+                "full_price": sku_api["fullPrice"],
+                "purchase_price": sku_api["purchasePrice"],
+                "sku_id": sku_api["id"],
+            }
+        )
+    return rows
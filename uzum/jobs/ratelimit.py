@@ -0,0 +1,273 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import redis
+import requests
+from django.conf import settings
+
+from uzum.jobs.constants import (HOST_RATE_LIMITS, RATE_LIMIT_ENDPOINT_HOSTS,
+                                 RATE_LIMIT_PAUSE, RATE_LIMITS)
+
+REDIS_KEY_PREFIX = "crawler:ratelimit"
+# live overrides, field: bucket name, value: "rate:burst"
+REDIS_CONFIG_KEY = f"{REDIS_KEY_PREFIX}:config"
+
+# KEYS[1]: config hash, KEYS[2..]: state of every bucket the request has to pass
+# ARGV: name, default rate, default burst of each bucket in KEYS[2..]
+# Reserves a token in every bucket and returns the seconds to wait for the slowest one.
+ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local wait = 0
+for i = 2, #KEYS do
+    local rate = tonumber(ARGV[3 * i - 4])
+    local burst = tonumber(ARGV[3 * i - 3])
+    local configured = redis.call('HGET', KEYS[1], ARGV[3 * i - 5])
+    if configured then
+        local sep = string.find(configured, ':')
+        rate = tonumber(string.sub(configured, 1, sep - 1))
+        burst = tonumber(string.sub(configured, sep + 1))
+    end
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'updated', 'paused_until')
+    local tokens = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    local paused_until = tonumber(state[3]) or 0
+    tokens = math.min(burst, tokens + (now - updated) * rate) - 1
+    local key_wait = 0
+    if tokens < 0 then
+        key_wait = -tokens / rate
+    end
+    if paused_until > now then
+        key_wait = key_wait + paused_until - now
+    end
+    if key_wait > wait then
+        wait = key_wait
+    end
+    redis.call('HSET', KEYS[i], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', KEYS[i], 3600)
+end
+return tostring(wait)
+"""
+
+# KEYS[1]: bucket state, ARGV[1]: seconds to pause
+PAUSE_SCRIPT = """
+local t = redis.call('TIME')
+local until_ts = tonumber(t[1]) + tonumber(t[2]) / 1000000 + tonumber(ARGV[1])
+local paused_until = tonumber(redis.call('HGET', KEYS[1], 'paused_until')) or 0
+if until_ts > paused_until then
+    redis.call('HSET', KEYS[1], 'paused_until', tostring(until_ts))
+    redis.call('EXPIRE', KEYS[1], 3600)
+    return 1
+end
+return 0
+"""
+
+
+class TokenBucket:
+    """
+    Token bucket pacing the requests of one endpoint.
+
+    Each acquire reserves the next free slot and then waits for it with asyncio.sleep, so waiting
+    coroutines only give way to each other and never block the event loop. The bucket holds no
+    loop-bound primitives, so one bucket paces every event loop and thread of the process.
+    """
+
+    def __init__(self, rate: float, burst: int, name: str = ""):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()  # only guards the bookkeeping below, never held while waiting
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def __str__(self):
+        return f"{self.name or 'bucket'}: rate={self.rate}/s, burst={self.burst}"
+
+    def _reserve(self) -> float:
+        """
+        Take one token and return how long the caller has to wait for it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            # requests queued during a pause still go out spaced at `rate` once it ends
+            return max(0.0, self._paused_until - now) + wait
+
+    async def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self):
+        """
+        Blocking acquire for crawlers that run in threads instead of an event loop.
+        """
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """
+        Hold back every request of the endpoint for `seconds`, e.g. after a 429.
+        """
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until > self._paused_until:
+                self._paused_until = until
+                print(f"Pausing {self.name} for {seconds:.1f} secs")
+
+    def observe(self, response: httpx.Response | requests.Response):
+        """
+        Pause the endpoint if the server asked us to slow down.
+        """
+        if response.status_code != 429:
+            return
+        try:
+            self.pause(float(response.headers.get("retry-after", RATE_LIMIT_PAUSE)))
+        except ValueError:
+            self.pause(RATE_LIMIT_PAUSE)
+
+
+_redis_client = None
+_redis_scripts = None
+_redis_lock = threading.Lock()
+
+
+def _get_client() -> redis.Redis:
+    """
+    Redis client of this process. Its connection pool is thread safe, so one client serves every thread
+    crawler and, through asyncio.to_thread, every event loop, and no connection is tied to a loop that ends.
+    """
+    global _redis_client
+    if _redis_client is None:
+        with _redis_lock:
+            if _redis_client is None:
+                _redis_client = redis.Redis.from_url(settings.CRAWLER_REDIS_URL)
+    return _redis_client
+
+
+def _get_scripts():
+    """
+    (acquire, pause) scripts registered on the client. Scripts run through EVALSHA.
+    """
+    global _redis_scripts
+    if _redis_scripts is None:
+        client = _get_client()
+        _redis_scripts = (client.register_script(ACQUIRE_SCRIPT), client.register_script(PAUSE_SCRIPT))
+    return _redis_scripts
+
+
+class RedisTokenBucket(TokenBucket):
+    """
+    Token bucket of an endpoint shared by every crawler process through Redis.
+
+    Each request reserves a token in its endpoint's and its host's bucket in one Lua call, so the
+    aggregate rate against a host stays bounded no matter how many workers crawl it. Rates are read
+    from Redis on every call and can be changed on live workers with set_rate_limit.
+    If Redis is unreachable the bucket falls back to pacing this process only.
+    """
+
+    def __init__(self, endpoint: str, host: str):
+        rate, burst = RATE_LIMITS[endpoint]
+        super().__init__(rate, burst, name=endpoint)
+        host_rate, host_burst = HOST_RATE_LIMITS[host]
+        self.keys = [REDIS_CONFIG_KEY, f"{REDIS_KEY_PREFIX}:{endpoint}", f"{REDIS_KEY_PREFIX}:{host}"]
+        self.args = [endpoint, rate, burst, host, host_rate, host_burst]
+        self._failing = False
+        self._pauses = set()
+
+    def _redis_failed(self, e: Exception):
+        if not self._failing:
+            print(f"Redis rate limiter unavailable, pacing {self.name} locally: {e}")
+        self._failing = True
+
+    async def acquire(self):
+        try:
+            acquire_script, _ = _get_scripts()
+            wait = float(await asyncio.to_thread(acquire_script, keys=self.keys, args=self.args))
+            self._failing = False
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            return await super().acquire()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self):
+        try:
+            acquire_script, _ = _get_scripts()
+            wait = float(acquire_script(keys=self.keys, args=self.args))
+            self._failing = False
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            return super().acquire_sync()
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        super().pause(seconds)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # called from a thread crawler
+            try:
+                _, pause_script = _get_scripts()
+                pause_script(keys=[self.keys[1]], args=[seconds])
+            except redis.RedisError as e:
+                self._redis_failed(e)
+            return
+        task = loop.create_task(self._pause(seconds))
+        # keep a reference until the pause is stored
+        self._pauses.add(task)
+        task.add_done_callback(self._pauses.discard)
+
+    async def _pause(self, seconds: float):
+        try:
+            _, pause_script = _get_scripts()
+            await asyncio.to_thread(pause_script, keys=[self.keys[1]], args=[seconds])
+        except redis.RedisError as e:
+            self._redis_failed(e)
+
+
+_buckets: dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(endpoint: str) -> TokenBucket:
+    """
+    Return the bucket of an endpoint configured in RATE_LIMITS. Shared by all crawler
+    processes when CRAWLER_REDIS_URL is set, otherwise by the coroutines of this process.
+    """
+    bucket = _buckets.get(endpoint)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.get(endpoint)
+            if bucket is None:
+                if getattr(settings, "CRAWLER_REDIS_URL", None):
+                    bucket = RedisTokenBucket(endpoint, RATE_LIMIT_ENDPOINT_HOSTS[endpoint])
+                else:
+                    rate, burst = RATE_LIMITS[endpoint]
+                    bucket = TokenBucket(rate, burst, name=endpoint)
+                _buckets[endpoint] = bucket
+    return bucket
+
+
+def set_rate_limit(name: str, rate: float, burst: int):
+    """
+    Change the rate of an endpoint or host bucket on all running crawler processes.
+    """
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"Invalid rate limit for {name}: rate must be positive and burst at least 1")
+    _get_client().hset(REDIS_CONFIG_KEY, name, f"{rate}:{burst}")
+
+
+def reset_rate_limit(name: str):
+    """
+    Drop the live override of a bucket, falling back to RATE_LIMITS / HOST_RATE_LIMITS.
+    """
+    _get_client().hdel(REDIS_CONFIG_KEY, name)
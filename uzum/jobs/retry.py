@@ -0,0 +1,148 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Iterable
+
+import httpx
+
+from uzum.jobs.concurrency import AdaptiveConcurrency
+from uzum.jobs.constants import (RETRY_BASE_DELAY, RETRY_MAX_ATTEMPTS,
+                                 RETRY_MAX_DELAY, RETRY_THROTTLED_BASE_DELAY)
+from uzum.jobs.telemetry import METRICS
+
+TERMINAL_STATUS_CODES = (400, 401, 404, 410)  # retrying will not change the answer
+THROTTLED_STATUS_CODES = (429,)  # retried, but after a longer pause
+
+
+def retry_delay(attempt: int, reason: Any) -> float | None:
+    """
+    Seconds to wait before the next attempt, or None if the failure is terminal.
+
+    `reason` is the status code of the failed response, or the raised exception.
+    Delays grow exponentially with the attempt number and are fully jittered so that
+    items failing together do not come back together.
+    """
+    if isinstance(reason, int) and reason in TERMINAL_STATUS_CODES:
+        return None
+    base = RETRY_THROTTLED_BASE_DELAY if reason in THROTTLED_STATUS_CODES else RETRY_BASE_DELAY
+    return random.uniform(0, min(RETRY_MAX_DELAY, base * (2**attempt)))
+
+
+class RetryQueue:
+    """
+    Work queue that feeds fresh items first and puts failed items back with a per-item
+    attempt counter and backoff delay, so retries run alongside the main stream instead of
+    in separate rounds after it.
+
+    Items that fail terminally or run out of attempts end up in `failed` as (item, reason), with the number
+    of requests made for them in `failed_attempts`.
+    Retries, failures and the queue depth are reported to the crawler metrics under `name`.
+    """
+
+    def __init__(self, items: Iterable, max_attempts: int = RETRY_MAX_ATTEMPTS, name: str = "retry"):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.failed: list[tuple[Any, Any]] = []
+        self.failed_attempts: dict[Any, int] = {}
+        self.retries = 0
+        self.reasons = Counter()
+        self._pending = deque((item, 0) for item in items)
+        self._delayed = []  # heap of (due, seq, item, attempt)
+        self._seq = itertools.count()
+        self._in_progress = 0
+        self._changed = asyncio.Event()
+
+    def __len__(self):
+        return len(self._pending) + len(self._delayed) + self._in_progress
+
+    async def get(self) -> tuple[Any, int] | None:
+        """
+        Next (item, attempt) to process, or None once every item has succeeded or failed for good.
+        """
+        while True:
+            if self._pending:
+                self._in_progress += 1
+                return self._pending.popleft()
+            now = time.monotonic()
+            if self._delayed and self._delayed[0][0] <= now:
+                _, _, item, attempt = heapq.heappop(self._delayed)
+                self._in_progress += 1
+                return item, attempt
+            if not self._delayed and self._in_progress == 0:
+                return None
+
+            # wait for the earliest delayed item, or for an in-flight item to be put back
+            self._changed.clear()
+            timeout = self._delayed[0][0] - now if self._delayed else None
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def put(self, item):
+        """
+        Add a fresh item while the queue is being worked on, e.g. the next page of a listing.
+        """
+        self._pending.append((item, 0))
+        self._changed.set()
+
+    def done(self, item):
+        self._in_progress -= 1
+        self._changed.set()
+        METRICS.set_gauge("retry_queue_depth", self.name, len(self))
+
+    def retry(self, item, attempt: int, reason: Any):
+        self._in_progress -= 1
+        self.reasons[reason if isinstance(reason, int) else type(reason).__name__] += 1
+        delay = retry_delay(attempt, reason)
+        if delay is None or attempt + 1 >= self.max_attempts:
+            self.failed.append((item, reason))
+            self.failed_attempts[item] = attempt + 1
+            METRICS.observe_failed(self.name)
+        else:
+            self.retries += 1
+            METRICS.observe_retry(self.name, reason)
+            heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._seq), item, attempt + 1))
+        METRICS.set_gauge("retry_queue_delayed", self.name, len(self._delayed))
+        self._changed.set()
+
+
+async def run_with_retries(
+    queue: RetryQueue,
+    request: Callable[[Any], Awaitable[httpx.Response]],
+    handle: Callable[[Any, Any], Any],
+    controller: AdaptiveConcurrency,
+):
+    """
+    Like run_with_concurrency, but `handle(item, result)` returns None when the item is done
+    or the failure reason (status code or exception) to put it back into the retry queue.
+    An exception raised by `handle`, e.g. on a malformed body, is the failure reason of that item.
+    """
+
+    async def worker():
+        while (entry := await queue.get()) is not None:
+            item, attempt = entry
+            async with controller:
+                start = time.monotonic()
+                try:
+                    result = await request(item)
+                    controller.record(result, time.monotonic() - start)
+                except Exception as e:
+                    controller.record(None, time.monotonic() - start)
+                    result = e
+            if isinstance(result, Exception):
+                reason = result
+            else:
+                try:
+                    reason = handle(item, result)
+                except Exception as e:
+                    reason = e
+            if reason is None:
+                queue.done(item)
+            else:
+                queue.retry(item, attempt, reason)
+
+    await asyncio.gather(*(worker() for _ in range(controller.max_limit)))
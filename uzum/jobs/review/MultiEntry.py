@@ -0,0 +1,58 @@
+import traceback
+
+from django.db import connection
+
+from uzum.jobs.review.singleEntry import prepare_reply, prepare_review
+from uzum.review.models import Reply, Review
+
+REVIEWS_BATCH_SIZE = 5_000
+
+
+def get_products_with_new_reviews(date_pretty: str) -> dict[int, tuple]:
+    """
+    Products whose review count on `date_pretty` is higher than the number of reviews stored for them,
+    as product_id -> (shop_id, publish date of the latest stored review or None).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT pa.product_id, p.shop_id, stored.latest
+            FROM product_productanalytics pa
+            JOIN product_product p ON p.product_id = pa.product_id
+            LEFT JOIN (
+                SELECT product_id, COUNT(*) AS reviews, MAX(publish_date) AS latest
+                FROM review_review
+                GROUP BY product_id
+            ) stored ON stored.product_id = pa.product_id
+            WHERE pa.date_pretty = %s AND pa.reviews_amount > COALESCE(stored.reviews, 0)
+            """,
+            [date_pretty],
+        )
+        return {product_id: (shop_id, latest) for product_id, shop_id, latest in cursor.fetchall()}
+
+
+def create_reviews_bulk(reviews_api: dict[int, list[dict]], shops: dict[int, int]) -> int:
+    """
+    Insert the fetched reviews and their replies. `shops` maps product ids to the shop that answers
+    their reviews. Reviews that are already stored are skipped.
+    """
+    try:
+        reviews = []
+        replies = []
+        for product_id, product_reviews in reviews_api.items():
+            for review_api in product_reviews:
+                try:
+                    reviews.append(Review(**prepare_review(review_api, product_id)))
+                    reply = prepare_reply(review_api, shops[product_id])
+                    if reply:
+                        replies.append(Reply(**reply))
+                except Exception as e:
+                    print(f"Error in create_reviews_bulk: {e} - {review_api.get('reviewId')}")
+
+        Review.objects.bulk_create(reviews, batch_size=REVIEWS_BATCH_SIZE, ignore_conflicts=True)
+        Reply.objects.bulk_create(replies, batch_size=REVIEWS_BATCH_SIZE, ignore_conflicts=True)
+        return len(reviews)
+    except Exception as e:
+        print(f"Error in create_reviews_bulk: {e}")
+        traceback.print_exc()
+        return 0
@@ -0,0 +1,58 @@
+import time
+import traceback
+
+from asgiref.sync import async_to_sync
+from django.utils import timezone
+
+from uzum.crawler.summary import save_crawl_summary
+from uzum.jobs.constants import REVIEWS_CHUNK_SIZE
+from uzum.jobs.review.MultiEntry import (create_reviews_bulk,
+                                         get_products_with_new_reviews)
+from uzum.jobs.review.utils import get_new_reviews
+from uzum.jobs.telemetry import METRICS
+from uzum.utils.general import get_today_pretty
+
+
+def update_product_reviews(date_pretty: str = get_today_pretty()):
+    """
+    Store the reviews published since the last run for every product whose review count grew.
+    Products are fetched and written REVIEWS_CHUNK_SIZE at a time, so memory stays flat.
+    The requests made are stored as a CrawlSummary, see save_crawl_summary.
+    """
+    start = time.time()
+    started_at = timezone.now()
+    since = METRICS.snapshot()
+    stages = {}
+    try:
+        products = get_products_with_new_reviews(date_pretty)
+        product_ids = list(products)
+        print(f"update_product_reviews: {len(product_ids)} products have new reviews")
+        stages["products"] = len(product_ids)
+
+        stored = 0
+        failed = 0
+        for i in range(0, len(product_ids), REVIEWS_CHUNK_SIZE):
+            chunk = product_ids[i : i + REVIEWS_CHUNK_SIZE]
+            reviews_api: dict[int, list[dict]] = {}
+            high_water_marks = {product_id: products[product_id][1] for product_id in chunk}
+            failed_ids = async_to_sync(get_new_reviews)(high_water_marks, reviews_api) or []
+            # a product with a missing page is stored next time, its mark must not move past the gap
+            for product_id in failed_ids:
+                reviews_api.pop(product_id, None)
+            failed += len(failed_ids)
+            stored += create_reviews_bulk(reviews_api, {product_id: products[product_id][0] for product_id in chunk})
+            del reviews_api
+            stages.update({"stored": stored, "failed_products": failed})
+            print(f"Reviews: {min(i + REVIEWS_CHUNK_SIZE, len(product_ids))}/{len(product_ids)} products done")
+
+        print(
+            f"update_product_reviews: {stored} reviews stored in {time.time() - start:.2f} secs, "
+            f"failed products: {failed}"
+        )
+        return stored
+    except Exception as e:
+        print(f"Error in update_product_reviews: {e}")
+        traceback.print_exc()
+        return None
+    finally:
+        save_crawl_summary("reviews", started_at, time.time() - start, since, stages=stages)
@@ -0,0 +1,53 @@
+import json
+import uuid
+from datetime import datetime
+
+import pytz
+
+# replies get a stable id so a review stored twice does not get its reply twice
+REPLY_NAMESPACE = uuid.UUID("5b0d4e8a-3f0c-4c43-9a52-0f5cf2a8e7a1")
+
+
+def review_date(timestamp) -> datetime | None:
+    """
+    Dates of the review api are unix timestamps in milliseconds.
+    """
+    if not timestamp:
+        return None
+    return datetime.fromtimestamp(int(timestamp) / 1000.0, tz=pytz.timezone("Asia/Tashkent"))
+
+
+def prepare_review(review_api: dict, product_id: int) -> dict:
+    return {
+        "reviewId": review_api["reviewId"],
+        "product_id": product_id,
+        "customer": review_api.get("customer") or "",
+        "content": review_api.get("content") or "",
+        "amount_dislikes": review_api.get("amountFeedbackDislike") or 0,
+        "amount_likes": review_api.get("amountFeedbackLike") or 0,
+        "is_anonymous": review_api.get("isAnonymous") or False,
+        "characteristics": json.dumps(review_api.get("characteristics") or [], ensure_ascii=False),
+        "publish_date": review_date(review_api.get("date")),
+        "edited": review_api.get("edited") or False,
+        "rating": review_api.get("rating") or 0.0,
+        "status": review_api.get("status"),
+        "photos": json.dumps(review_api.get("photos") or []),
+    }
+
+
+def prepare_reply(review_api: dict, shop_id: int) -> dict | None:
+    """
+    The shop's answer to a review, None if it has none.
+    """
+    reply = review_api.get("reply")
+    if not reply:
+        return None
+    return {
+        "id": uuid.uuid5(REPLY_NAMESPACE, str(review_api["reviewId"])),
+        "review_id": review_api["reviewId"],
+        "shop_id": shop_id,
+        "content": reply.get("content") or "",
+        "published_at": review_date(reply.get("date")),
+        "edited": reply.get("edited") or False,
+        "photos": json.dumps(reply.get("photos") or []),
+    }
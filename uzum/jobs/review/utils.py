@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+import traceback
+from datetime import datetime
+
+from uzum.jobs.concurrency import AdaptiveConcurrency
+from uzum.jobs.constants import (API_URL, HTTP_REQUEST_TIMEOUT,
+                                 PRODUCT_HEADER, PRODUCT_REVIEWS_SIZE,
+                                 REVIEWS_CONCURRENT_REQUESTS,
+                                 REVIEWS_CONCURRENT_REQUESTS_MAX)
+from uzum.jobs.helpers import (generateUUID, get_random_user_agent,
+                               getReviewsUrl)
+from uzum.jobs.pool import CrawlerPool, close_pool, get_pool
+from uzum.jobs.ratelimit import get_bucket
+from uzum.jobs.retry import RetryQueue, run_with_retries
+from uzum.jobs.review.singleEntry import review_date
+
+# Set up a basic configuration for logging
+logging.basicConfig(level=logging.INFO)
+
+# Optionally, disable logging for specific libraries
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+async def get_new_reviews(
+    high_water_marks: dict[int, datetime | None],
+    reviews_api: dict[int, list[dict]],
+    page_size: int = PRODUCT_REVIEWS_SIZE,
+):
+    """
+    Fetch the reviews of every product in `high_water_marks` that are newer than its mark (the publish date
+    of its latest stored review, None for a product without stored reviews) into reviews_api[product_id].
+
+    Reviews come newest first, so a product is paged through only until its first review older than the mark.
+    Reviews published exactly at the mark are kept, the insert skips the ones already stored.
+    Returns the ids of products whose pages failed for good.
+    """
+    try:
+        start_time = time.time()
+        pool = get_pool()
+        controller = AdaptiveConcurrency(
+            REVIEWS_CONCURRENT_REQUESTS,
+            max_limit=REVIEWS_CONCURRENT_REQUESTS_MAX,
+            name="reviews",
+        )
+        queue = RetryQueue([(product_id, 0) for product_id in high_water_marks], name="review")
+
+        def handle(item, res):
+            product_id, page = item
+            if res.status_code != 200:
+                return res.status_code
+            res_data = res.json()
+            if "errors" in res_data:
+                return res.status_code
+            reviews = res_data.get("payload") or []
+            mark = high_water_marks[product_id]
+            for review in reviews:
+                published = review_date(review.get("date"))
+                if mark and published and published < mark:
+                    break
+                reviews_api.setdefault(product_id, []).append(review)
+            else:
+                if len(reviews) == page_size:
+                    queue.put((product_id, page + 1))
+            return None
+
+        await run_with_retries(
+            queue,
+            lambda item: make_request_reviews(getReviewsUrl(item[0], page_size, item[1], API_URL), pool=pool),
+            handle,
+            controller,
+        )
+        print(
+            f"get_new_reviews: {sum(len(reviews) for reviews in reviews_api.values())} new reviews of "
+            f"{len(reviews_api)}/{len(high_water_marks)} products in {time.time() - start_time:.2f} secs - "
+            f"Retries: {queue.retries}, Failed: {len(queue.failed)}"
+        )
+        return list({product_id for (product_id, _), _ in queue.failed})
+    except Exception as e:
+        print(f"Error in get_new_reviews: {e}")
+        traceback.print_exc()
+        return None
+    finally:
+        await close_pool()
+
+
+async def make_request_reviews(url, retries=3, backoff_factor=0.3, pool: CrawlerPool = None):
+    pool = pool or get_pool()
+    bucket = get_bucket("review")
+    for attempt in range(retries):
+        try:
+            await bucket.acquire()
+            response = await pool.get(
+                url,
+                headers={
+                    **PRODUCT_HEADER,
+                    "User-Agent": get_random_user_agent(),
+                    "x-iid": generateUUID(),
+                },
+                timeout=HTTP_REQUEST_TIMEOUT,
+                endpoint="review",
+            )
+            bucket.observe(response)
+            return response
+        except Exception as e:
+            if attempt >= retries - 1:
+                raise
+            print(f"Error in make_request_reviews (attempt {attempt + 1}):{url} - {str(e)}")
+            await asyncio.sleep(backoff_factor * (2**attempt))
@@ -1,14 +1,15 @@
 from uzum.shop.models import ShopAnalytics
+from uzum.utils.bulk_copy import copy_insert
 
 
-def create_shop_analytics_bulk(analytics):
+def create_shop_analytics_bulk(analytics: list[dict], raise_errors: bool = False):
     try:
-        result = ShopAnalytics.objects.bulk_create(analytics, ignore_conflicts=True)
-        print(
-            f"createShopAnalyticsBulk: {len(result)} objects inserted, {len(analytics) - len(result)} objects skipped"
-        )
+        result = copy_insert(ShopAnalytics, [row for row in analytics if row], unique_on=("shop_id", "date_pretty"))
+        print(f"createShopAnalyticsBulk: {result} objects inserted, {len(analytics) - result} objects skipped")
         return result
 
     except Exception as e:
         print("Error in createShopAnalyticsBulk: ", e)
+        if raise_errors:
+            raise
         return None
@@ -4,21 +4,26 @@ import time
 import traceback
 from datetime import datetime
 
-import httpx
 import requests
 from asgiref.sync import async_to_sync
 from django.db.models import Q
 
 from uzum.jobs.constants import SELLER_HEADERS, SELLER_URL
 from uzum.jobs.helpers import generateUUID, get_random_user_agent
+from uzum.jobs.pool import CrawlerPool, close_pool, get_pool
+from uzum.jobs.ratelimit import get_bucket
 from uzum.shop.models import Shop
 
 
-async def fetch_shop_api(link: str, retries=3, backoff_factor=0.3, client=None):
+async def fetch_shop_api(link: str, retries=3, backoff_factor=0.3, pool: CrawlerPool = None):
+    pool = pool or get_pool()
+    bucket = get_bucket("shop")
     for i in range(retries):
         try:
-            response = await client.get(
+            await bucket.acquire()
+            response = await pool.get(
                 SELLER_URL + link + "?categoryId=1",
+                endpoint="shop",
                 headers={
                     **SELLER_HEADERS,
                     "User-Agent": get_random_user_agent(),
@@ -26,6 +31,7 @@ async def fetch_shop_api(link: str, retries=3, backoff_factor=0.3, client=None):
                 },
                 timeout=60,
             )
+            bucket.observe(response)
             if response.status_code == 200:
                 data: dict = response.json()
                 return data.get("payload")
@@ -33,14 +39,12 @@ async def fetch_shop_api(link: str, retries=3, backoff_factor=0.3, client=None):
                 return None
         except Exception as e:
             if i == retries - 1:
-                print("Sleeping for 5 seconds...")
-                time.sleep(5)
                 raise e
             else:
                 print(f"Error in fetch_shop_api (attempt {i + 1}):{link}")
                 print(e)
                 sleep_time = backoff_factor * (2**i)
-                time.sleep(sleep_time)
+                await asyncio.sleep(sleep_time)
 
 
 def sync_update_shop_credentials(links):
@@ -56,48 +60,47 @@ async def update_shop_credentials(shop_links: list[str]):
         failed_links = []
         batch_size = 100
         currentIndex = 0
+        pool = get_pool()
 
         while currentIndex < len(shop_links):
             currentIndex += batch_size
-            async with httpx.AsyncClient() as client:
-                while index < currentIndex:
-                    if len(shop_results) - last_length >= 1000:
-                        string_to_show = f"Fetched: {len(shop_results) - last_length}, Failed: {len(failed_links)}"
-                        print(
-                            f"Current: {index}/ {len(shop_links)} - {time.time() - start_time:.2f} secs - {string_to_show}"
-                        )
-                        last_length = len(shop_results)
-                        time.sleep(2)  # sleep for 2 seconds
-                        start_time = time.time()
-
-                    tasks = [
-                        fetch_shop_api(
-                            link,
-                            client=client,
-                        )
-                        for link in shop_links[index:currentIndex]
-                    ]
-
-                    results = await asyncio.gather(*tasks, return_exceptions=True)
-
-                    for idx, res in enumerate(results):
-                        if isinstance(res, Exception):
-                            print("Error in shops update A:", res)
+            while index < currentIndex:
+                if len(shop_results) - last_length >= 1000:
+                    string_to_show = f"Fetched: {len(shop_results) - last_length}, Failed: {len(failed_links)}"
+                    print(
+                        f"Current: {index}/ {len(shop_links)} - {time.time() - start_time:.2f} secs - {string_to_show}"
+                    )
+                    last_length = len(shop_results)
+                    start_time = time.time()
+
+                tasks = [
+                    fetch_shop_api(
+                        link,
+                        pool=pool,
+                    )
+                    for link in shop_links[index:currentIndex]
+                ]
+
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+
+                for idx, res in enumerate(results):
+                    if isinstance(res, Exception):
+                        print("Error in shops update A:", res)
+                        failed_links.append(shop_links[index + idx])
+                    else:
+                        if res is None:
+                            _id = shop_links[index + idx]
+                            print(
+                                f"Error in shops update B: {_id}",
+                            )
                             failed_links.append(shop_links[index + idx])
+                            continue
                         else:
-                            if res is None:
-                                _id = shop_links[index + idx]
-                                print(
-                                    f"Error in shops update B: {_id}",
-                                )
-                                failed_links.append(shop_links[index + idx])
-                                continue
-                            else:
-                                shop_results.append(res)
-
-                    del results
-                    del tasks
-                    index = currentIndex
+                            shop_results.append(res)
+
+                del results
+                del tasks
+                index = currentIndex
 
             currentIndex += batch_size
 
@@ -111,6 +114,8 @@ async def update_shop_credentials(shop_links: list[str]):
         print("Error in update_shop_credentials: ", e)
         traceback.print_exc()
         return None
+    finally:
+        await close_pool()
 
 
 def update_shops(shops_api: list[dict]):
@@ -1,7 +1,8 @@
 from uzum.sku.models import Sku, SkuAnalytics
+from uzum.utils.bulk_copy import copy_insert
 
 
-def create_skus_bulk(sku_list):
+def create_skus_bulk(sku_list, raise_errors: bool = False):
     try:
         print("createSkusBulk started...")
 
@@ -11,17 +12,20 @@ def create_skus_bulk(sku_list):
 
     except Exception as e:
         print("Error in createSkusBulk: ", e)
+        if raise_errors:
+            raise
         return None
 
 
-def create_sku_analytics_bulk(sku_analytics_list):
+def create_sku_analytics_bulk(sku_analytics_list: list[dict], raise_errors: bool = False):
     try:
-        result = SkuAnalytics.objects.bulk_create(sku_analytics_list, ignore_conflicts=True)
-        print(
-            f"createSkuAnalyticsBulk: {len(result)} objects inserted, {len(sku_analytics_list) - len(result)} objects skipped"
-        )
+        rows = [row for row in sku_analytics_list if row]
+        result = copy_insert(SkuAnalytics, rows, unique_on=("sku_id", "date_pretty"))
+        print(f"createSkuAnalyticsBulk: {result} objects inserted, {len(sku_analytics_list) - result} objects skipped")
         return result
 
     except Exception as e:
         print("Error in createSkuAnalyticsBulk: ", e)
+        if raise_errors:
+            raise
         return None
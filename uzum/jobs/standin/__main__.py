@@ -0,0 +1,93 @@
+"""
+Run the local Uzum API stand-in:
+
+    python -m uzum.jobs.standin --port 8765 --products 20000 --latency 0.05 --throttle-rate 0.01
+    UZUM_API_STANDIN=http://127.0.0.1:8765 celery ... / manage.py shell
+
+Record live payloads to serve them as fixtures instead of synthetic ones:
+
+    python -m uzum.jobs.standin record --out fixtures/ --products 1234,5678 --shops some-shop
+"""
+import argparse
+import json
+from pathlib import Path
+
+from uzum.jobs.standin.app import StandinApp
+from uzum.jobs.standin.catalog import SyntheticCatalog
+
+
+def serve(args):
+    import uvicorn
+
+    app = StandinApp(
+        SyntheticCatalog(
+            products=args.products,
+            skus_per_product=args.skus,
+            shops=args.shops,
+            categories=args.categories,
+            seed=args.seed,
+            day=args.day,
+        ),
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        fixtures_dir=args.fixtures,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+def record(args):
+    """
+    Store live product and shop payloads in the fixture layout StandinApp serves.
+    """
+    import cloudscraper
+
+    scraper = cloudscraper.create_scraper()
+    out = Path(args.out)
+    for kind, ids, url in (
+        ("product", args.products, "https://api.uzum.uz/api/v2/product/{}"),
+        ("shop", args.shops, "https://api.uzum.uz/api/shop/{}?categoryId=1"),
+    ):
+        if not ids:
+            continue
+        (out / kind).mkdir(parents=True, exist_ok=True)
+        for _id in ids.split(","):
+            response = scraper.get(url.format(_id), timeout=20)
+            if response.status_code != 200:
+                print(f"Skipping {kind} {_id}: {response.status_code}")
+                continue
+            (out / kind / f"{_id}.json").write_text(json.dumps(response.json()))
+            print(f"Recorded {kind} {_id}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m uzum.jobs.standin")
+    subparsers = parser.add_subparsers(dest="command")
+
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--skus", type=int, default=3, help="skus per product")
+    parser.add_argument("--shops", type=int, default=500)
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--day", type=int, default=0, help="shifts orders, stock and prices like a later run")
+    parser.add_argument("--latency", type=float, default=0.0, help="mean response delay in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--fixtures", default=None, help="directory of recorded payloads served first")
+
+    recorder = subparsers.add_parser("record")
+    recorder.add_argument("--out", required=True)
+    recorder.add_argument("--products", default="", help="comma separated product ids")
+    recorder.add_argument("--shops", default="", help="comma separated shop links")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args)
+    else:
+        serve(args)
+
+
+if __name__ == "__main__":
+    main()
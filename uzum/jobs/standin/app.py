@@ -0,0 +1,165 @@
+import asyncio
+import json
+import random
+import re
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from uzum.jobs.standin.catalog import SyntheticCatalog
+
+# aliased makeSearch fields of a batched document, e.g. "p0: makeSearch(query: $q0)"
+ALIASED_SEARCH = re.compile(r"(\w+)\s*:\s*makeSearch\s*\(\s*query\s*:\s*\$(\w+)\s*\)")
+
+
+class StandinApp:
+    """
+    ASGI stand-in for the Uzum API, used to run and benchmark the crawlers without network.
+
+    Serves the shapes the jobs consume:
+        POST /graphql/                  makeSearch (ids, category tree), aliased makeSearch batches,
+                                        getMainContent, Suggestions
+        GET  /api/v2/product/{id}       product details
+        GET  /api/product/{id}/reviews  reviews of a product, newest first (amount, page)
+        GET  /api/shop/{link}           shop
+
+    Answers come from `fixtures_dir` when a recorded payload exists (product/{id}.json, shop/{link}.json,
+    graphql/{operationName}.json) and from the synthetic catalog otherwise. Every request waits about
+    `latency` seconds, and fails with a 500 with probability `error_rate` or a 429 with `throttle_rate`.
+    """
+
+    def __init__(
+        self,
+        catalog: SyntheticCatalog = None,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        fixtures_dir: str = None,
+    ):
+        self.catalog = catalog or SyntheticCatalog()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.fixtures_dir = Path(fixtures_dir) if fixtures_dir else None
+        self.requests = 0
+        self._category_tree = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while (message := await receive())["type"] != "lifespan.shutdown":
+                await send({"type": "lifespan.startup.complete"})
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+
+        roll = random.random()
+        if roll < self.throttle_rate:
+            status, payload, headers = 429, {"error": "Too Many Requests"}, [(b"retry-after", b"1")]
+        elif roll < self.throttle_rate + self.error_rate:
+            status, payload, headers = 500, {"error": "Internal Server Error"}, []
+        else:
+            status, payload = self.route(
+                scope["method"], scope["path"], body, scope.get("query_string", b"").decode()
+            )
+            headers = []
+
+        content = json.dumps(payload).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(content)).encode()),
+                    *headers,
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": content})
+
+    def _fixture(self, *parts: str):
+        if not self.fixtures_dir:
+            return None
+        path = self.fixtures_dir.joinpath(*parts)
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+    def route(self, method: str, path: str, body: bytes, query: str = "") -> tuple[int, dict]:
+        parts = [part for part in path.split("/") if part]
+        if method == "GET" and parts[:3] == ["api", "v2", "product"] and len(parts) == 4:
+            return self.product(parts[3])
+        if method == "GET" and parts[:2] == ["api", "product"] and parts[3:] == ["reviews"]:
+            return self.reviews(parts[2], parse_qs(query))
+        if method == "GET" and parts[:2] == ["api", "shop"] and len(parts) == 3:
+            return self.shop(parts[2])
+        if method == "POST" and parts[:1] == ["graphql"]:
+            try:
+                return self.graphql(json.loads(body or b"{}"))
+            except ValueError:
+                return 400, {"errors": [{"message": "Invalid JSON"}]}
+        return 404, {"error": "Not Found"}
+
+    def product(self, product_id: str) -> tuple[int, dict]:
+        fixture = self._fixture("product", f"{product_id}.json")
+        if fixture is not None:
+            return 200, fixture
+        if not product_id.isdigit() or not self.catalog.exists(int(product_id)):
+            return 404, {"payload": None, "errors": [{"message": "Product not found"}]}
+        return 200, {"payload": {"data": self.catalog.product_detail(int(product_id))}}
+
+    def reviews(self, product_id: str, params: dict) -> tuple[int, dict]:
+        if not product_id.isdigit() or not self.catalog.exists(int(product_id)):
+            return 404, {"payload": None, "errors": [{"message": "Product not found"}]}
+        amount = int(params.get("amount", ["20"])[0])
+        page = int(params.get("page", ["0"])[0])
+        return 200, {"payload": self.catalog.reviews(int(product_id), amount, page)}
+
+    def shop(self, link: str) -> tuple[int, dict]:
+        fixture = self._fixture("shop", f"{link}.json")
+        if fixture is not None:
+            return 200, fixture
+        shop = self.catalog.shop_by_link(link)
+        if shop is None:
+            return 404, {"payload": None}
+        return 200, {"payload": shop}
+
+    def graphql(self, document: dict) -> tuple[int, dict]:
+        operation = document.get("operationName")
+        fixture = self._fixture("graphql", f"{operation}.json")
+        if fixture is not None:
+            return 200, fixture
+        query = document.get("query", "")
+        variables = document.get("variables") or {}
+
+        facets = "facets" in query
+        aliases = ALIASED_SEARCH.findall(query)
+        if aliases:
+            return 200, {
+                "data": {
+                    alias: self.catalog.make_search(variables.get(variable) or {}, facets)
+                    for alias, variable in aliases
+                }
+            }
+        if "makeSearch" in query:
+            result = self.catalog.make_search(variables.get("queryInput") or {}, facets)
+            if "categoryTree" in query:
+                if self._category_tree is None:
+                    self._category_tree = self.catalog.category_tree()
+                result["categoryTree"] = self._category_tree
+            return 200, {"data": {"makeSearch": result}}
+        if operation == "getMainContent":
+            return 200, {"data": {"main": {"content": self.catalog.main_content()}}}
+        if operation == "Suggestions":
+            blocks = [{"__typename": "TextSuggestionsBlock", "values": []}]
+            return 200, {"data": {"getSuggestions": {"blocks": blocks}}}
+        return 200, {"errors": [{"message": f"Unsupported operation {operation}"}]}
@@ -0,0 +1,326 @@
+import random
+
+from uzum.jobs.constants import MAX_OFFSET
+
+ROOT_CATEGORY_ID = 1
+FIRST_PRODUCT_ID = 100_000
+FIRST_SKU_ID = 1_000_000
+FIRST_SHOP_ID = 10_000
+FIRST_BADGE_ID = 500
+OFFER_CATEGORY_ID = 9_000
+PRICE_FILTER_ID = 1
+
+
+class SyntheticCatalog:
+    """
+    Deterministic fake marketplace in the shape of the Uzum API.
+
+    Products, skus, shops and categories are derived from their ids and `seed`, so every request
+    for the same id returns the same payload and nothing has to be kept in memory per product.
+    A `day` other than 0 moves the volatile numbers (orders, stock, prices) like a new nightly run would.
+    """
+
+    def __init__(
+        self,
+        products: int = 10_000,
+        skus_per_product: int = 3,
+        shops: int = 500,
+        categories: int = 50,
+        seed: int = 0,
+        day: int = 0,
+    ):
+        self.products = products
+        self.skus_per_product = skus_per_product
+        self.shops = shops
+        self.categories = categories
+        self.seed = seed
+        self.day = day
+        # root -> `branches` parents -> leaves, products live in leaves
+        self.branches = max(1, categories // 10)
+        self.leaves = list(range(ROOT_CATEGORY_ID + self.branches + 1, ROOT_CATEGORY_ID + categories + 1))
+        if not self.leaves:
+            self.leaves = [ROOT_CATEGORY_ID + 1]
+        self._listings: dict[int, list[int]] = {}
+        self._prices: dict[int, int] = {}
+
+    def _random(self, *key) -> random.Random:
+        # str seeds are hashed with sha512, so payloads are stable across processes
+        return random.Random(":".join(map(str, (self.seed, *key))))
+
+    # categories
+
+    def parent_of(self, category_id: int) -> int | None:
+        if category_id == ROOT_CATEGORY_ID:
+            return None
+        if category_id <= ROOT_CATEGORY_ID + self.branches:
+            return ROOT_CATEGORY_ID
+        return ROOT_CATEGORY_ID + 1 + (category_id % self.branches)
+
+    def category_of(self, product_id: int) -> int:
+        return self.leaves[(product_id - FIRST_PRODUCT_ID) % len(self.leaves)]
+
+    def category_ids(self) -> list[int]:
+        branches = list(range(ROOT_CATEGORY_ID + 1, ROOT_CATEGORY_ID + self.branches + 1))
+        return [ROOT_CATEGORY_ID] + branches + self.leaves
+
+    def product_ids_in(self, category_id: int) -> list[int]:
+        if not self._listings:
+            # built once, every listing request is then a slice
+            for product_id in range(FIRST_PRODUCT_ID, FIRST_PRODUCT_ID + self.products):
+                category_id_ = self.category_of(product_id)
+                while category_id_:
+                    self._listings.setdefault(category_id_, []).append(product_id)
+                    category_id_ = self.parent_of(category_id_)
+        return self._listings.get(category_id, [])
+
+    def category(self, category_id: int) -> dict:
+        parent_id = self.parent_of(category_id)
+        return {
+            "id": category_id,
+            "title": f"Category {category_id}",
+            "icon": None,
+            "adult": False,
+            "parent": {"id": parent_id, "title": f"Category {parent_id}"} if parent_id else None,
+            "seo": {"header": None, "metaTag": None},
+        }
+
+    def category_tree(self) -> list[dict]:
+        return [
+            {"category": self.category(category_id), "total": len(self.product_ids_in(category_id))}
+            for category_id in self.category_ids()
+        ]
+
+    # products
+
+    def exists(self, product_id: int) -> bool:
+        return FIRST_PRODUCT_ID <= product_id < FIRST_PRODUCT_ID + self.products
+
+    def shop_id_of(self, product_id: int) -> int:
+        return FIRST_SHOP_ID + (product_id * 7919) % self.shops
+
+    def full_price(self, product_id: int) -> int:
+        return self._random("price", product_id).randint(10, 2_000) * 1000
+
+    def sell_price(self, product_id: int) -> int:
+        if product_id not in self._prices:
+            rnd = self._random("card", product_id, self.day)
+            self._prices[product_id] = int(self.full_price(product_id) * rnd.uniform(0.7, 1))
+        return self._prices[product_id]
+
+    def catalog_card(self, product_id: int) -> dict:
+        rnd = self._random("card", product_id, self.day)
+        rnd.random()  # drawn by sell_price
+        return {
+            "productId": product_id,
+            "title": f"Product {product_id}",
+            "minFullPrice": self.full_price(product_id),
+            "minSellPrice": self.sell_price(product_id),
+            "ordersQuantity": rnd.randint(0, 5_000),
+            "feedbackQuantity": rnd.randint(0, 500),
+            "rating": round(rnd.uniform(3, 5), 1),
+            "characteristicValues": [],
+        }
+
+    def make_search(self, query_input: dict, facets: bool = False) -> dict:
+        """
+        makeSearch result of a category or offer listing. Like the real API, nothing is returned
+        past MAX_OFFSET, big listings have to be split. Supports price range filters, price and
+        date sort orders, and with `facets` the price range facet of the listing.
+        """
+        pagination = query_input.get("pagination") or {}
+        offset = int(pagination.get("offset", 0))
+        limit = int(pagination.get("limit", 0))
+        if query_input.get("offerCategoryId"):
+            ids = list(range(FIRST_PRODUCT_ID, FIRST_PRODUCT_ID + min(self.products, 300)))
+        else:
+            ids = self.product_ids_in(int(query_input.get("categoryId", ROOT_CATEGORY_ID)))
+        for filter_ in query_input.get("filters") or []:
+            if filter_.get("id") == PRICE_FILTER_ID and filter_.get("range"):
+                low, high = filter_["range"]["min"], filter_["range"]["max"]
+                ids = [product_id for product_id in ids if low <= self.sell_price(product_id) <= high]
+        sort = query_input.get("sort")
+        if sort in ("BY_PRICE_ASC", "BY_PRICE_DESC"):
+            ids = sorted(ids, key=self.sell_price, reverse=sort == "BY_PRICE_DESC")
+        elif sort == "BY_DATE_ADDED_DESC":
+            ids = ids[::-1]
+        page = ids[offset : offset + limit] if offset + limit <= MAX_OFFSET + 1 else []
+        result = {
+            "items": [{"catalogCard": self.catalog_card(product_id)} for product_id in page],
+            "total": len(ids),
+        }
+        if facets:
+            prices = [self.sell_price(product_id) for product_id in ids]
+            result["facets"] = [
+                {
+                    "filter": {"id": PRICE_FILTER_ID, "title": "Price", "type": "RANGE"},
+                    "buckets": [],
+                    "range": {"min": min(prices), "max": max(prices)} if prices else None,
+                }
+            ]
+        return result
+
+    def sku(self, product_id: int, index: int) -> dict:
+        rnd = self._random("sku", product_id, index, self.day)
+        full_price = self._random("sku-price", product_id, index).randint(10, 2_000) * 1000
+        purchase_price = int(full_price * rnd.choice([1, 1, 0.9, 0.8]))
+        return {
+            "id": FIRST_SKU_ID + (product_id - FIRST_PRODUCT_ID) * self.skus_per_product + index,
+            "availableAmount": rnd.randint(0, 300),
+            "barcode": f"{product_id}{index:03d}",
+            "characteristics": [{"charIndex": 0, "valueIndex": index % 3}],
+            "charityProfit": 0,
+            "discountBadge": None
+            if purchase_price == full_price
+            else {"badgeId": FIRST_BADGE_ID + 1, "text": "Discount", "backgroundColor": "#f00", "textColor": "#fff"},
+            "fullPrice": full_price,
+            "purchasePrice": purchase_price,
+            "vat": {"vatAmount": 0, "price": purchase_price, "vatRate": 12},
+            "videoUrl": None,
+            "productOptionDtos": [{"paymentPerMonth": purchase_price // 12}],
+        }
+
+    def product_detail(self, product_id: int) -> dict:
+        rnd = self._random("product", product_id, self.day)
+        category_id = self.category_of(product_id)
+        parent_id = self.parent_of(category_id)
+        return {
+            "id": product_id,
+            "title": f"Product {product_id}",
+            "description": f"<p>Description of product {product_id}</p>",
+            "category": {
+                "id": category_id,
+                "title": f"Category {category_id}",
+                "productAmount": len(self.leaves) and self.products // len(self.leaves),
+                "parent": {"id": parent_id} if parent_id else None,
+            },
+            "seller": self.shop(self.shop_id_of(product_id)),
+            "adultCategory": False,
+            "bonusProduct": False,
+            "isEco": False,
+            "isPerishable": False,
+            "volumeDiscount": None,
+            "video": None,
+            "attributes": [f"Attribute {i}" for i in range(3)],
+            "characteristics": [
+                {
+                    "id": 1,
+                    "title": "Color",
+                    "values": [
+                        {"id": i, "title": title, "value": title} for i, title in enumerate(("Red", "Green", "Blue"))
+                    ],
+                }
+            ],
+            "comments": [],
+            "badges": [
+                {
+                    "id": FIRST_BADGE_ID,
+                    "text": "Original",
+                    "type": "TEXT",
+                    "link": None,
+                    "textColor": "#000",
+                    "backgroundColor": "#fff",
+                    "description": None,
+                }
+            ]
+            if product_id % 5 == 0
+            else [],
+            "photos": [
+                {"photo": {"800": {"high": f"https://images.example/{product_id}/{i}.jpg", "low": None}}}
+                for i in range(3)
+            ],
+            "ordersAmount": self._random("orders", product_id).randint(0, 5_000) + self.day * rnd.randint(0, 20),
+            "reviewsAmount": rnd.randint(0, 500),
+            "rating": round(rnd.uniform(3, 5), 1),
+            "totalAvailableAmount": rnd.randint(0, 1_000),
+            "skuList": [self.sku(product_id, index) for index in range(self.skus_per_product)],
+        }
+
+    # reviews
+
+    def review_count(self, product_id: int) -> int:
+        return self._random("reviews", product_id).randint(0, 40) + self.day * (product_id % 3)
+
+    def reviews(self, product_id: int, amount: int, page: int) -> list[dict]:
+        """
+        A page of the product's reviews, newest first. Review i was published i hours after the first one.
+        """
+        count = self.review_count(product_id)
+        newest = count - 1 - page * amount
+        result = []
+        for index in range(newest, max(newest - amount, -1), -1):
+            rnd = self._random("review", product_id, index)
+            published = 1_690_000_000_000 + index * 3_600_000
+            result.append(
+                {
+                    "reviewId": product_id * 1_000 + index,
+                    "productId": product_id,
+                    "date": published,
+                    "edited": False,
+                    "customer": f"Customer {rnd.randint(1, 10_000)}",
+                    "reply": {
+                        "id": product_id * 1_000 + index,
+                        "date": published + 600_000,
+                        "edited": False,
+                        "content": "Thank you!",
+                        "shop": f"Shop {self.shop_id_of(product_id)}",
+                        "photos": [],
+                    }
+                    if index % 4 == 0
+                    else None,
+                    "rating": rnd.randint(1, 5),
+                    "characteristics": [{"characteristic": "Color", "characteristicValue": "Red"}],
+                    "content": f"Review {index} of product {product_id}",
+                    "photos": [],
+                    "status": "PUBLISHED",
+                    "isAnonymous": rnd.random() < 0.1,
+                    "amountFeedbackLike": rnd.randint(0, 20),
+                    "amountFeedbackDislike": rnd.randint(0, 5),
+                }
+            )
+        return result
+
+    # shops
+
+    def shop_link(self, shop_id: int) -> str:
+        return f"shop-{shop_id}"
+
+    def shop(self, shop_id: int) -> dict:
+        rnd = self._random("shop", shop_id, self.day)
+        return {
+            "id": shop_id,
+            "title": f"Shop {shop_id}",
+            "link": self.shop_link(shop_id),
+            "avatar": None,
+            "banner": None,
+            "description": f"Shop {shop_id}",
+            "hasCharityProducts": False,
+            "official": shop_id % 10 == 0,
+            "info": {},
+            "registrationDate": 1_600_000_000_000 + shop_id * 1000,
+            "sellerAccountId": shop_id,
+            "totalProducts": self.products // self.shops,
+            "orders": self._random("shop-orders", shop_id).randint(0, 100_000) + self.day * rnd.randint(0, 200),
+            "reviews": rnd.randint(0, 10_000),
+            "rating": round(rnd.uniform(3, 5), 1),
+        }
+
+    def shop_by_link(self, link: str) -> dict | None:
+        try:
+            shop_id = int(link.removeprefix("shop-"))
+        except ValueError:
+            return None
+        if not FIRST_SHOP_ID <= shop_id < FIRST_SHOP_ID + self.shops:
+            return None
+        return self.shop(shop_id)
+
+    # main page
+
+    def main_content(self) -> list[dict]:
+        return [
+            {
+                "__typename": "ExtendableOffer",
+                "title": "Offer of the day",
+                "description": "Synthetic offer",
+                "category": {"id": OFFER_CATEGORY_ID, "title": "Offer of the day"},
+            }
+        ]
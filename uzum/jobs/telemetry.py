@@ -0,0 +1,243 @@
+import bisect
+import os
+import threading
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from billiard.process import current_process
+
+# upper bounds (seconds) of the request latency histogram
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 60, float("inf"))
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.status_codes = Counter()
+        self.errors = Counter()  # exception class -> count
+        self.retries = Counter()  # reason -> count
+        self.failed = 0  # items given up on
+
+    def copy(self) -> "EndpointMetrics":
+        other = EndpointMetrics()
+        other.requests = self.requests
+        other.bytes = self.bytes
+        other.latency_sum = self.latency_sum
+        other.latency_buckets = list(self.latency_buckets)
+        other.status_codes = Counter(self.status_codes)
+        other.errors = Counter(self.errors)
+        other.retries = Counter(self.retries)
+        other.failed = self.failed
+        return other
+
+    def __sub__(self, other: "EndpointMetrics") -> "EndpointMetrics":
+        diff = EndpointMetrics()
+        diff.requests = self.requests - other.requests
+        diff.bytes = self.bytes - other.bytes
+        diff.latency_sum = self.latency_sum - other.latency_sum
+        diff.latency_buckets = [a - b for a, b in zip(self.latency_buckets, other.latency_buckets)]
+        diff.status_codes = self.status_codes - other.status_codes
+        diff.errors = self.errors - other.errors
+        diff.retries = self.retries - other.retries
+        diff.failed = self.failed - other.failed
+        return diff
+
+    def percentile(self, q: float) -> float | None:
+        """
+        Upper bound of the histogram bucket holding the q-th quantile of latencies.
+        """
+        total = sum(self.latency_buckets)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.latency_buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return LATENCY_BUCKETS[-1]
+
+    def summary(self, duration: float) -> dict:
+        return {
+            "requests": self.requests,
+            "requests_per_sec": round(self.requests / duration, 2) if duration else None,
+            "bytes": self.bytes,
+            "latency_avg": round(self.latency_sum / self.requests, 3) if self.requests else None,
+            "latency_p50": self.percentile(0.5),
+            "latency_p95": self.percentile(0.95),
+            "latency_p99": self.percentile(0.99),
+            "status_codes": {str(code): count for code, count in self.status_codes.items()},
+            "errors": dict(self.errors),
+            "retries": {str(reason): count for reason, count in self.retries.items()},
+            "failed": self.failed,
+        }
+
+
+class CrawlerMetrics:
+    """
+    Process-wide crawler metrics per endpoint: request counts, bytes, latency histogram,
+    status codes, network errors, retries, plus gauges such as queue depths and concurrency limits.
+
+    Counters only grow, so they can be scraped in Prometheus format (render_prometheus) and a run
+    summary is the difference of two snapshots taken at its start and end.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: dict[str, EndpointMetrics] = defaultdict(EndpointMetrics)
+        self._gauges: dict[tuple[str, str], float] = {}
+
+    def observe_response(self, endpoint: str, status_code: int, latency: float, size: int):
+        with self._lock:
+            metrics = self._endpoints[endpoint]
+            metrics.requests += 1
+            metrics.bytes += size
+            metrics.latency_sum += latency
+            metrics.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+            metrics.status_codes[status_code] += 1
+
+    def observe_error(self, endpoint: str, error: Exception, latency: float):
+        with self._lock:
+            metrics = self._endpoints[endpoint]
+            metrics.requests += 1
+            metrics.latency_sum += latency
+            metrics.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+            metrics.errors[type(error).__name__] += 1
+
+    def observe_retry(self, endpoint: str, reason):
+        with self._lock:
+            self._endpoints[endpoint].retries[reason if isinstance(reason, int) else type(reason).__name__] += 1
+
+    def observe_failed(self, endpoint: str):
+        with self._lock:
+            self._endpoints[endpoint].failed += 1
+
+    def set_gauge(self, name: str, label: str, value: float):
+        self._gauges[(name, label)] = value
+
+    def snapshot(self) -> dict[str, EndpointMetrics]:
+        with self._lock:
+            return {endpoint: metrics.copy() for endpoint, metrics in self._endpoints.items()}
+
+    def summary(self, since: dict[str, EndpointMetrics], duration: float) -> dict:
+        """
+        Per-endpoint summary of everything observed after the `since` snapshot.
+        """
+        result = {}
+        for endpoint, metrics in self.snapshot().items():
+            diff = metrics - since.get(endpoint, EndpointMetrics())
+            if diff.requests or diff.failed:
+                result[endpoint] = diff.summary(duration)
+        return result
+
+    def render_prometheus(self) -> str:
+        endpoints = sorted(self.snapshot().items())
+        lines = []
+
+        def family(name: str, kind: str, samples):
+            lines.append(f"# TYPE crawler_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"crawler_{name}{{{labels}}} {value}")
+
+        def histogram(metrics: EndpointMetrics, label: str):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, metrics.latency_buckets):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else bound
+                lines.append(f'crawler_request_latency_seconds_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f"crawler_request_latency_seconds_sum{{{label}}} {metrics.latency_sum:.3f}")
+            lines.append(f"crawler_request_latency_seconds_count{{{label}}} {metrics.requests}")
+
+        family("requests_total", "counter", ((f'endpoint="{e}"', m.requests) for e, m in endpoints))
+        family("response_bytes_total", "counter", ((f'endpoint="{e}"', m.bytes) for e, m in endpoints))
+        lines.append("# TYPE crawler_request_latency_seconds histogram")
+        for endpoint, metrics in endpoints:
+            histogram(metrics, f'endpoint="{endpoint}"')
+        family(
+            "responses_total",
+            "counter",
+            (
+                (f'endpoint="{e}",code="{code}"', count)
+                for e, m in endpoints
+                for code, count in sorted(m.status_codes.items())
+            ),
+        )
+        family(
+            "errors_total",
+            "counter",
+            (
+                (f'endpoint="{e}",error="{error}"', count)
+                for e, m in endpoints
+                for error, count in sorted(m.errors.items())
+            ),
+        )
+        family(
+            "retries_total",
+            "counter",
+            (
+                (f'endpoint="{e}",reason="{reason}"', count)
+                for e, m in endpoints
+                for reason, count in sorted(m.retries.items(), key=str)
+            ),
+        )
+        family("failed_total", "counter", ((f'endpoint="{e}"', m.failed) for e, m in endpoints))
+        for gauge in sorted({name for name, _ in self._gauges}):
+            family(
+                gauge,
+                "gauge",
+                ((f'name="{label}"', value) for (name, label), value in sorted(self._gauges.items()) if name == gauge),
+            )
+        return "\n".join(lines) + "\n"
+
+
+METRICS = CrawlerMetrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = METRICS.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: ThreadingHTTPServer = None
+_server_lock = threading.Lock()
+
+
+def worker_metrics_port(base_port: int) -> int:
+    """
+    Port the metrics of this process are served on: `base_port` plus the pool index of a prefork celery worker
+    process, so every process of a worker exports its own metrics. Other processes use `base_port`.
+    """
+    return base_port + (getattr(current_process(), "index", None) or 0)
+
+
+def start_metrics_server(port: int):
+    """
+    Serve METRICS on http://0.0.0.0:<port>/metrics from a daemon thread of the crawling process.
+    Safe to call more than once, only the first call starts a server.
+    """
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+        except OSError as e:
+            # the metrics of this process are not exported, e.g. another process on this host took the port
+            print(f"Error in start_metrics_server: port {port} of process {os.getpid()} - {e}")
+            return
+        threading.Thread(target=_server.serve_forever, name="crawler-metrics", daemon=True).start()
+        print(f"Crawler metrics of process {os.getpid()} served on port {port}")
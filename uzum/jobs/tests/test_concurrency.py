@@ -0,0 +1,65 @@
+import asyncio
+
+import httpx
+
+from uzum.jobs.concurrency import AdaptiveConcurrency, run_with_concurrency
+
+
+def test_limit_grows_after_a_window_of_healthy_responses():
+    controller = AdaptiveConcurrency(initial=4, max_limit=8, latency_target=1.0)
+    for _ in range(3):
+        controller.record(httpx.Response(200), 0.1)
+    assert controller.limit == 4
+    controller.record(httpx.Response(200), 0.1)
+    assert controller.limit == 5
+
+
+def test_slow_responses_hold_the_limit():
+    controller = AdaptiveConcurrency(initial=2, latency_target=1.0)
+    for _ in range(10):
+        controller.record(httpx.Response(200), 5.0)
+    assert controller.limit == 2
+    assert controller.successes == 10
+
+
+def test_limit_never_exceeds_max():
+    controller = AdaptiveConcurrency(initial=2, max_limit=3, latency_target=1.0)
+    for _ in range(20):
+        controller.record(httpx.Response(200), 0.1)
+    assert controller.limit == 3
+
+
+def test_throttling_cuts_the_limit_once_per_window():
+    controller = AdaptiveConcurrency(initial=8, max_limit=8, backoff_factor=0.5)
+    for _ in range(8):
+        controller.record(httpx.Response(200), 0.1)
+    # a burst of failures from requests already in flight
+    for _ in range(4):
+        controller.record(httpx.Response(429), 0.1)
+    assert controller.limit == 4
+    assert controller.failures == 4
+
+
+def test_network_errors_count_as_throttling():
+    controller = AdaptiveConcurrency(initial=2, min_limit=1, backoff_factor=0.5)
+    controller.record(None, 0.1)
+    controller.record(None, 0.1)
+    assert controller.failures == 2
+    assert controller.limit == 1
+
+
+def test_run_with_concurrency_passes_every_result():
+    controller = AdaptiveConcurrency(initial=2, max_limit=4)
+    results = {}
+
+    async def request(item):
+        if item == 3:
+            raise ValueError("boom")
+        return httpx.Response(200)
+
+    asyncio.run(run_with_concurrency(range(6), request, results.__setitem__, controller))
+
+    assert sorted(results) == list(range(6))
+    assert isinstance(results[3], ValueError)
+    assert results[0].status_code == 200
+    assert controller.in_flight == 0
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from uzum.jobs.constants import LISTING_SORTS
+from uzum.jobs.product import fetch_ids
+from uzum.jobs.product.fetch_ids import slice_listing
+
+PRICE_FILTER_ID = "price"
+
+
+@pytest.fixture
+def prices(monkeypatch):
+    """
+    A fake category listing: prices of its products, counted per price range like makeSearch does.
+    """
+    listing = []
+
+    async def count_listing(category_id, filters, pool, is_ru=False):
+        if not filters:
+            return len(listing), (PRICE_FILTER_ID, min(listing), max(listing)) if listing else None
+        price_range = filters[0]["range"]
+        return sum(price_range["min"] <= price <= price_range["max"] for price in listing), None
+
+    monkeypatch.setattr(fetch_ids, "count_listing", count_listing)
+    monkeypatch.setattr(fetch_ids, "LISTING_CAP", 3)
+    return listing
+
+
+def slice_ranges(slices: list[dict]) -> list[tuple[int, int]]:
+    return [(s["filters"][0]["range"]["min"], s["filters"][0]["range"]["max"]) for s in slices]
+
+
+def test_small_listing_is_not_sliced(prices):
+    prices.extend([5, 10])
+
+    assert asyncio.run(slice_listing(1, pool=None)) == [{"filters": [], "sort": None, "total": 2}]
+
+
+def test_slices_are_disjoint_and_cover_every_product(prices):
+    prices.extend(list(range(1, 31)) + [800, 900, 1000, 5000])
+
+    slices = asyncio.run(slice_listing(1, pool=None))
+
+    assert all(s["total"] <= 3 for s in slices)
+    assert sum(s["total"] for s in slices) == len(prices)
+    ranges = slice_ranges(slices)
+    assert ranges == sorted(ranges)
+    for (_, high), (low, _) in zip(ranges, ranges[1:]):
+        assert high < low
+    assert all(any(low <= price <= high for low, high in ranges) for price in prices)
+
+
+def test_empty_price_ranges_are_dropped(prices):
+    prices.extend([1, 1, 1, 1000, 1000, 1000])
+
+    slices = asyncio.run(slice_listing(1, pool=None))
+
+    assert all(s["total"] > 0 for s in slices)
+    assert sum(s["total"] for s in slices) == 6
+
+
+def test_single_price_over_the_cap_is_fetched_in_every_order(prices):
+    prices.extend([7] * 5 + [100])
+
+    slices = asyncio.run(slice_listing(1, pool=None))
+
+    crowded = [s for s in slices if slice_ranges([s]) == [(7, 7)]]
+    assert [s["sort"] for s in crowded] == list(LISTING_SORTS)
+
+
+def test_listing_without_price_facet_is_fetched_in_every_order(prices, monkeypatch):
+    async def count_listing(category_id, filters, pool, is_ru=False):
+        return 10, None
+
+    monkeypatch.setattr(fetch_ids, "count_listing", count_listing)
+
+    slices = asyncio.run(slice_listing(1, pool=None))
+
+    assert [s["sort"] for s in slices] == list(LISTING_SORTS)
+    assert all(s["filters"] == [] for s in slices)
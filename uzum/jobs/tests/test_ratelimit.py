@@ -0,0 +1,59 @@
+import httpx
+import pytest
+
+from uzum.jobs import ratelimit
+from uzum.jobs.constants import RATE_LIMIT_PAUSE
+from uzum.jobs.ratelimit import TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_burst_goes_out_without_waiting(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket._reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+
+
+def test_requests_over_the_burst_are_spaced_at_the_rate(clock):
+    bucket = TokenBucket(rate=2, burst=1)
+    assert bucket._reserve() == 0.0
+    assert bucket._reserve() == pytest.approx(0.5)
+    assert bucket._reserve() == pytest.approx(1.0)
+
+
+def test_tokens_refill_up_to_the_burst(clock):
+    bucket = TokenBucket(rate=2, burst=2)
+    bucket._reserve()
+    bucket._reserve()
+    clock[0] += 60
+    assert [bucket._reserve() for _ in range(2)] == [0.0, 0.0]
+    assert bucket._reserve() == pytest.approx(0.5)
+
+
+def test_pause_holds_back_requests(clock):
+    bucket = TokenBucket(rate=10, burst=10)
+    bucket.pause(5)
+    assert bucket._reserve() == pytest.approx(5)
+    # a shorter pause does not cut the running one
+    bucket.pause(1)
+    assert bucket._reserve() == pytest.approx(5)
+    clock[0] += 5
+    assert bucket._reserve() == 0.0
+
+
+def test_observe_pauses_on_429_only(clock):
+    bucket = TokenBucket(rate=10, burst=10)
+    bucket.observe(httpx.Response(503))
+    assert bucket._reserve() == 0.0
+    bucket.observe(httpx.Response(429, headers={"retry-after": "3"}))
+    assert bucket._reserve() == pytest.approx(3)
+
+
+def test_observe_falls_back_to_the_default_pause(clock):
+    bucket = TokenBucket(rate=10, burst=10)
+    bucket.observe(httpx.Response(429, headers={"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}))
+    assert bucket._reserve() == pytest.approx(RATE_LIMIT_PAUSE)
@@ -0,0 +1,97 @@
+import asyncio
+
+import httpx
+
+from uzum.jobs import retry
+from uzum.jobs.concurrency import AdaptiveConcurrency
+from uzum.jobs.constants import RETRY_MAX_DELAY
+from uzum.jobs.retry import RetryQueue, retry_delay, run_with_retries
+
+
+def test_terminal_status_codes_are_not_retried():
+    assert retry_delay(0, 404) is None
+    assert retry_delay(3, 400) is None
+
+
+def test_retry_delay_is_capped():
+    for attempt in range(20):
+        assert 0 <= retry_delay(attempt, 503) <= RETRY_MAX_DELAY
+        assert 0 <= retry_delay(attempt, 429) <= RETRY_MAX_DELAY
+        assert 0 <= retry_delay(attempt, httpx.ConnectError("down")) <= RETRY_MAX_DELAY
+
+
+def test_queue_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(retry, "retry_delay", lambda attempt, reason: 0)
+
+    async def drain():
+        queue = RetryQueue(["a"], max_attempts=3)
+        attempts = []
+        while (entry := await queue.get()) is not None:
+            item, attempt = entry
+            attempts.append(attempt)
+            queue.retry(item, attempt, 503)
+        return queue, attempts
+
+    queue, attempts = asyncio.run(drain())
+
+    assert attempts == [0, 1, 2]
+    assert queue.failed == [("a", 503)]
+    assert queue.failed_attempts == {"a": 3}
+    assert queue.retries == 2
+    assert queue.reasons[503] == 3
+    assert len(queue) == 0
+
+
+def test_terminal_failure_is_not_put_back():
+    async def drain():
+        queue = RetryQueue(["a", "b"])
+        while (entry := await queue.get()) is not None:
+            item, attempt = entry
+            if item == "a":
+                queue.retry(item, attempt, 404)
+            else:
+                queue.done(item)
+        return queue
+
+    queue = asyncio.run(drain())
+
+    assert queue.failed == [("a", 404)]
+    assert queue.retries == 0
+
+
+def test_fresh_items_come_before_retries(monkeypatch):
+    monkeypatch.setattr(retry, "retry_delay", lambda attempt, reason: 0)
+
+    async def drain():
+        queue = RetryQueue(["a", "b"])
+        order = []
+        while (entry := await queue.get()) is not None:
+            item, attempt = entry
+            order.append((item, attempt))
+            if item == "a" and attempt == 0:
+                queue.retry(item, attempt, 503)
+                queue.put("c")
+            else:
+                queue.done(item)
+        return order
+
+    assert asyncio.run(drain()) == [("a", 0), ("b", 0), ("c", 0), ("a", 1)]
+
+
+def test_run_with_retries_retries_until_success(monkeypatch):
+    monkeypatch.setattr(retry, "retry_delay", lambda attempt, reason: 0)
+    calls = {}
+
+    async def request(item):
+        calls[item] = calls.get(item, 0) + 1
+        return httpx.Response(200 if calls[item] > 1 else 503)
+
+    def handle(item, response):
+        return None if response.status_code == 200 else response.status_code
+
+    queue = RetryQueue([1, 2, 3])
+    asyncio.run(run_with_retries(queue, request, handle, AdaptiveConcurrency(initial=2, max_limit=2)))
+
+    assert calls == {1: 2, 2: 2, 3: 2}
+    assert queue.failed == []
+    assert queue.retries == 3
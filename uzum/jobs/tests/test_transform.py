@@ -0,0 +1,147 @@
+import copy
+import json
+
+import pytest
+
+from uzum.jobs.product.transform import (PRODUCT_COLUMNS, PRODUCT_TEXT_FIELDS,
+                                         SKU_COLUMNS, fingerprint,
+                                         product_fingerprint, text_digest,
+                                         transform_product, transform_sku)
+
+
+@pytest.fixture
+def product_api() -> dict:
+    return {
+        "id": 1,
+        "category": {"id": 10, "title": "Phones", "productAmount": 5, "parent": {"id": 2}},
+        "seller": {"id": 20, "title": "Shop", "link": "shop"},
+        "badges": [],
+        "title": "Phone",
+        "description": "A phone",
+        "adultCategory": False,
+        "bonusProduct": 0,
+        "isEco": False,
+        "isPerishable": False,
+        "volumeDiscount": None,
+        "video": None,
+        "attributes": ["Fast"],
+        "characteristics": [{"title": "Color", "values": [{"title": "Red"}, {"title": "Blue"}]}],
+        "comments": [],
+        "photos": [{"photo": {"800": {"high": "https://images.uzum.uz/1.jpg"}}}],
+        "ordersAmount": 12,
+        "reviewsAmount": 3,
+        "rating": 4.5,
+        "totalAvailableAmount": 7,
+        "skuList": [
+            {
+                "id": 100,
+                "barcode": 123,
+                "charityProfit": 0,
+                "productOptionDtos": [{"paymentPerMonth": 1000}],
+                "vat": {"vatAmount": 10, "price": 90, "vatRate": 12},
+                "videoUrl": None,
+                "characteristics": [{"charIndex": 0, "valueIndex": 1}],
+                "discountBadge": None,
+                "availableAmount": 7,
+                "fullPrice": 12000,
+                "purchasePrice": 10000,
+            }
+        ],
+    }
+
+
+def stored_product(row: dict) -> dict:
+    """
+    The lookup load_batch_lookups returns for a stored product row.
+    """
+    current = {column: row[column] for column in PRODUCT_COLUMNS}
+    current.update({f"{field}_md5": text_digest(row[field]) for field in PRODUCT_TEXT_FIELDS})
+    return current
+
+
+def test_fingerprint_ignores_key_order():
+    assert fingerprint({"a": 1, "b": [1, 2]}) == fingerprint({"b": [1, 2], "a": 1})
+    assert fingerprint({"a": 1}) != fingerprint({"a": 2})
+
+
+def test_product_fingerprint_ignores_sales(product_api):
+    sold = copy.deepcopy(product_api)
+    sold.update(ordersAmount=100, rating=3.0, totalAvailableAmount=0)
+    assert product_fingerprint(sold) == product_fingerprint(product_api)
+
+    renamed = copy.deepcopy(product_api)
+    renamed["title"] = "Phone 2"
+    assert product_fingerprint(renamed) != product_fingerprint(product_api)
+
+
+def test_transform_new_product(product_api):
+    rows = transform_product(product_api)
+
+    product = rows["product"]
+    assert product["product_id"] == 1
+    assert product["category_id"] == 10
+    assert product["shop_id"] == 20
+    assert json.loads(product["photos"]) == ["https://images.uzum.uz/1.jpg"]
+    assert rows["product_changes"] is None
+    assert rows["category"]["parent_id"] == 2
+
+    [sku] = rows["skus"]
+    assert sku["sku"] == 100
+    assert sku["product_id"] == 1
+    assert sku["payment_per_month"] == 1000
+    assert json.loads(sku["characteristics"]) == [{"title": "Color", "value": "Blue"}]
+    assert rows["sku_changes"] == {}
+
+    assert rows["new_orders"] == 12
+    assert rows["analytics"]["average_purchase_price"] == 10000
+    assert rows["analytics"]["orders_money"] == pytest.approx(12 * 10000 / 1000)
+    assert rows["sku_analytics"][0]["sku_id"] == 100
+
+
+def test_transform_continues_orders_money(product_api):
+    rows = transform_product(product_api, current_analytic={"latest_orders_amount": 10, "latest_orders_money": 50})
+    assert rows["new_orders"] == 2
+    assert rows["analytics"]["orders_money"] == pytest.approx(50 + 2 * 10000 / 1000)
+
+
+def test_transform_unchanged_product_writes_analytics_only(product_api):
+    first = transform_product(product_api)
+    current_skus = {100: {column: first["skus"][0].get(column) for column in SKU_COLUMNS}}
+
+    rows = transform_product(product_api, stored_product(first["product"]), current_skus)
+
+    assert rows["product"] is None
+    assert rows["product_changes"] is None
+    assert rows["skus"] == []
+    assert rows["sku_changes"] == {}
+    assert len(rows["sku_analytics"]) == 1
+    assert rows["analytics"]["orders_amount"] == 12
+
+
+def test_transform_changed_product_returns_changed_columns(product_api):
+    current = stored_product(transform_product(product_api)["product"])
+    product_api["title"] = "Phone 2"
+    product_api["photos"].append({"photo": {"800": {"high": "https://images.uzum.uz/2.jpg"}}})
+
+    rows = transform_product(product_api, current)
+
+    assert rows["product"] is None
+    assert set(rows["product_changes"]) == {"title", "photos", "fingerprint"}
+    assert rows["product_changes"]["title"] == "Phone 2"
+
+
+def test_transform_sku_returns_changed_columns(product_api):
+    sku_api = product_api["skuList"][0]
+    characteristics_fp = fingerprint(product_api["characteristics"])
+    new, _ = transform_sku(sku_api, 1, product_api["characteristics"], None, characteristics_fp)
+    current = {column: new.get(column) for column in SKU_COLUMNS}
+
+    assert transform_sku(sku_api, 1, product_api["characteristics"], current, characteristics_fp) == (None, None)
+
+    sku_api["barcode"] = 456
+    sku_api["discountBadge"] = {"badgeId": 5, "text": "-10%"}
+    new, changes = transform_sku(sku_api, 1, product_api["characteristics"], current, characteristics_fp)
+
+    assert new is None
+    assert set(changes) == {"barcode", "discount_badge_id", "discount_badge", "fingerprint"}
+    assert changes["discount_badge"] == {"badgeId": 5, "text": "-10%"}
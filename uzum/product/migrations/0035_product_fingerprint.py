@@ -0,0 +1,18 @@
+# Generated by Django 4.1.9 on 2026-10-17 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0034_productanalytics_positions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.9 on 2026-10-17 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0035_product_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='fingerprint_ru',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
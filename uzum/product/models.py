@@ -40,6 +40,8 @@ class Product(models.Model):
     photos = models.TextField(null=True, blank=True)  # json.dumps(photos)
     characteristics = models.TextField(null=True, blank=True)  # json.dumps(characteristics)
     # characteristics_ru = models.TextField(null=True, blank=True)  # json.dumps(characteristics_ru)
+    fingerprint = models.CharField(max_length=32, null=True, blank=True)  # hash of the static api payload
+    fingerprint_ru = models.CharField(max_length=32, null=True, blank=True)  # fingerprint title_ru was fetched for
 
     def __str__(self) -> str:
         return f"{self.product_id} - {self.title}"
@@ -37,6 +37,8 @@ from uzum.product.serializers import (
     CurrentProductSerializer, ExtendedProductAnalyticsExtensionSerializer,
     ExtendedProductAnalyticsSerializer, ExtendedProductSerializer,
     ProductSerializer)
+from uzum.review.models import Review
+from uzum.review.serializers import ReviewSerializer
 from uzum.sku.models import SkuAnalytics
 from uzum.users.models import User
 from uzum.utils.general import (Tariffs, authorize_Base_tariff,
@@ -1001,34 +1003,16 @@ class ProductReviews(APIView):
     pagination_class = PageNumberPagination
     serializer_class = ExtendedProductSerializer
 
-    @staticmethod
-    def fetch_reviews_from_uzum(product_id: str):
-        try:
-            response = requests.get(
-                f"https://api.uzum.uz/api/product/{product_id}/reviews?amount=9999&page=0",
-                headers={
-                    **PRODUCT_HEADER,
-                    "User-Agent": get_random_user_agent(),
-                    "x-iid": generateUUID(),
-                },
-                timeout=60,  # 60 seconds
-            )
-
-            if response.status_code == 200:
-                # extract product ids
-                return response.json()["payload"]
-            else:
-                return []
-
-        except Exception as e:
-            traceback.print_exc()
-            return None
-
     @extend_schema(tags=["Product"])
     def get(self, request: Request, product_id: str):
         try:
-            reviews = ProductReviews.fetch_reviews_from_uzum(product_id)
-            #         reviews = ProductReviews.fetch_reviews_from_uzum(product_id)
+            # stored nightly by jobs.review, newest first like the marketplace
+            reviews = Review.objects.filter(product_id=product_id).select_related("reply").order_by("-publish_date")
+            paginator = self.pagination_class()
+
+            page = paginator.paginate_queryset(reviews, request, view=self)
+
+            serializer = ReviewSerializer(page, many=True)
 
             #         if not reviews:
             #             return Response({"error": "No reviews found"}, status=status.HTTP_404_NOT_FOUND)
@@ -1057,7 +1041,7 @@ class ProductReviews(APIView):
             #         # get top 10 words
             #         top_words = word_count.most_common(10)
 
-            return Response(reviews, status=status.HTTP_200_OK)
+            return paginator.get_paginated_response(serializer.data)
 
         except Product.DoesNotExist:
             return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
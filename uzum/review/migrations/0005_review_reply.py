@@ -0,0 +1,33 @@
+# Generated by Django 4.1.9 on 2026-10-17 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("review", "0004_popularseaches_words_ru"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="reply",
+            name="published_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="reply",
+            name="review",
+            field=models.OneToOneField(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="reply",
+                to="review.review",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(fields=["product", "-publish_date"], name="review_product_publish_idx"),
+        ),
+    ]
@@ -21,15 +21,20 @@ class Review(models.Model):
     status = models.CharField(max_length=1024, null=True, blank=True)
     photos = models.TextField(null=True, blank=True)
 
+    class Meta:
+        # newest reviews of a product, also the high-water mark of the review crawler
+        indexes = [models.Index(fields=["product", "-publish_date"], name="review_product_publish_idx")]
+
 
 class Reply(models.Model):
-    published_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     content = models.TextField()
     edited = models.BooleanField(default=False)
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     photos = models.TextField(null=True, blank=True)
     shop = models.ForeignKey("shop.Shop", on_delete=models.DO_NOTHING)
+    review = models.OneToOneField(Review, on_delete=models.CASCADE, null=True, blank=True, related_name="reply")
 
 
 class PopularSeaches(models.Model):
@@ -1,9 +1,76 @@
+import json
+
 from rest_framework import serializers
 
-from uzum.review.models import PopularSeaches
+from uzum.review.models import PopularSeaches, Reply, Review
 
 
 class PopularSearchesSerializer(serializers.ModelSerializer):
     class Meta:
         model = PopularSeaches
         fields = ["words", "requests_count", "created_at", "date_pretty"]
+
+
+class EpochMillisecondsField(serializers.Field):
+    """
+    Datetime as a unix timestamp in milliseconds, the date format of the marketplace's review payload.
+    """
+
+    def to_representation(self, value):
+        return round(value.timestamp() * 1000)
+
+
+class ReplySerializer(serializers.ModelSerializer):
+    date = EpochMillisecondsField(source="published_at")
+    photos = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Reply
+        fields = ["date", "edited", "content", "photos"]
+
+    def get_photos(self, obj: Reply):
+        return json.loads(obj.photos) if obj.photos else []
+
+
+class ReviewSerializer(serializers.ModelSerializer):
+    """
+    Stored review under the keys of the marketplace's review payload, which the product page reads.
+    """
+
+    date = EpochMillisecondsField(source="publish_date")
+    isAnonymous = serializers.BooleanField(source="is_anonymous")
+    amountFeedbackLike = serializers.IntegerField(source="amount_likes")
+    amountFeedbackDislike = serializers.IntegerField(source="amount_dislikes")
+    characteristics = serializers.SerializerMethodField()
+    photos = serializers.SerializerMethodField()
+    reply = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Review
+        fields = [
+            "reviewId",
+            "date",
+            "edited",
+            "customer",
+            "reply",
+            "rating",
+            "characteristics",
+            "content",
+            "photos",
+            "status",
+            "isAnonymous",
+            "amountFeedbackLike",
+            "amountFeedbackDislike",
+        ]
+
+    def get_characteristics(self, obj: Review):
+        return json.loads(obj.characteristics) if obj.characteristics else []
+
+    def get_photos(self, obj: Review):
+        return json.loads(obj.photos) if obj.photos else []
+
+    def get_reply(self, obj: Review):
+        try:
+            return ReplySerializer(obj.reply).data
+        except Reply.DoesNotExist:
+            return None
@@ -0,0 +1,13 @@
+from config import celery_app
+from uzum.jobs.review.main import update_product_reviews
+from uzum.utils.general import get_today_pretty
+
+
+@celery_app.task(
+    name="update_product_reviews",
+)
+def update_product_reviews_task(args=None, **kwargs):
+    """
+    Store the reviews published since the last run, after the nightly analytics have today's review counts.
+    """
+    return update_product_reviews(get_today_pretty())
@@ -0,0 +1,34 @@
+# Generated by Django 4.1.9 on 2026-10-17 19:05
+
+from django.db import migrations, models
+
+# all but the most recent row of a shop and day, as bulk_remove_duplicate_shop_analytics keeps it
+DUPLICATES = """
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY shop_id, date_pretty ORDER BY created_at DESC) AS position
+        FROM shop_shopanalytics
+        WHERE date_pretty IS NOT NULL
+    ) ranked
+    WHERE position > 1
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0023_alter_shopanalyticsrecent_table'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [
+                f"DELETE FROM shop_shopanalytics_categories WHERE shopanalytics_id IN ({DUPLICATES})",
+                f"DELETE FROM shop_shopanalytics WHERE id IN ({DUPLICATES})",
+            ],
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='shopanalytics',
+            constraint=models.UniqueConstraint(fields=('shop', 'date_pretty'), name='shop_analytics_unique_shop_date'),
+        ),
+    ]
@@ -73,6 +73,12 @@ class ShopAnalytics(models.Model):
     daily_orders = models.IntegerField(default=0)
     daily_revenue = models.FloatField(default=0)
 
+    class Meta:
+        constraints = [
+            # concurrent ingest chunks insert with ON CONFLICT DO NOTHING and rely on it to skip each other's rows
+            models.UniqueConstraint(fields=["shop", "date_pretty"], name="shop_analytics_unique_shop_date"),
+        ]
+
     def __str__(self):
         return f"{self.shop.title} - {self.total_products}"
 
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.9 on 2026-10-17 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sku', '0013_alter_skuanalytics_orders_amount_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sku',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
@@ -28,6 +28,7 @@ class Sku(models.Model):
     vat_rate = models.FloatField(default=0)
     video_url = models.TextField(null=True, blank=True)
     characteristics = models.TextField(null=True, blank=True)  # json.dumps(characteristics)
+    fingerprint = models.CharField(max_length=32, null=True, blank=True)  # hash of the static api payload
 
 
 class SkuAnalytics(models.Model):
@@ -0,0 +1,63 @@
+import csv
+import io
+
+from django.db import connection, models, transaction
+
+NULL = "\\N"
+
+
+def _csv_value(field: models.Field, value):
+    value = field.get_db_prep_save(value, connection)
+    if value is None:
+        return NULL
+    return value
+
+
+def copy_insert(model: type[models.Model], rows: list[dict], unique_on: tuple[str, ...] = None) -> int:
+    """
+    Bulk insert plain dict rows with PostgreSQL COPY instead of ORM bulk_create.
+
+    Rows are keyed by field attname (`product_id`, not `product`); missing fields get the model default.
+    Rows are streamed as CSV into a temporary staging table and merged into the real table with
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING. If `unique_on` is given, rows whose key already exists
+    in the table are skipped as well, so re-running the same load is idempotent even without a
+    unique constraint on those columns.
+
+    Returns the number of inserted rows.
+    """
+    if not rows:
+        return 0
+
+    fields = [field for field in model._meta.concrete_fields]
+    columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+    table = model._meta.db_table
+    staging = f"{table}_staging"
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(
+            [
+                _csv_value(field, row[field.attname] if field.attname in row else field.get_default())
+                for field in fields
+            ]
+        )
+    buffer.seek(0)
+
+    where = ""
+    if unique_on:
+        quote = connection.ops.quote_name
+        match = " AND ".join(f"t.{quote(column)} = s.{quote(column)}" for column in unique_on)
+        where = f"WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {match})"
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+            cursor.execute(f"CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+            cursor.copy_expert(f"COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{NULL}')", buffer)
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} s {where} ON CONFLICT DO NOTHING"
+            )
+            inserted = cursor.rowcount
+            cursor.execute(f"DROP TABLE {staging}")
+    return inserted